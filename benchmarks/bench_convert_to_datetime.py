@@ -0,0 +1,54 @@
+"""Compares the Twitter timestamp parsers against datetime.strptime.
+
+    python benchmarks/bench_convert_to_datetime.py
+"""
+import datetime
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashtag_monitor.apps.monitor import twitter_utils as twt_utl  # noqa: E402
+
+
+def main(page_size=100, pages=200):
+    rnd = random.Random(0)
+    start = datetime.datetime(2019, 12, 1, tzinfo=datetime.timezone.utc)
+    tweets = [(start + datetime.timedelta(seconds=rnd.randrange(86400 * 30))).strftime(twt_utl.TWITTER_TIME_FORMAT)
+              for _ in range(page_size * pages)]
+    # Users repeat: draw authors from a small pool, as a busy hashtag does.
+    users = [(start - datetime.timedelta(days=rnd.randrange(3000))).strftime(twt_utl.TWITTER_TIME_FORMAT)
+             for _ in range(page_size * pages // 10)]
+    users = [rnd.choice(users) for _ in range(page_size * pages)]
+
+    def strptime():
+        for t in tweets:
+            datetime.datetime.strptime(t, twt_utl.TWITTER_TIME_FORMAT)
+
+    def fast():
+        for t in tweets:
+            twt_utl.convert_to_datetime(t)
+
+    def page():
+        for i in range(0, len(tweets), page_size):
+            twt_utl.convert_many_to_datetime(tweets[i:i + page_size])
+
+    def users_strptime():
+        for t in users:
+            datetime.datetime.strptime(t, twt_utl.TWITTER_TIME_FORMAT)
+
+    def users_cached():
+        for t in users:
+            twt_utl.convert_to_datetime_cached(t)
+
+    for name, fn in [('tweets strptime', strptime), ('tweets convert_to_datetime', fast),
+                     ('tweets convert_many_to_datetime', page), ('users strptime', users_strptime),
+                     ('users convert_to_datetime_cached', users_cached)]:
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{name:35s} {best * 1e6 / len(tweets):8.2f} us/timestamp")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Compares the ways to compute a hashtag reach on a 1M-tweet corpus.
+
+The corpus is generated in SQL: 100k authors with a skewed number of
+followers, 1M tweets on #Bench, and every third tweet also on #Other.
+
+    python benchmarks/bench_reach.py
+"""
+import time
+
+from common import setup_django, test_database
+
+
+def timed(label, call, repeat=5):
+    start = time.time()
+    for _ in range(repeat):
+        value = call()
+    print(f"{label:38s} {(time.time() - start) * 1000 / repeat:9.2f} ms  reach={value}")
+    return value
+
+
+def main(tweets=1000000, users=100000):
+    setup_django()
+    from django.db.models import Sum
+    from django.db.models.functions import Coalesce
+    from django.test.utils import override_settings
+    from hashtag_monitor.apps.monitor import models
+
+    with test_database() as connection:
+        models.Hashtag.objects.create(name="#Bench")
+        models.Hashtag.objects.create(name="#Other")
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO monitor_user (id, name, screen_name, friends_count, followers_count, created_at) "
+                           "SELECT i, 'u', 'u', 0, (1000000 / (1 + i %% 1000))::int, '2018-10-10' "
+                           "FROM generate_series(1, %s) i", [users])
+            cursor.execute("INSERT INTO monitor_tweet (id, author_id, created_at, text, lang, retweet_count) "
+                           "SELECT i, 1 + (i::bigint * 7919) %% %s, now() - i * interval '1 second', 't', 'en', 0 "
+                           "FROM generate_series(1, %s) i", [users, tweets])
+            cursor.execute("INSERT INTO monitor_tweet_hashtags (tweet_id, hashtag_id) "
+                           "SELECT i, '#Bench' FROM generate_series(1, %s) i "
+                           "UNION ALL SELECT i, '#Other' FROM generate_series(1, %s, 3) i", [tweets, tweets])
+            cursor.execute("ANALYZE")
+
+        tweets_qs = models.Tweet.objects.filter(hashtags__in=["#Bench"])
+        timed("join per tweet (double counts)", lambda: tweets_qs.aggregate(
+            reach=Coalesce(Sum('author__followers_count'), 0))['reach'], repeat=1)
+        exact = timed("distinct authors over tweets", lambda: models.User.objects.filter(
+            pk__in=tweets_qs.values('author')).aggregate(reach=Sum('followers_count'))['reach'], repeat=1)
+        timed("backfill author sets (once)", models.HashtagAuthor.backfill, repeat=1)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        timed("exact, tracked counter", lambda: models.HashtagAuthor.get_reach(["#Bench"]))
+        timed("exact, union of 2 hashtags", lambda: models.HashtagAuthor.get_reach(["#Bench", "#Other"]))
+        for k in (256, 1024, 4096):
+            with override_settings(REACH_SKETCH_SIZE=k):
+                estimate = timed(f"sketch k={k}, 1 hashtag",
+                                 lambda: models.HashtagAuthor.get_reach(["#Bench"], mode='sketch'))
+                timed(f"sketch k={k}, union of 2 hashtags",
+                      lambda: models.HashtagAuthor.get_reach(["#Bench", "#Other"], mode='sketch'))
+            print(f"{'':38s} error {abs(estimate - exact) / exact:.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Measures the ingest throughput of 1, 2 and 4 sharded worker processes.
+
+Each worker forks like `manage.py run_ingest --processes N` does, syncs the
+hashtags the ring gives its shard from a fake Twitter serving JSON pages,
+and writes them through its own pipeline and connection. Needs the database
+settings used by the tests (DB_NAME, DB_USER, ...):
+
+    python benchmarks/bench_sharded_ingest.py
+"""
+import json
+import multiprocessing
+import os
+import time
+
+from common import setup_django, test_database, make_statuses
+
+
+class FakeTwitter:
+    """Serves the pages of one hashtag, parsing them on each search as tweepy does."""
+
+    def __init__(self, name, base, pages, page_size=100):
+        self.pages = {}
+        for p in range(pages):
+            start_id = base + (pages - 1 - p) * page_size
+            statuses = make_statuses(page_size, users=1000, hashtags=[name], start_id=start_id, seed=start_id)
+            self.pages[None if p == 0 else start_id + page_size] = json.dumps({'statuses': statuses})
+
+    def search(self, q, max_id=None, **kwargs):
+        return json.loads(self.pages.get(max_id, '{"statuses": []}'))
+
+
+def ingest_shard(node, nodes, apis):
+    from hashtag_monitor.apps.monitor import ingest, sharding, tasks
+    sharding.set_shard(node, nodes)
+    for name in sharding.owned(list(apis)):
+        tasks.fetch_pages(apis[name], name, history_length=len(apis[name].pages) * 100)
+    ingest.PIPELINE.stop()
+
+
+def main(hashtags=8, pages=20, processes=(1, 2, 4)):
+    setup_django()
+    from django.db import connections
+    from hashtag_monitor.apps.monitor import models
+
+    context = multiprocessing.get_context('fork')
+    names = [f"#Bench{i}" for i in range(hashtags)]
+    apis = {name: FakeTwitter(name, (i + 1) * 10 ** 6, pages) for i, name in enumerate(names)}
+    statuses = hashtags * pages * 100
+    print(f"{statuses} statuses, {hashtags} hashtags, {os.cpu_count()} cpus")
+    with test_database():
+        for name in names:
+            models.Hashtag.objects.create(name=name)
+        baseline = None
+        for count in processes:
+            models.Tweet.objects.all().delete()
+            models.User.objects.all().delete()
+            # The workers must open their own connections.
+            connections.close_all()
+            workers = [context.Process(target=ingest_shard, args=(node, range(count), apis))
+                       for node in range(count)]
+            start = time.time()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.time() - start
+            assert models.Tweet.objects.filter(id__lt=10 ** 12).count() == statuses
+            baseline = baseline or elapsed
+            print(f"processes={count} {statuses / elapsed:9.1f} statuses/s  speedup {baseline / elapsed:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
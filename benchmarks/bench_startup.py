@@ -0,0 +1,56 @@
+"""Measures the cold start of the processes a deploy restarts.
+
+Each case runs in a fresh interpreter, best of a few runs, and tells which
+of the heavy libraries it ended up importing:
+
+- setup: django.setup() alone, what every management command pays;
+- check: manage.py check, which also loads the URLs and the views;
+- asgi: importing hashtag_monitor.asgi, what daphne does before listening.
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT
+
+HEAVY = ['tweepy', 'requests', 'apscheduler', 'hashtag_monitor.apps.monitor.tasks']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+CASES = {
+    'setup': "import django; django.setup()",
+    'check': "from django.core.management import call_command; import django; django.setup(); "
+             "call_command('check', verbosity=0)",
+    'asgi': "import hashtag_monitor.asgi",
+}
+
+
+def run(code):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE',
+                                                                 'hashtag_monitor.settings.development'))
+    output = subprocess.run([sys.executable, '-c', PROBE.format(code=code, heavy=HEAVY)],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    elapsed, loaded = output.strip().splitlines()[-1].partition(' ')[::2]
+    return float(elapsed), loaded
+
+
+def main(repeat=5):
+    for name, code in CASES.items():
+        runs = [run(code) for _ in range(repeat)]
+        best = min(elapsed for elapsed, _ in runs)
+        print(f"{name:8s} {best * 1000:9.1f} ms  heavy imports: {runs[0][1] or 'none'}")
+
+
+if __name__ == '__main__':
+    start = time.time()
+    main()
+    print(f"total {time.time() - start:.1f} s")
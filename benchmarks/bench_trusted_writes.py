@@ -0,0 +1,39 @@
+"""Counts the queries one 100-status search page costs with and without trusted writes.
+
+Needs the database settings used by the tests (DB_NAME, DB_USER, ...):
+
+    python benchmarks/bench_trusted_writes.py
+"""
+import time
+
+from common import setup_django, test_database, make_statuses
+
+
+def main(page_size=100, pages=5):
+    setup_django()
+    from django.test.utils import CaptureQueriesContext
+    from mock import patch
+    from hashtag_monitor.apps.monitor import models
+
+    with test_database() as connection:
+        models.Hashtag.objects.create(name="#Bench")
+        for trusted in (False, True):
+            models.Tweet.objects.all().delete()
+            models.User.objects.all().delete()
+            models._USER_PROFILE_HASHES.clear()
+            clean = models.clean_structure if trusted else (lambda instance: instance.full_clean())
+            queries, start = 0, time.time()
+            with patch.object(models, 'clean_structure', clean):
+                for p in range(pages):
+                    page = make_statuses(page_size, hashtags=["#Bench"], start_id=p * page_size, seed=p)
+                    connection.queries_log.clear()
+                    with CaptureQueriesContext(connection) as ctx:
+                        models.Tweet.create_from_json("#Bench", *page)
+                    queries += len(ctx)
+            elapsed = time.time() - start
+            print(f"trusted={trusted!s:5s} {queries / pages:8.1f} queries/page "
+                  f"{elapsed * 1000 / pages:8.1f} ms/page")
+
+
+if __name__ == '__main__':
+    main()
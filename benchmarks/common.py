@@ -0,0 +1,64 @@
+"""Helpers shared by the benchmark scripts."""
+import datetime
+import os
+import random
+import sys
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TWITTER_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
+def setup_django():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hashtag_monitor.settings.development')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Runs the block against a throwaway copy of the configured database."""
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def make_statuses(n, users=100, hashtags=(), start_id=1, seed=0, retweet_ratio=0.3):
+    """Builds search API statuses, newest first, as the live sync receives them."""
+    rnd = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    statuses = []
+    for i in range(n):
+        created_at = (now - datetime.timedelta(seconds=i)).strftime(TWITTER_TIME_FORMAT)
+        user_id = rnd.randrange(users) + 1
+        status = {
+            'id': start_id + n - i,
+            'text': f"Status {i}",
+            'created_at': created_at,
+            'lang': rnd.choice(['en', 'en', 'pt', 'es', 'und']),
+            'retweet_count': rnd.randrange(10),
+            'entities': {'hashtags': [{'text': h.lstrip('#')} for h in hashtags]},
+            'user': {
+                'id': user_id,
+                'name': f"User {user_id}",
+                'screen_name': f"user{user_id}",
+                'followers_count': user_id * 10,
+                'friends_count': user_id,
+                'created_at': "Wed Oct 10 20:19:24 +0000 2018",
+            },
+        }
+        if rnd.random() < retweet_ratio:
+            original_user = rnd.randrange(users) + 1
+            status['retweeted_status'] = dict(status,
+                                              id=10 ** 12 + rnd.randrange(n),
+                                              user=dict(status['user'], id=original_user,
+                                                        name=f"User {original_user}",
+                                                        screen_name=f"user{original_user}",
+                                                        followers_count=original_user * 10))
+        statuses.append(status)
+    return statuses
@@ -1,9 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def start_scheduler():
+    from . import consumers
+    from . import events
+    # Every process serving the dashboard announces its writes and follows those of the others.
+    events.PUBLISH = True
+    consumers.LISTENER.start()
+    if settings.INGEST_WORKER:
+        # The run_ingest worker fetches and writes.
+        return
+    # Loaded on first use, the scheduler brings APScheduler, tweepy and the job threads along.
+    from . import tasks
+    tasks.start()
 
 
 class MonitorConfig(AppConfig):
     name = 'hashtag_monitor.apps.monitor'
 
     def ready(self):
-        from . import tasks
-        tasks.start()
+        # Daphne starts the scheduler from hashtag_monitor.asgi and the ingest worker from run_ingest,
+        # other commands, the test runner included, only when asked to.
+        if settings.START_SCHEDULER:
+            start_scheduler()
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+
+import tweepy
+from django.conf import settings
+
+from . import metrics
+
+
+class Unavailable(Exception):
+    """Twitter should not be called on the endpoint before `retry_at` (a time.time() value)."""
+
+    def __init__(self, endpoint, retry_at, reason=""):
+        super().__init__(f"{endpoint} unavailable for {max(retry_at - time.time(), 0):.0f}s. {reason}".strip())
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+
+
+def rate_limit_reset(error):
+    """The reset time of a rate limited TweepError, None for any other error."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or error.api_code
+    if not isinstance(error, tweepy.RateLimitError) and status not in (420, 429):
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    return float(headers.get('x-rate-limit-reset') or 0) or None
+
+
+class CircuitBreaker:
+    """Fails fast on an endpoint after `threshold` failures in a row.
+
+    Every failure asks the caller to retry after a jittered exponential
+    backoff. From `threshold` failures on, or on a rate limit, the circuit
+    opens and every call fails fast until the retry time. Then a single
+    trial call goes through, closing the circuit if it succeeds.
+    """
+
+    def __init__(self, endpoint, threshold=5, backoff=5, max_backoff=900):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.retry_at = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def _delay(self):
+        delay = min(self.backoff * 2 ** (self.failures - 1), self.max_backoff)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _open(self, retry_at):
+        if self.opened_at is None:
+            self.opened_at = time.time()
+            metrics.increment(f'twitter_circuit_opened_{self.endpoint}')
+            metrics.set_gauge(f'twitter_circuit_open_{self.endpoint}', 1)
+        self.retry_at = max(self.retry_at, retry_at)
+        self.trial = False
+
+    def before_call(self):
+        with self.lock:
+            if not self.is_open:
+                return
+            if time.time() >= self.retry_at and not self.trial:
+                self.trial = True
+                return
+            metrics.increment(f'twitter_rejected_{self.endpoint}')
+            raise Unavailable(self.endpoint, max(self.retry_at, time.time() + 1), "Circuit open.")
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            if self.is_open:
+                metrics.observe(f'twitter_circuit_open_time_{self.endpoint}', time.time() - self.opened_at)
+                metrics.set_gauge(f'twitter_circuit_open_{self.endpoint}', 0)
+            self.opened_at, self.trial = None, False
+
+    def cancel(self):
+        # The call ended without an answer from Twitter, let the next one be the trial.
+        with self.lock:
+            self.trial = False
+
+    def failure(self, error):
+        with self.lock:
+            reset = rate_limit_reset(error)
+            if reset is not None:
+                metrics.increment(f'twitter_rate_limited_{self.endpoint}')
+                # A few seconds of jitter so that the waiting jobs do not all come back at once.
+                retry_at = max(reset, time.time()) + random.uniform(1, 5)
+                self._open(retry_at)
+                return Unavailable(self.endpoint, retry_at, "Rate limited.")
+            self.failures += 1
+            metrics.increment(f'twitter_failures_{self.endpoint}')
+            retry_at = time.time() + self._delay()
+            if self.failures >= self.threshold or self.trial:
+                self._open(retry_at)
+            return Unavailable(self.endpoint, retry_at, str(error))
+
+    def call(self, func, *args, **kwargs):
+        """Calls func, turning its TweepErrors into Unavailable with the time to retry at."""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except tweepy.TweepError as e:
+            raise self.failure(e) from e
+        except BaseException:
+            self.cancel()
+            raise
+        self.success()
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint,
+                                                           threshold=settings.TWITTER_BREAKER_THRESHOLD,
+                                                           backoff=settings.TWITTER_BACKOFF_SECONDS,
+                                                           max_backoff=settings.TWITTER_BACKOFF_MAX_SECONDS)
+        return breaker
+
+
+def call(endpoint, func, *args, **kwargs):
+    return get_breaker(endpoint).call(func, *args, **kwargs)
+
+
+def clear():
+    with _breakers_lock:
+        _breakers.clear()
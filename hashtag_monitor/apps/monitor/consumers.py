@@ -7,16 +7,51 @@ from django.dispatch import receiver
 from django.conf import settings
 from channels.generic.websocket import JsonWebsocketConsumer
 
-from . import models
-from . import serializers
+from . import dashboard
+from . import events
+from . import livestore
+from . import trends
+from .data_version import bump_data_version
 
 
-def sync():
+def notify_sockets():
     channel_layer = channels.layers.get_channel_layer()
     async_to_sync(channel_layer.group_send)(
         settings.TWEETER_SYNC_GROUP_NAME, {"type": 'sync', "message": ""})
 
 
+def sync():
+    if events.PUBLISH:
+        # The other processes refresh their caches and forward it to their sockets.
+        events.publish('sync')
+    notify_sockets()
+
+
+def apply_sync(data):
+    # The writes of another process only bumped the version in its own cache.
+    bump_data_version()
+    notify_sockets()
+
+
+def apply_live(data):
+    rows, co_hashtags = events.parse_live(data)
+    livestore.STORE.record(rows)
+    trends.record(rows, co_hashtags)
+
+
+# Feeds this web process with what the ingest worker, the other web processes and imports write.
+LISTENER = events.Listener({'sync': apply_sync, 'live': apply_live},
+                           on_connect=livestore.STORE.clear,
+                           ignore_own=True)
+
+
+@receiver(trends.burst_detected)
+def send_burst(sender, event, **kwargs):
+    channel_layer = channels.layers.get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        settings.TWEETER_SYNC_GROUP_NAME, {"type": 'burst', "event": event})
+
+
 class TweeterConsumer(JsonWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -50,6 +85,9 @@ class TweeterConsumer(JsonWebsocketConsumer):
     def sync(self, _=None):
         self._sync()
 
+    def burst(self, message):
+        self.send_json({"content_type": 'burst', "content": message['event']})
+
     def _set_filter(self, name, value):
         if name in self.filters and value != self.filters[name]:
             self.filters[name] = value
@@ -57,33 +95,5 @@ class TweeterConsumer(JsonWebsocketConsumer):
         return False
 
     def _sync(self):
-        # Hashtags
-        hashtags = models.Hashtag.get_hashtags_sorted()
-        hashtag_serializer = serializers.HashtagSerializer(hashtags, many=True)
-
-        # Latest Tweets
-        tweets = models.Tweet.get_latest_tweets(hashtag_name=self.filters['hashtag'],
-                                                count=settings.LATEST_TWEETS_NB)
-        tweet_serializer = serializers.TweetSerializer(tweets, many=True)
-
-        # Summary
-        summary = models.Tweet.get_summary(
-            hashtag_name=self.filters['hashtag'])
-
-        tweets_per_hashtag = models.Hashtag.get_tweets_count_per_hashtag()
-        tweets_per_day = models.Tweet.get_hashtag_tweets_per_day(
-            num_days=7)
-        tweets_per_lang = models.Tweet.get_tweets_per_lang(
-            top=3, hashtag_name=self.filters['hashtag'])
-
-        content = {
-            'selected_hashtag': self.filters['hashtag'],
-            'hashtags': hashtag_serializer.data,
-            'tweets': tweet_serializer.data,
-            'summary': summary,
-            'tweets_per_hashtag': tweets_per_hashtag,
-            'tweets_per_day': tweets_per_day,
-            'tweets_per_lang': tweets_per_lang
-        }
-
+        content = dashboard.get_payload(hashtag_name=self.filters['hashtag'])
         self.send_json({"content_type": 'sync', "content": content})
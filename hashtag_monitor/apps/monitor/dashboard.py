@@ -0,0 +1,92 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import data_version
+from . import livestore
+from . import models
+from . import serializers
+from . import timeseries
+from . import trends
+
+
+def get_payload(hashtag_name=None):
+    """Returns the dashboard content shared by every page and socket with this filter."""
+    key = data_version.versioned_key('dashboard', hashtag_name or '')
+    content = cache.get(key)
+    if content is None:
+        content = build_payload(hashtag_name)
+        cache.set(key, content, settings.PAGE_CACHE_TIMEOUT)
+    return content
+
+
+def get_live_store():
+    store = livestore.STORE
+    with store.lock:
+        if store.minutes and not store.seeded:
+            since = timezone.now() - datetime.timedelta(minutes=store.minutes)
+            store.seed(models.Tweet.get_live_counts(since))
+    return store
+
+
+def get_tweets_per_period(bucket, periods):
+    hashtags = models.Hashtag.objects.all()
+    starts = timeseries.get_bucket_starts(bucket, periods)
+    store = get_live_store()
+    if store.covers(starts[0]):
+        counts = store.counts('tweets', starts, bucket, [h.name for h in hashtags])
+    else:
+        starts, counts = models.Tweet.count_per_bucket(bucket=bucket, periods=periods)
+    return timeseries.to_chart(hashtags, starts, bucket, counts)
+
+
+def get_tweets_per_lang(top, hashtag_name=None):
+    key = data_version.versioned_key('tweets_per_lang', hashtag_name or '', top)
+    results = cache.get(key)
+    if results is None:
+        results = models.Tweet.get_tweets_per_lang(top=top, hashtag_name=hashtag_name)
+        cache.set(key, results, settings.PAGE_CACHE_TIMEOUT)
+    return results
+
+
+def get_leaderboards(hashtag_name=None):
+    if hashtag_name:
+        names = [hashtag_name]
+    else:
+        names = list(models.Hashtag.objects.values_list('name', flat=True))
+    authors = models.HashtagAuthor.get_top_authors(names)
+    tweets = models.TopTweet.get_top_tweets(names)
+    return {name: {'authors': authors[name], 'tweets': tweets[name]} for name in names}
+
+
+def build_payload(hashtag_name=None):
+    # Hashtags
+    hashtags = models.Hashtag.get_hashtags_sorted()
+    hashtag_serializer = serializers.HashtagSerializer(hashtags, many=True)
+
+    # Latest Tweets
+    tweets = models.Tweet.get_latest_tweets(hashtag_name=hashtag_name,
+                                            count=settings.LATEST_TWEETS_NB)
+    tweet_serializer = serializers.TweetSerializer(tweets, many=True)
+
+    # Summary
+    summary = models.Tweet.get_summary(hashtag_name=hashtag_name)
+
+    tweets_per_hashtag = models.Hashtag.get_tweets_count_per_hashtag()
+    tweets_per_period = get_tweets_per_period(bucket=settings.TWEETS_CHART_BUCKET,
+                                              periods=settings.TWEETS_CHART_PERIODS)
+    tweets_per_lang = get_tweets_per_lang(top=3, hashtag_name=hashtag_name)
+
+    return {
+        'selected_hashtag': hashtag_name,
+        'hashtags': hashtag_serializer.data,
+        'tweets': tweet_serializer.data,
+        'summary': summary,
+        'tweets_per_hashtag': tweets_per_hashtag,
+        'tweets_per_period': tweets_per_period,
+        'tweets_per_lang': tweets_per_lang,
+        'co_hashtags': trends.get_co_hashtags(top=5),
+        'leaderboards': get_leaderboards(hashtag_name)
+    }
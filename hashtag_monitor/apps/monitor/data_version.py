@@ -0,0 +1,27 @@
+import time
+
+from django.core.cache import cache
+
+
+DATA_VERSION_KEY = 'monitor:data_version'
+
+
+def get_data_version():
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost key never brings back an old version.
+        cache.add(DATA_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    try:
+        return cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        get_data_version()
+        return cache.incr(DATA_VERSION_KEY)
+
+
+def versioned_key(name, *parts):
+    return ':'.join(str(p) for p in ('monitor', name, get_data_version()) + parts)
@@ -0,0 +1,72 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+
+@receiver(connection_created)
+def count_connection(sender, **kwargs):
+    metrics.increment('db_connections_opened')
+
+
+def refresh_connection():
+    close_old_connections()
+    # A connection idle between jobs may have been dropped by the server.
+    if connection.connection is not None and not connection.is_usable():
+        metrics.increment('db_connections_unusable')
+        connection.close()
+
+
+class ConnectionPool:
+    """Bounds the background threads holding a database connection at once.
+
+    Django keeps one connection per thread, reused for CONN_MAX_AGE seconds,
+    so the pool only hands out slots: a job waits for a free slot, gets its
+    thread's connection checked before running and released as Django's
+    request cycle would after it.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.slots = threading.BoundedSemaphore(size)
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def _update_in_use(self, delta):
+        with self.lock:
+            self.in_use += delta
+            metrics.set_gauge('db_pool_in_use', self.in_use)
+
+    @contextmanager
+    def connection(self):
+        start = time.monotonic()
+        self.slots.acquire()
+        metrics.observe('db_pool_wait', time.monotonic() - start)
+        self._update_in_use(1)
+        try:
+            refresh_connection()
+            yield connection
+        finally:
+            close_old_connections()
+            self._update_in_use(-1)
+            self.slots.release()
+
+    def job(self, func, name=None):
+        name = name or f"job_{getattr(func, '__name__', 'anonymous')}"
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with self.connection(), metrics.timer(name):
+                return func(*args, **kwargs)
+        return run
+
+
+POOL = ConnectionPool(settings.DB_POOL_SIZE)
+metrics.set_gauge('db_pool_size', POOL.size)
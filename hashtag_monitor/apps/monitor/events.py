@@ -0,0 +1,158 @@
+import datetime
+import json
+import logging
+import os
+import select
+import socket
+import threading
+
+import psycopg2
+import psycopg2.extensions
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection
+
+from . import livestore
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'monitor_events'
+# Postgres refuses NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD = 7000
+
+# Set in the processes that announce what they write to the others.
+PUBLISH = False
+
+
+def sender():
+    # Computed on each call, forked workers must not pass for their parent.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish(kind, **data):
+    """Sends the event to every process listening, once the current transaction commits."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(dict(data, kind=kind, sender=sender()))])
+    metrics.increment(f'events_published_{kind}')
+
+
+def _chunks(items, limit=MAX_PAYLOAD):
+    chunk, size = [], 0
+    for item in items:
+        length = len(json.dumps(item)) + 2
+        if chunk and size + length > limit:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += length
+    if chunk:
+        yield chunk
+
+
+def publish_live(rows, co_hashtags):
+    """Sends the live rows of a write, summed per hashtag and minute, in as many events as they need."""
+    totals, pairs = {}, {}
+    for name, created_at, *values in rows:
+        key = (name, livestore.to_minute(created_at))
+        totals[key] = [a + b for a, b in zip(totals.get(key, [0] * len(values)), values)]
+    for pair in co_hashtags:
+        pairs[pair] = pairs.get(pair, 0) + 1
+    for chunk in _chunks([[name, minute, *values] for (name, minute), values in totals.items()]):
+        publish('live', rows=chunk)
+    for chunk in _chunks([[name, other, count] for (name, other), count in pairs.items()]):
+        publish('live', co_hashtags=chunk)
+
+
+def parse_live(data):
+    rows = [(name, livestore.EPOCH + datetime.timedelta(minutes=minute), *values)
+            for name, minute, *values in data.get('rows', ())]
+    return rows, [tuple(pair) for pair in data.get('co_hashtags', ())]
+
+
+class Listener:
+    """Calls handlers[kind](data) for the events published by the other processes.
+
+    The listening connection is its own, outside Django, on
+    EVENTS_DATABASE_URL or else the default database. LISTEN needs a session,
+    so start() refuses a default database pooled in transaction mode, where
+    no event would ever arrive. `on_connect` runs on every (re)connection, as the
+    events sent meanwhile are lost. With `ignore_own`, the events this process
+    published are skipped, it applied them when it wrote.
+    """
+
+    def __init__(self, handlers, on_connect=None, timeout=5, ignore_own=False):
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self.ignore_own = ignore_own
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if settings.EVENTS_DATABASE_URL:
+            conn = psycopg2.connect(settings.EVENTS_DATABASE_URL)
+        else:
+            conn = psycopg2.connect(**connection.get_connection_params())
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def start(self):
+        if not settings.EVENTS_DATABASE_URL and settings.DATABASE_POOL_MODE != 'session':
+            raise ImproperlyConfigured(
+                f"LISTEN needs a session, set EVENTS_DATABASE_URL to a database bypassing "
+                f"pgbouncer in {settings.DATABASE_POOL_MODE} mode.")
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self._run, name='events-listener', daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        self.stopped.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def dispatch(self, payload):
+        data = json.loads(payload)
+        kind = data.pop('kind', None)
+        origin = data.pop('sender', None)
+        handler = self.handlers.get(kind)
+        if handler is None or (self.ignore_own and origin == sender()):
+            return
+        metrics.increment(f'events_received_{kind}')
+        try:
+            handler(data)
+        except Exception:
+            logger.exception("Handling the %s event failed.", kind)
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        conn = None
+        while not self.stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self.connect()
+                    if self.on_connect is not None:
+                        self.on_connect()
+                if select.select([conn], [], [], self.timeout)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self.dispatch(conn.notifies.pop(0).payload)
+            except psycopg2.Error:
+                logger.exception("Listening to %s failed, reconnecting.", CHANNEL)
+                metrics.increment('events_reconnects')
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self.stopped.wait(self.timeout)
+        if conn is not None:
+            conn.close()
+        connection.close()
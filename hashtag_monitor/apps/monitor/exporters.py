@@ -0,0 +1,103 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from django.utils.dateparse import parse_date
+
+
+EXPORT_FIELDS = ['id', 'created_at', 'author_id', 'author__screen_name', 'text', 'lang',
+                 'retweet_count', 'retweeted_id', 'quoted_tweet_id', 'source']
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'columns': 'application/x-ndjson',
+}
+
+FILE_EXTENSIONS = {
+    'ndjson': 'ndjson',
+    'csv': 'csv',
+    'columns': 'columns.ndjson',
+}
+
+
+def _to_json(value):
+    return json.dumps(value, default=str, ensure_ascii=False) + "\n"
+
+
+def encode_ndjson(rows, fields=EXPORT_FIELDS, chunk_size=None):
+    for row in rows:
+        yield _to_json({f: row[f] for f in fields}).encode()
+
+
+def encode_csv(rows, fields=EXPORT_FIELDS, chunk_size=None):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_columns(rows, fields=EXPORT_FIELDS, chunk_size=2000):
+    # Each line holds one chunk of rows laid out column by column.
+    columns = {f: [] for f in fields}
+    size = 0
+    for row in rows:
+        for f in fields:
+            columns[f].append(row[f])
+        size += 1
+        if size == chunk_size:
+            yield _to_json({'rows': size, 'columns': columns}).encode()
+            columns = {f: [] for f in fields}
+            size = 0
+    if size:
+        yield _to_json({'rows': size, 'columns': columns}).encode()
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+    'columns': encode_columns,
+}
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_date_range(since=None, until=None):
+    """Returns the [since, until] days as a half-open datetime interval."""
+    def to_datetime(value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{value}' is not a valid date (YYYY-MM-DD).")
+        return datetime.datetime.combine(day, datetime.time.min)
+
+    since, until = to_datetime(since), to_datetime(until)
+    if until:
+        until += datetime.timedelta(days=1)
+    return since, until
+
+
+def export_tweets(rows, fmt='ndjson', compress=False, chunk_size=2000):
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown export format '{fmt}'.")
+    chunks = ENCODERS[fmt](rows, fields=EXPORT_FIELDS, chunk_size=chunk_size)
+    if compress:
+        chunks = gzip_stream(chunks)
+    return chunks
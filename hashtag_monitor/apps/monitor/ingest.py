@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import close_old_connections, connection
+
+from . import consumers
+from . import dbpool
+from . import metrics
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+
+class Pages(list):
+    """The tickets of a fetch, and the search requests it took, the empty last page included."""
+    requests = 0
+
+
+class Ticket:
+    """The outcome of one submitted page, set once the writer is done with it."""
+
+    def __init__(self, hashtag_name, statuses):
+        self.hashtag_name = hashtag_name
+        self.statuses = statuses
+        self.submitted = time.monotonic()
+        self.new_tweets = []
+        self.error = None
+        self.dropped = False
+        self.event = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def add_done_callback(self, callback):
+        with self.lock:
+            if not self.done:
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, new_tweets=(), error=None, dropped=False):
+        self.new_tweets, self.error, self.dropped = list(new_tweets), error, dropped
+        with self.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class IngestPipeline:
+    """Decouples fetching pages of statuses from writing them.
+
+    Fetchers submit pages into a bounded queue and block while it is full. A
+    single writer thread drains it, coalescing the pages waiting in line into
+    one transaction per hashtag and one dashboard sync per batch. With a size
+    of 0 pages are written inline by the caller.
+    """
+
+    def __init__(self, size, batch_statuses=500, put_timeout=60):
+        self.size = size
+        self.batch_statuses = batch_statuses
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        """Lets the writer finish the pages already queued, then ends its thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, hashtag_name, statuses):
+        ticket = Ticket(hashtag_name, statuses)
+        if not self.size:
+            self.write([ticket])
+            return ticket
+
+        self.start()
+        start = time.monotonic()
+        try:
+            self.queue.put(ticket, timeout=self.put_timeout)
+        except queue.Full:
+            metrics.increment('ingest_dropped_pages')
+            logger.warning("Ingest queue full, dropped a page of %s statuses for %s.", len(statuses), hashtag_name)
+            ticket.finish(dropped=True)
+        finally:
+            metrics.observe('ingest_put_blocked', time.monotonic() - start)
+            metrics.set_gauge('ingest_queue_depth', self.queue.qsize())
+        return ticket
+
+    def _next_batch(self):
+        # Returns the batch and whether the stop marker was reached.
+        ticket = self.queue.get()
+        if ticket is None:
+            return [], True
+        batch, statuses = [ticket], len(ticket.statuses)
+        while statuses < self.batch_statuses:
+            try:
+                ticket = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if ticket is None:
+                return batch, True
+            batch.append(ticket)
+            statuses += len(ticket.statuses)
+        metrics.set_gauge('ingest_queue_depth', self.queue.qsize())
+        return batch, False
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if not batch:
+                continue
+            try:
+                dbpool.refresh_connection()
+                self.write(batch)
+            except Exception as e:
+                logger.exception("Ingest writer failed on a batch of %s pages.", len(batch))
+                for ticket in batch:
+                    if not ticket.done:
+                        ticket.finish(error=e)
+            finally:
+                close_old_connections()
+        connection.close()
+
+    def write(self, batch):
+        now = time.monotonic()
+        for ticket in batch:
+            metrics.observe('ingest_wait', now - ticket.submitted)
+
+        groups = {}
+        for ticket in batch:
+            groups.setdefault(ticket.hashtag_name, []).append(ticket)
+        written = False
+        with metrics.timer('ingest_write'):
+            for hashtag_name, tickets in groups.items():
+                statuses = [s for t in tickets for s in t.statuses]
+                try:
+                    created = models.Tweet.write_from_json(hashtag_name, *statuses)
+                except ObjectDoesNotExist as e:
+                    # The hashtag was deleted while its pages were waiting.
+                    for ticket in tickets:
+                        ticket.finish(error=e)
+                    continue
+                created = {t.id: t for t in created}
+                for ticket in tickets:
+                    ticket.finish(created[s['id']] for s in ticket.statuses if s['id'] in created)
+                metrics.increment('ingest_statuses', len(statuses))
+                written = written or bool(created)
+        if written:
+            consumers.sync()
+
+
+PIPELINE = IngestPipeline(settings.INGEST_QUEUE_PAGES,
+                          batch_statuses=settings.INGEST_BATCH_STATUSES,
+                          put_timeout=settings.INGEST_PUT_TIMEOUT)
@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import dbpool
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+LIVE, BACKFILL, MAINTENANCE = 0, 1, 2
+PRIORITY_NAMES = {LIVE: 'live', BACKFILL: 'backfill', MAINTENANCE: 'maintenance'}
+# Job keys carry hashtag names and tweet ids, their timings are kept per kind.
+JOB_KINDS = [('tweeter_sync', 'sync'), ('sync_', 'sync'), ('synced_', 'sync'),
+             ('populate_', 'populate'), ('gap_', 'gap'), ('roll_up', 'rollup')]
+
+
+def job_kind(key):
+    for prefix, kind in JOB_KINDS:
+        if key.startswith(prefix):
+            return kind
+    return 'maintenance'
+
+
+class Job:
+    def __init__(self, key, call, priority):
+        self.key = key
+        self.call = call
+        self.priority = priority
+        self.submitted = time.monotonic()
+        # (call, priority) to run again once the current run is over.
+        self.rerun = None
+
+
+class JobRunner:
+    """Runs one-off jobs on a fixed number of worker threads, most urgent first.
+
+    A key is queued at most once: submitting it again merges into the queued
+    job and keeps the most urgent priority, and submitting a running key runs
+    it once more after the current run instead of replacing it.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.queue = []
+        self.pending = {}
+        self.running = {}
+        self.order = itertools.count()
+        self.threads = []
+        self.cond = threading.Condition()
+
+    def start(self):
+        with self.cond:
+            self.threads = [t for t in self.threads if t.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'job-worker-{len(self.threads)}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _update_gauges(self):
+        metrics.set_gauge('jobs_queued', len(self.pending))
+        metrics.set_gauge('jobs_running', len(self.running))
+
+    def submit(self, key, call, priority=MAINTENANCE):
+        assert callable(call)
+        with self.cond:
+            job = self.pending.get(key)
+            if job is not None:
+                metrics.increment('jobs_merged')
+                job.call = call
+                if priority < job.priority:
+                    # The old heap entry is skipped once its priority no longer matches.
+                    job.priority = priority
+                    heapq.heappush(self.queue, (priority, next(self.order), job))
+                return job
+            job = self.running.get(key)
+            if job is not None:
+                metrics.increment('jobs_merged')
+                job.rerun = (call, min(priority, job.rerun[1]) if job.rerun else priority)
+                return job
+            job = self._enqueue(key, call, priority)
+        self.start()
+        return job
+
+    def _enqueue(self, key, call, priority):
+        job = self.pending[key] = Job(key, call, priority)
+        heapq.heappush(self.queue, (priority, next(self.order), job))
+        self._update_gauges()
+        self.cond.notify_all()
+        return job
+
+    def _next(self):
+        with self.cond:
+            while True:
+                while not self.queue:
+                    self.cond.wait()
+                priority, _, job = heapq.heappop(self.queue)
+                if self.pending.get(job.key) is job and job.priority == priority:
+                    del self.pending[job.key]
+                    self.running[job.key] = job
+                    self._update_gauges()
+                    return job
+
+    def _work(self):
+        while True:
+            job = self._next()
+            metrics.observe(f'job_wait_{PRIORITY_NAMES[job.priority]}', time.monotonic() - job.submitted)
+            try:
+                dbpool.POOL.job(job.call, name=f'job_{job_kind(job.key)}')()
+            except Exception:
+                metrics.increment('jobs_failed')
+                logger.exception("Job %s failed.", job.key)
+            finally:
+                with self.cond:
+                    del self.running[job.key]
+                    if job.rerun:
+                        self._enqueue(job.key, *job.rerun)
+                    self._update_gauges()
+                    self.cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Blocks until no job is queued or running, returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.running, timeout)
+
+
+RUNNER = JobRunner(settings.JOB_WORKERS)
@@ -0,0 +1,128 @@
+import datetime
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import timeseries
+
+
+METRICS = ('tweets', 'retweets', 'reach')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_minute(value):
+    return int((timeseries.naive_utc(value) - EPOCH).total_seconds() // 60)
+
+
+class RingStore:
+    """Per-minute counters of every hashtag over the last `minutes` minutes.
+
+    Each hashtag owns one int64 array of shape (len(METRICS), minutes) used as
+    a ring buffer indexed by the minute since epoch.
+    """
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+        self.head = None
+        self.seeded = False
+        self.series = {}
+        self.lock = threading.RLock()
+
+    def clear(self):
+        with self.lock:
+            self.head = None
+            self.seeded = False
+            self.series = {}
+
+    def drop(self, hashtag_name):
+        with self.lock:
+            self.series.pop(hashtag_name, None)
+
+    def covers(self, since, now=None):
+        if not self.minutes:
+            return False
+        with self.lock:
+            self.advance(to_minute(now or timezone.now()))
+            return self.seeded and to_minute(since) > self.head - self.minutes
+
+    def advance(self, minute):
+        # Zero the buckets recycled between the previous head and this minute.
+        if self.head is None:
+            self.head = minute
+            return
+        if minute <= self.head:
+            return
+        if minute - self.head >= self.minutes:
+            for values in self.series.values():
+                values[:] = 0
+        else:
+            recycled = np.arange(self.head + 1, minute + 1) % self.minutes
+            for values in self.series.values():
+                values[:, recycled] = 0
+        self.head = minute
+
+    def add(self, rows):
+        """Adds (hashtag name, time, tweets, retweets, reach) rows."""
+        rows = list(rows)
+        if not rows or not self.minutes:
+            return
+        names, times, counts = [], [], []
+        for name, time, *values in rows:
+            names.append(name)
+            times.append(to_minute(time))
+            counts.append(values)
+        minutes = np.array(times, dtype=np.int64)
+        counts = np.array(counts, dtype=np.int64).T
+
+        with self.lock:
+            # A clock running ahead must not wipe the whole buffer.
+            self.advance(min(int(minutes.max()), to_minute(timezone.now()) + 1))
+            kept = (minutes > self.head - self.minutes) & (minutes <= self.head)
+            positions = minutes % self.minutes
+            names = np.array(names, dtype=object)
+            for name in set(names[kept].tolist()):
+                values = self.series.get(name)
+                if values is None:
+                    values = self.series[name] = np.zeros((len(METRICS), self.minutes), dtype=np.int64)
+                selected = kept & (names == name)
+                for metric in range(len(METRICS)):
+                    np.add.at(values[metric], positions[selected], counts[metric][selected])
+
+    def seed(self, rows, now=None):
+        with self.lock:
+            self.clear()
+            self.advance(to_minute(now or timezone.now()))
+            self.add(rows)
+            self.seeded = True
+
+    def record(self, rows):
+        # Until the seed is loaded from the database, the seed already has these rows.
+        with self.lock:
+            if self.seeded:
+                self.add(rows)
+
+    def counts(self, metric, starts, bucket, hashtag_names):
+        """Sums one metric into the buckets starting at `starts`, without touching the database."""
+        step = int(timeseries.BUCKETS[bucket][0].total_seconds() // 60)
+        first = to_minute(starts[0])
+        minutes = np.arange(first, first + step * len(starts))
+        row = METRICS.index(metric)
+        with self.lock:
+            # Minutes after the head have not been written yet and still hold old values.
+            written = minutes <= self.head
+            positions = minutes % self.minutes
+            result = {}
+            for name in hashtag_names:
+                values = self.series.get(name)
+                if values is None:
+                    result[name] = np.zeros(len(starts), dtype=np.int64)
+                else:
+                    window = np.where(written, values[row, positions], 0)
+                    result[name] = window.reshape(len(starts), step).sum(axis=1)
+            return result
+
+
+STORE = RingStore(settings.LIVE_STORE_MINUTES)
@@ -0,0 +1,48 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import exporters
+from ... import models
+
+
+class Command(BaseCommand):
+    help = "Streams the tweets of a hashtag as NDJSON, CSV or columnar chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('hashtag')
+        parser.add_argument('--format', default='ndjson', choices=sorted(exporters.ENCODERS))
+        parser.add_argument('--since', default=None, help="First day (YYYY-MM-DD).")
+        parser.add_argument('--until', default=None, help="Last day (YYYY-MM-DD).")
+        parser.add_argument('--gzip', action='store_true', default=False)
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+        parser.add_argument('--output', '-o', default='-', help="Output file or - for stdout.")
+
+    def handle(self, *args, **options):
+        if not models.Hashtag.objects.filter(pk=options['hashtag']).exists():
+            raise CommandError(f"Hashtag {options['hashtag']} is not being monitored.")
+        try:
+            since, until = exporters.parse_date_range(options['since'], options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = models.Tweet.iter_for_export(options['hashtag'],
+                                            fields=exporters.EXPORT_FIELDS,
+                                            since=since,
+                                            until=until,
+                                            chunk_size=options['chunk_size'])
+        content = exporters.export_tweets(rows,
+                                          fmt=options['format'],
+                                          compress=options['gzip'],
+                                          chunk_size=options['chunk_size'])
+        if options['output'] == '-':
+            self._write(content, sys.stdout.buffer)
+        else:
+            with open(options['output'], 'wb') as f:
+                self._write(content, f)
+
+    def _write(self, content, output):
+        for chunk in content:
+            output.write(chunk)
+        output.flush()
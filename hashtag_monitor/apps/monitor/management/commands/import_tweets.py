@@ -0,0 +1,154 @@
+import json
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, IntegrityError
+
+from ... import consumers
+from ... import events
+from ... import models
+from ... import twitter_utils as twt_utls
+
+
+# Raised by statuses missing fields or holding unexpected values.
+STATUS_ERRORS = (KeyError, TypeError, ValueError, AttributeError)
+
+
+def parse_chunk(chunk):
+    """Parses a chunk of lines and converts the timestamps of its statuses.
+
+    Lines that are not valid JSON or statuses are counted and skipped.
+    """
+    lines, end_offset = chunk
+    statuses, errors = [], 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            statuses.append(json.loads(line))
+        except ValueError:
+            errors += 1
+    try:
+        twt_utls.convert_statuses(statuses)
+    except STATUS_ERRORS:
+        valid = []
+        for status in statuses:
+            try:
+                valid.extend(twt_utls.convert_statuses([status]))
+            except STATUS_ERRORS:
+                errors += 1
+        statuses = valid
+    return statuses, errors, end_offset
+
+
+def read_chunks(stream, offset, chunk_lines):
+    """Yields (lines, end_offset) chunks from a binary stream starting at offset."""
+    if offset:
+        if stream.seekable():
+            stream.seek(offset)
+        else:
+            stream.read(offset)
+    lines, position = [], offset
+    for line in stream:
+        position += len(line)
+        lines.append(line)
+        if len(lines) == chunk_lines:
+            yield lines, position
+            lines = []
+    if lines:
+        yield lines, position
+
+
+def parse_in_pool(pool, chunks, max_pending):
+    # Pool.imap would read the whole input ahead, so keep a bounded window.
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(parse_chunk, (chunk,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class Command(BaseCommand):
+    help = "Imports line-delimited Twitter status JSON from files or stdin."
+
+    def add_arguments(self, parser):
+        parser.add_argument('inputs', nargs='+', help="Files to import or - for stdin.")
+        parser.add_argument('--hashtag', default=None,
+                            help="Monitored hashtag to attach to every status.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Statuses written per transaction.")
+        parser.add_argument('--workers', type=int, default=2,
+                            help="Parser processes (0 parses in this process).")
+        parser.add_argument('--offset', type=int, default=0,
+                            help="Byte offset to resume from (single input only).")
+
+    def handle(self, *args, **options):
+        if options['offset'] and len(options['inputs']) > 1:
+            raise CommandError("--offset can only be used with a single input.")
+        # Fork the parsers before touching the database connection.
+        pool = Pool(options['workers']) if options['workers'] > 0 else None
+        # The web processes follow the imported rows in their live charts and caches.
+        publish, events.PUBLISH = events.PUBLISH, True
+        try:
+            if options['hashtag'] and not models.Hashtag.objects.filter(pk=options['hashtag']).exists():
+                raise CommandError(f"Hashtag {options['hashtag']} is not being monitored.")
+            for name in options['inputs']:
+                if name == '-':
+                    self._import(sys.stdin.buffer, name, pool, **options)
+                else:
+                    with open(name, 'rb') as stream:
+                        self._import(stream, name, pool, **options)
+        finally:
+            events.PUBLISH = publish
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _import(self, stream, name, pool, hashtag, batch_size, offset, workers, **options):
+        chunks = read_chunks(stream, offset, batch_size)
+        if pool is not None:
+            parsed = parse_in_pool(pool, chunks, max_pending=2 * workers)
+        else:
+            parsed = map(parse_chunk, chunks)
+
+        start, statuses_nb, created_nb, errors_nb, failed_nb = time.time(), 0, 0, 0, 0
+        for statuses, errors, end_offset in parsed:
+            created, failed = self._write(name, hashtag, statuses)
+            if created:
+                consumers.sync()
+            statuses_nb += len(statuses)
+            created_nb += len(created)
+            errors_nb += errors
+            failed_nb += failed
+            elapsed = max(time.time() - start, 1e-6)
+            self.stdout.write(f"{name}: {statuses_nb} statuses, {created_nb} new tweets, "
+                              f"{errors_nb} invalid lines, {failed_nb} failed statuses, "
+                              f"{statuses_nb / elapsed:.1f} statuses/s (resume with --offset {end_offset})")
+        summary = f"{name}: imported {created_nb} new tweets from {statuses_nb} statuses"
+        if errors_nb or failed_nb:
+            self.stdout.write(self.style.WARNING(
+                f"{summary}, skipped {errors_nb} invalid lines and {failed_nb} failed statuses."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{summary}."))
+
+    def _write(self, name, hashtag, statuses):
+        """Writes a batch, or its statuses one by one when it fails, skipping those that fail alone."""
+        try:
+            return models.Tweet.write_from_json(hashtag, *statuses), 0
+        except STATUS_ERRORS + (ValidationError, DataError, IntegrityError) as e:
+            if len(statuses) < 2:
+                self.stderr.write(f"{name}: could not write status {statuses[0].get('id')}: {e!r}")
+                return [], 1
+        created, failed = [], 0
+        for status in statuses:
+            new_tweets, error = self._write(name, hashtag, [status])
+            created.extend(new_tweets)
+            failed += error
+        return created, failed
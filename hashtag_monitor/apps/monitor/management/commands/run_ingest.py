@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import events
+from ... import ingest
+from ... import models
+from ... import sharding
+from ... import tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(data):
+    if sharding.owns(data['hashtag_name'], list(models.Hashtag.objects.values_list('name', flat=True))):
+        tasks.get_remaining_tweets_in_background(None, data['hashtag_name'], data['history_length'], data['job_name'])
+
+
+def remove_trash(data):
+    if sharding.is_leader():
+        tasks.run_in_background(tasks.remove_trash_and_sync, "remove_trash_from_view")
+
+
+def hashtags_changed(data):
+    tasks.rebalance()
+
+
+def stop_on_signals(stop):
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+
+
+def run_worker(node, nodes):
+    """Schedules, fetches and writes the hashtags of this node until SIGTERM."""
+    stop = threading.Event()
+    stop_on_signals(stop)
+    if len(nodes) > 1:
+        sharding.set_shard(node, nodes)
+    events.PUBLISH = True
+    listener = events.Listener({'backfill': backfill,
+                                'remove_trash': remove_trash,
+                                'hashtags_changed': hashtags_changed})
+    listener.start()
+    scheduler = tasks.start()
+    logger.info("Ingest worker %s of %s started.", node, len(nodes))
+    while not stop.wait(1):
+        pass
+    scheduler.shutdown(wait=False)
+    listener.stop()
+    ingest.PIPELINE.stop()
+
+
+def supervise(processes):
+    """Runs one worker per shard in its own process, restarting the ones that die."""
+    stop = threading.Event()
+    stop_on_signals(stop)
+    context = multiprocessing.get_context('fork')
+    nodes = list(range(processes))
+    # The children must open their own connections.
+    connections.close_all()
+    workers = {}
+    while not stop.is_set():
+        for node in nodes:
+            worker = workers.get(node)
+            if worker is not None and worker.is_alive():
+                continue
+            if worker is not None:
+                logger.warning("Ingest worker %s exited with %s, restarting it.", node, worker.exitcode)
+            workers[node] = context.Process(target=run_worker, args=(node, nodes), name=f"ingest-{node}")
+            workers[node].start()
+        stop.wait(1)
+    for worker in workers.values():
+        worker.terminate()
+    for worker in workers.values():
+        worker.join()
+
+
+class Command(BaseCommand):
+    help = "Runs the scheduler, the Twitter fetches and the writes, so that web processes only serve."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.INGEST_PROCESSES,
+                            help="Worker processes, the hashtags are sharded across them.")
+
+    def handle(self, *args, **options):
+        if not settings.INGEST_WORKER:
+            # The web processes would keep their own scheduler and every hashtag would be polled twice.
+            raise CommandError("Set INGEST_WORKER=true for the web processes and the worker alike.")
+        if options['processes'] < 1:
+            raise CommandError("--processes must be at least 1.")
+        if options['processes'] == 1:
+            run_worker(0, [0])
+        else:
+            supervise(options['processes'])
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+_lock = threading.Lock()
+COUNTERS = {}
+GAUGES = {}
+TIMERS = {}
+RATES = {}
+# Seconds the rates are averaged over.
+RATE_WINDOW = 15 * 60
+
+
+def increment(name, value=1):
+    with _lock:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    with _lock:
+        GAUGES[name] = value
+
+
+def observe(name, seconds):
+    with _lock:
+        count, total, peak = TIMERS.get(name, (0, 0.0, 0.0))
+        TIMERS[name] = (count + 1, total + seconds, max(peak, seconds))
+
+
+def _prune(events, now):
+    while events and events[0][0] <= now - RATE_WINDOW:
+        events.popleft()
+
+
+def mark(name, value=1):
+    """Counts value toward the rate of name."""
+    now = time.monotonic()
+    with _lock:
+        events = RATES.setdefault(name, deque())
+        events.append((now, value))
+        _prune(events, now)
+
+
+def rate(name):
+    """Per minute over the last RATE_WINDOW seconds."""
+    now = time.monotonic()
+    with _lock:
+        events = RATES.get(name, ())
+        if events:
+            _prune(events, now)
+        return sum(value for _, value in events) * 60 / RATE_WINDOW
+
+
+@contextmanager
+def timer(name):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start)
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(COUNTERS),
+            'gauges': dict(GAUGES),
+            'timers': {name: {'count': count,
+                              'total': round(total, 6),
+                              'mean': round(total / count, 6) if count else 0.0,
+                              'max': round(peak, 6)}
+                       for name, (count, total, peak) in TIMERS.items()},
+        }
+
+
+def clear():
+    with _lock:
+        COUNTERS.clear()
+        GAUGES.clear()
+        TIMERS.clear()
+        RATES.clear()
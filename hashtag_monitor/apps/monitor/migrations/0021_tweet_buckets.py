@@ -0,0 +1,31 @@
+# Generated by Django 3.0 on 2026-10-19 06:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0020_auto_20191227_1803'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='rolled_up_until',
+            field=models.DateTimeField(blank=True, default=None, editable=False, null=True, verbose_name='Tweets rolled up until'),
+        ),
+        migrations.CreateModel(
+            name='TweetBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='Minute')),
+                ('count', models.IntegerField(default=0, verbose_name='Tweets')),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.Hashtag')),
+            ],
+            options={
+                'unique_together': {('hashtag', 'start')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0 on 2026-10-19 06:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0021_tweet_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='users_sketched',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Authors sketched'),
+        ),
+        migrations.CreateModel(
+            name='UserSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('registers', models.BinaryField(verbose_name='HyperLogLog registers')),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.Hashtag')),
+            ],
+            options={
+                'unique_together': {('hashtag', 'day')},
+            },
+        ),
+    ]
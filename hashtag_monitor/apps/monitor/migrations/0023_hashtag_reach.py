@@ -0,0 +1,44 @@
+# Generated by Django 3.0 on 2026-10-19 06:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0022_user_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='reach',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Followers of distinct authors'),
+        ),
+        migrations.AddField(
+            model_name='hashtag',
+            name='reach_tracked',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Reach tracked'),
+        ),
+        migrations.CreateModel(
+            name='HashtagAuthor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author_hash', models.BigIntegerField(verbose_name='Hash of the author id')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Followers counted')),
+                ('priority', models.FloatField(default=0, verbose_name='Sampling priority')),
+                ('last_seen', models.DateTimeField(verbose_name='Last tweet')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.User')),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.Hashtag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='hashtagauthor',
+            index=models.Index(fields=['hashtag', '-priority'], name='monitor_has_hashtag_918a22_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hashtagauthor',
+            unique_together={('hashtag', 'author')},
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.0 on 2026-10-19 07:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0023_hashtag_reach'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopTweet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retweet_count', models.IntegerField(default=0, verbose_name='Retweets')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='hashtag',
+            name='leaders_tracked',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Top tweets tracked'),
+        ),
+        migrations.AddField(
+            model_name='hashtagauthor',
+            name='tweets_count',
+            field=models.IntegerField(default=0, verbose_name='Tweets'),
+        ),
+        migrations.AddIndex(
+            model_name='hashtagauthor',
+            index=models.Index(fields=['hashtag', '-tweets_count'], name='monitor_has_hashtag_af1974_idx'),
+        ),
+        migrations.AddField(
+            model_name='toptweet',
+            name='hashtag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.Hashtag'),
+        ),
+        migrations.AddField(
+            model_name='toptweet',
+            name='tweet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor.Tweet'),
+        ),
+        migrations.AddIndex(
+            model_name='toptweet',
+            index=models.Index(fields=['hashtag', '-retweet_count'], name='monitor_top_hashtag_a70837_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='toptweet',
+            unique_together={('hashtag', 'tweet')},
+        ),
+        # Author pairs written so far have no tweets count, index them again.
+        migrations.RunSQL("UPDATE monitor_hashtag SET reach_tracked = false", migrations.RunSQL.noop),
+    ]
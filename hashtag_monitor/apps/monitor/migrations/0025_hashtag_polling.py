@@ -0,0 +1,23 @@
+# Generated by Django 3.0 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0024_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='poll_interval',
+            field=models.FloatField(default=None, editable=False, null=True, verbose_name='Minutes between polls'),
+        ),
+        migrations.AddField(
+            model_name='hashtag',
+            name='next_poll',
+            field=models.DateTimeField(default=None, editable=False, null=True, verbose_name='Next poll'),
+        ),
+    ]
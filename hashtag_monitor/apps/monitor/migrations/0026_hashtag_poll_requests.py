@@ -0,0 +1,18 @@
+# Generated by Django 3.0 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0025_hashtag_polling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='poll_requests',
+            field=models.FloatField(default=None, editable=False, null=True, verbose_name='Search requests of the last poll'),
+        ),
+    ]
@@ -1,16 +1,26 @@
 import datetime
-
-import numpy as np
+import random
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 
 from django.db.models.signals import pre_delete, post_save, post_delete
 from django.dispatch import receiver
-from django.db import models, transaction
-from django.db.models import Sum, Count
-from django.db.models.functions import Coalesce
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Sum, Count, F, Q
+from django.db.models.functions import Coalesce, TruncMinute, TruncDate
 from django.utils import timezone
+from django.conf import settings
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 
+from . import events
+from . import livestore
+from . import timeseries
+from . import trends
 from . import twitter_utils as twt_utls
+from .data_version import bump_data_version
+from . import sketches
+from .sketches import HyperLogLog
 
 
 def validate_not_empty(value):
@@ -44,6 +54,54 @@ def validate_nb_hashtag(value):
         raise ValidationError(f"The maximum number of hashtags is {max_nb}.")
 
 
+# Validators that hit the database, skipped for trusted writes.
+QUERY_VALIDATORS = (validate_nb_hashtag, validate_is_not_duplicate)
+
+_trusted = threading.local()
+
+
+@contextmanager
+def trusted_writes():
+    """Saves in this block skip the validations that need queries.
+
+    Meant for data coming from Twitter, forms and the admin keep the full validation.
+    """
+    previous = getattr(_trusted, 'enabled', False)
+    _trusted.enabled = True
+    try:
+        yield
+    finally:
+        _trusted.enabled = previous
+
+
+def clean_structure(instance):
+    errors = {}
+    for f in instance._meta.fields:
+        # Relations are enforced by the foreign keys and unique fields by the indexes.
+        if f.is_relation:
+            continue
+        raw_value = getattr(instance, f.attname)
+        if f.blank and raw_value in f.empty_values:
+            continue
+        try:
+            value = f.to_python(raw_value)
+            f.validate(value, instance)
+            for validator in f.validators:
+                if validator not in QUERY_VALIDATORS:
+                    validator(value)
+        except ValidationError as e:
+            errors[f.name] = e.error_list
+    if errors:
+        raise ValidationError(errors)
+
+
+def clean_before_save(instance):
+    if getattr(_trusted, 'enabled', False):
+        clean_structure(instance)
+    else:
+        instance.full_clean()
+
+
 COLORS_PALETTE = ['#3b465e', '#2e3951', '#1c2a48', '#1c2331', '#e53935', '#d32f2f', '#c62828', '#b71c1c', '#d81b60', '#c2185b', '#ad1457', '#880e4f', '#8e24aa', '#7b1fa2', '#6a1b9a', '#4a148c', '#5e35b1', '#512da8', '#4527a0', '#311b92', '#3949ab', '#303f9f', '#283593', '#1a237e', '#1e88e5', '#1976d2', '#1565c0', '#0d47a1', '#039be5', '#0288d1', '#0277bd', '#01579b', '#00acc1', '#0097a7', '#00838f', '#006064', '#00897b', '#00796b', '#00695c', '#004d40',
                   '#43a047', '#388e3c', '#2e7d32', '#1b5e20', '#7cb342', '#689f38', '#558b2f', '#33691e', '#c0ca33', '#afb42b', '#9e9d24', '#827717', '#fdd835', '#fbc02d', '#f9a825', '#f57f17', '#ffb300', '#ffa000', '#ff8f00', '#ff6f00', '#fb8c00', '#f57c00', '#ef6c00', '#e65100', '#f4511e', '#e64a19', '#d84315', '#bf360c', '#6d4c41', '#5d4037', '#4e342e', '#3e2723', '#546e7a', '#455a64', '#37474f', '#263238', '#757575', '#616161', '#424242', '#212121']
 
@@ -63,17 +121,44 @@ class Hashtag(models.Model):
                              default=None,
                              validators=[validate_not_empty],
                              null=True)
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if not self.color:
-            self.color = np.random.choice(COLORS_PALETTE)
+    rolled_up_until = models.DateTimeField("Tweets rolled up until",
+                                           default=None,
+                                           null=True,
+                                           blank=True,
+                                           editable=False)
+    users_sketched = models.BooleanField("Authors sketched",
+                                         default=False,
+                                         editable=False)
+    reach = models.BigIntegerField("Followers of distinct authors",
+                                   default=0,
+                                   editable=False)
+    reach_tracked = models.BooleanField("Reach tracked",
+                                        default=False,
+                                        editable=False)
+    leaders_tracked = models.BooleanField("Top tweets tracked",
+                                          default=False,
+                                          editable=False)
+    poll_interval = models.FloatField("Minutes between polls",
+                                      default=None,
+                                      null=True,
+                                      editable=False)
+    next_poll = models.DateTimeField("Next poll",
+                                     default=None,
+                                     null=True,
+                                     editable=False)
+    poll_requests = models.FloatField("Search requests of the last poll",
+                                      default=None,
+                                      null=True,
+                                      editable=False)
 
     def __str__(self):
         return f"{self.name}"
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        self.full_clean()
+        # Picked on creation only, rows loaded from the database already have theirs.
+        if self._state.adding and not self.color:
+            self.color = random.choice(COLORS_PALETTE)
+        clean_before_save(self)
         return super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
     @classmethod
@@ -84,6 +169,43 @@ class Hashtag(models.Model):
             hashtag = cls.objects.create(pk=hashtag_name)
         return hashtag
 
+    @classmethod
+    def get_due_for_poll(cls, now=None):
+        now = now or timezone.now()
+        return list(cls.objects.filter(Q(next_poll__isnull=True) | Q(next_poll__lte=now))
+                    .order_by('next_poll').values_list('name', flat=True))
+
+    @classmethod
+    def record_poll(cls, hashtag_name, statuses, requests=1, reserved=0, now=None):
+        """Schedules the next poll of the hashtag from the statuses its last poll brought back.
+
+        The interval aims at one full page of 100 statuses per poll. Each poll
+        is expected to cost as many search requests as the last one, and a
+        hashtag may spend whatever SEARCH_REQUESTS_PER_MINUTE the other
+        hashtags and the `reserved` requests per minute of backfills leave, with
+        an even share of it at least. Backfills never take more than half.
+        """
+        now = now or timezone.now()
+        polls = {name: (interval, poll_requests) for name, interval, poll_requests
+                 in cls.objects.values_list('name', 'poll_interval', 'poll_requests')}
+        if hashtag_name not in polls:
+            return None
+        interval = polls.pop(hashtag_name)[0] or settings.TWEETER_SYNC_MINUTES
+        requests = max(requests, 1)
+        factor = min(max(100 / statuses, 0.25), 2) if statuses else 2
+        interval = min(max(interval * factor, settings.POLL_MIN_MINUTES), settings.POLL_MAX_MINUTES)
+        budget = max(settings.SEARCH_REQUESTS_PER_MINUTE - reserved, settings.SEARCH_REQUESTS_PER_MINUTE / 2)
+        left = budget - sum((r or 1) / (i or settings.TWEETER_SYNC_MINUTES) for i, r in polls.values())
+        interval = max(interval, requests / max(left, budget / (len(polls) + 1)))
+        cls.objects.filter(pk=hashtag_name).update(poll_interval=interval,
+                                                   poll_requests=requests,
+                                                   next_poll=now + datetime.timedelta(minutes=interval))
+        return interval
+
+    @classmethod
+    def postpone_poll(cls, hashtag_name, until):
+        return cls.objects.filter(pk=hashtag_name).update(next_poll=until)
+
     @classmethod
     def get_tweets_count_per_hashtag(cls):
         query = cls.objects.all().annotate(
@@ -104,6 +226,55 @@ class Hashtag(models.Model):
         else:
             return True
 
+    @classmethod
+    def invalidate_rollup(cls, hashtag_names, since):
+        # Tweets older than the watermark arrived late, roll them up again from there.
+        since = timeseries.floor_time(since, '1m')
+        return cls.objects.filter(pk__in=hashtag_names,
+                                  rolled_up_until__gt=since).update(rolled_up_until=since)
+
+
+@receiver([post_save, post_delete], sender=Hashtag)
+def hashtag_changed(sender, **kwargs):
+    bump_data_version()
+    if settings.INGEST_WORKER:
+        # The ingest workers share the hashtags out again.
+        events.publish('hashtags_changed')
+
+
+@receiver(post_delete, sender=Hashtag)
+def hashtag_deleted(sender, instance, **kwargs):
+    livestore.STORE.drop(instance.name)
+    trends.forget(instance.name)
+
+
+class BoundedDict(OrderedDict):
+    """A thread-safe dict that forgets its least recently written keys."""
+
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+
+    def update(self, values):
+        with self.lock:
+            for k, v in values.items():
+                self[k] = v
+                self.move_to_end(k)
+            while len(self) > self.maxsize:
+                self.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+
+
+_USER_PROFILE_HASHES = BoundedDict(maxsize=100000)
+
 
 class User(models.Model):
     id = models.BigIntegerField('Twitter user id',
@@ -136,7 +307,8 @@ class User(models.Model):
         return f"{self.name}"
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        self.full_clean()
+        clean_before_save(self)
+        _USER_PROFILE_HASHES.discard(self.pk)
         return super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
     @classmethod
@@ -155,7 +327,7 @@ class User(models.Model):
 
     @classmethod
     def update_or_create_from_json(cls, twitter_json):
-        created_at = twt_utls.convert_to_datetime(twitter_json['created_at'])
+        created_at = twt_utls.convert_to_datetime_cached(twitter_json['created_at'])
         usr, _ = cls.objects.update_or_create(
             pk=twitter_json['id'],
             defaults={
@@ -168,11 +340,61 @@ class User(models.Model):
             })
         return usr
 
+    @classmethod
+    def _profile_from_json(cls, twitter_json):
+        return (twitter_json['id'],
+                twitter_json['name'],
+                twitter_json['screen_name'],
+                twt_utls.convert_to_datetime_cached(
+                    twitter_json['created_at']).date(),
+                twitter_json.get('friends_count', 0),
+                twitter_json.get('followers_count', 0),
+                twitter_json.get('profile_image_url_https', None))
+
+    @classmethod
+    def upsert_many_from_json(cls, *users_json):
+        """Writes the given users with a single INSERT ... ON CONFLICT statement.
+
+        Duplicated users are written once, and users whose profile did not change
+        since this process last wrote them are skipped.
+        """
+        profiles = {}
+        for j in users_json:
+            # Statuses arrive newest first, so keep the first profile seen.
+            if j['id'] not in profiles:
+                profiles[j['id']] = cls._profile_from_json(j)
+
+        changed = {pk: hash(p) for pk, p in profiles.items()
+                   if _USER_PROFILE_HASHES.get(pk) != hash(p)}
+        if not changed:
+            return 0
+
+        fields = ['id', 'name', 'screen_name', 'created_at',
+                  'friends_count', 'followers_count', 'profile_image']
+        columns = [cls._meta.get_field(f).column for f in fields]
+        quote = connection.ops.quote_name
+        updates = [c for c in columns if c != 'id']
+        sql = (f"INSERT INTO {quote(cls._meta.db_table)} ({', '.join(quote(c) for c in columns)}) "
+               f"VALUES {', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(changed))} "
+               f"ON CONFLICT ({quote('id')}) DO UPDATE SET "
+               f"{', '.join(f'{quote(c)} = EXCLUDED.{quote(c)}' for c in updates)} "
+               f"WHERE ({', '.join(f'{quote(cls._meta.db_table)}.{quote(c)}' for c in updates)}) "
+               f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{quote(c)}' for c in updates)})")
+        # Sorted ids take the row locks in the same order in every worker.
+        params = [v for pk in sorted(changed) for v in profiles[pk]]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+        # Only remember what was committed, a rolled back batch must be rewritten.
+        transaction.on_commit(lambda: _USER_PROFILE_HASHES.update(changed))
+        return len(changed)
+
     @classmethod
     def remove_trash(cls):
         usrs = cls.objects.filter(tweet=None)
         if usrs:
             usrs.delete()
+            _USER_PROFILE_HASHES.clear()
 
 
 class Tweet(models.Model):
@@ -229,10 +451,10 @@ class Tweet(models.Model):
         return f"{self.author.name} published '{self.text}' on {self.created_at.strftime('%A, %d %B, %Y at %X')}"
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        if self.retweeted is not None:
+        if self.retweeted_id is not None:
             self.retweet_count = 0
 
-        self.full_clean()
+        clean_before_save(self)
         return super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
 
     @classmethod
@@ -262,50 +484,76 @@ class Tweet(models.Model):
             hashtags=None, tweet_retweeted=None, tweet_quoted=None)
         if tweets:
             deleted, _ = tweets.delete()
+            transaction.on_commit(bump_data_version)
         return deleted
 
     @classmethod
     def get_tweets_per_lang(cls, top=0, hashtag_name=None):
+        """Counts tweets per language in one query, folding 'und' and the languages after the top ones into 'others'."""
         if hashtag_name:
             tweets = cls.objects.filter(hashtags__in=[hashtag_name])
         else:
             tweets = cls.objects.all()
-        query = tweets.values("lang").annotate(count=Count(
-            'lang')).values("lang", "count").order_by("-count")
-        if top > 0:
-            results = {q['lang']: q['count']
-                       for q in query[:top] if q['lang'] != 'und'}
-            results['others'] = sum(q['count']
-                                    for q in query[top:] if q['lang'] != 'und')
-            results['others'] += sum(q['count']
-                                     for q in query if q['lang'] == 'und')
-        else:
-            results = {q['lang']: q['count']
-                       for q in query if q['lang'] != 'und'}
-            results['others'] = sum(q['count']
-                                    for q in query if q['lang'] == 'und')
+        counts, params = tweets.order_by().values('lang').annotate(
+            count=Count('pk')).query.sql_with_params()
+        sql = (f"SELECT CASE WHEN lang = 'und' OR (%s > 0 AND rank > %s) THEN NULL ELSE lang END, SUM(count)::bigint "
+               f"FROM (SELECT lang, count, ROW_NUMBER() OVER (ORDER BY count DESC, lang) AS rank "
+               f"FROM ({counts}) counts) ranked "
+               f"GROUP BY 1 ORDER BY MIN(rank)")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [top, top] + list(params))
+            rows = cursor.fetchall()
+
+        results = {lang: count for lang, count in rows if lang is not None}
+        results['others'] = sum(count for lang, count in rows if lang is None)
         return results
 
     @classmethod
     def get_hashtag_tweets_per_day(cls, num_days=7):
-        base = datetime.datetime.today().date()
-        tweets_per_day = {
-            h.name: {
-                "color": h.color,
-                "values": {
-                    (base - datetime.timedelta(days=x)).strftime("%d/%m"): 0
-                    for x in range(num_days-1, 0, -1)
-                },
-            } for h in Hashtag.objects.all()
-        }
-
-        query = cls.objects.filter(created_at__date__gt=base - datetime.timedelta(days=num_days)).values(
-            'created_at__date', 'hashtags').annotate(count=Count('created_at__date')).order_by("-count")
-        for q in query:
-            if q['hashtags'] in tweets_per_day:
-                date = q['created_at__date'].strftime("%d/%m")
-                tweets_per_day[q['hashtags']]['values'][date] = q['count']
-        return tweets_per_day
+        return cls.get_hashtag_tweets_per_period(bucket='1d', periods=num_days)
+
+    @classmethod
+    def count_per_bucket(cls, bucket='1d', periods=7, end=None, hashtag_names=None):
+        """Counts tweets per hashtag into dense, zero-filled buckets.
+
+        Minutes already rolled up are read from TweetBucket, the raw tweets
+        are only scanned after each hashtag's watermark.
+        """
+        step, trunc = timeseries.BUCKETS[bucket]
+        starts = timeseries.get_bucket_starts(bucket, periods, end)
+        since, until = starts[0], starts[-1] + step
+
+        buckets = TweetBucket.objects.filter(start__gte=since, start__lt=until).filter(
+            start__lt=F('hashtag__rolled_up_until'))
+        # Tweets without hashtags, quoted ones or those of deleted hashtags, have no bucket.
+        conditions = {'created_at__gte': since, 'created_at__lt': until, 'hashtags__isnull': False}
+        if hashtag_names is not None:
+            buckets = buckets.filter(hashtag__in=hashtag_names)
+            conditions['hashtags__in'] = hashtag_names
+        # A single filter() so that every condition on hashtags shares one join.
+        tweets = cls.objects.filter(Q(hashtags__rolled_up_until=None) |
+                                    Q(created_at__gte=F('hashtags__rolled_up_until')),
+                                    **conditions)
+
+        rolled_up = buckets.annotate(time=trunc('start')).values_list(
+            'hashtag', 'time').annotate(count=Sum('count')).order_by()
+        recent = tweets.annotate(time=trunc('created_at')).values_list(
+            'hashtags', 'time').annotate(count=Count('pk')).order_by()
+        return starts, timeseries.densify(starts, bucket, list(rolled_up) + list(recent))
+
+    @classmethod
+    def get_hashtag_tweets_per_period(cls, bucket='1d', periods=7, end=None):
+        starts, counts = cls.count_per_bucket(bucket=bucket, periods=periods, end=end)
+        return timeseries.to_chart(Hashtag.objects.all(), starts, bucket, counts)
+
+    @classmethod
+    def get_live_counts(cls, since):
+        """Returns (hashtag, minute, tweets, retweets, reach) rows to seed the live store."""
+        return cls.objects.filter(created_at__gte=since).exclude(hashtags=None).annotate(
+            minute=TruncMinute('created_at')).values_list('hashtags', 'minute').annotate(
+            tweets=Count('pk'),
+            retweets=Count('retweeted'),
+            reach=Coalesce(Sum('author__followers_count'), 0)).order_by()
 
     @classmethod
     def get_summary(cls, hashtag_name=None):
@@ -313,11 +561,17 @@ class Tweet(models.Model):
             tweets = cls.objects.filter(hashtags__in=[hashtag_name])
         else:
             tweets = cls.objects.exclude(hashtags=None).all()
-        summary = tweets.aggregate(reach=Coalesce(Sum('author__followers_count'), 0),
-                                   tweets_count=Count('pk'),
+        summary = tweets.aggregate(tweets_count=Count('pk'),
                                    retweet_count=Coalesce(
-                                       Sum('retweet_count'), 0),
-                                   users=Count('author'))
+                                       Sum('retweet_count'), 0))
+        names = [hashtag_name] if hashtag_name else Hashtag.objects.values_list('name', flat=True)
+        summary['reach'] = HashtagAuthor.get_reach(names)
+        if summary['reach'] is None:
+            summary['reach'] = User.objects.filter(pk__in=tweets.values('author')).aggregate(
+                reach=Coalesce(Sum('followers_count'), 0))['reach']
+        summary['users'] = UserSketch.count_users(names)
+        if summary['users'] is None:
+            summary['users'] = tweets.aggregate(users=Count('author', distinct=True))['users']
         return summary
 
     @classmethod
@@ -330,6 +584,69 @@ class Tweet(models.Model):
                 hashtags=None).all().order_by('-created_at')[:count]
         return tweets
 
+    @classmethod
+    def iter_for_export(cls, hashtag_name, fields, since=None, until=None, chunk_size=2000):
+        """Yields the rows of the hashtag's tweets, chunk_size at a time, from a server-side cursor.
+
+        The cursor is read in a transaction, so pgbouncer in transaction mode
+        keeps the connection holding it until the last row.
+        """
+        tweets = cls.objects.filter(hashtags__in=[hashtag_name])
+        if since:
+            tweets = tweets.filter(created_at__gte=since)
+        if until:
+            tweets = tweets.filter(created_at__lt=until)
+        with transaction.atomic():
+            yield from tweets.order_by('pk').values(*fields).iterator(chunk_size=chunk_size)
+
+    @classmethod
+    def update_retweet_counts(cls, retweet_counts):
+        """Raises the retweet count of known tweets from a {tweet id: retweet count} dict in one statement."""
+        if not retweet_counts:
+            return 0
+        quote = connection.ops.quote_name
+        table, through_table = quote(cls._meta.db_table), quote(cls.hashtags.through._meta.db_table)
+        # Sorted ids take the row locks in the same order in every job.
+        params = [v for pk in sorted(retweet_counts) for v in (pk, retweet_counts[pk])]
+        values = ', '.join(['(%s::bigint, %s::int)'] * len(retweet_counts))
+        sql = (f"WITH updated AS (UPDATE {table} t SET retweet_count = v.retweet_count "
+               f"FROM (VALUES {values}) v (id, retweet_count) "
+               f"WHERE t.id = v.id AND t.retweeted_id IS NULL AND t.retweet_count < v.retweet_count "
+               f"RETURNING t.id, t.retweet_count) "
+               f"SELECT u.id, th.hashtag_id, u.retweet_count "
+               f"FROM updated u LEFT JOIN {through_table} th ON th.tweet_id = u.id")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        if not rows:
+            return 0
+        leaders = [(name, pk, count) for pk, name, count in rows if name is not None]
+        if leaders:
+            TopTweet.add_many(leaders)
+        transaction.on_commit(bump_data_version)
+        return len({pk for pk, _, _ in rows})
+
+    @classmethod
+    def get_latest_original_ids(cls, hashtag_name, count):
+        return list(cls.objects.filter(hashtags__in=[hashtag_name], retweeted=None).order_by(
+            '-created_at').values_list('pk', flat=True)[:count])
+
+    @classmethod
+    def write_from_json(cls, hashtag_name, *tweeter_json):
+        """create_from_json in a transaction of its own.
+
+        Users whose profile this process already wrote are skipped. If another
+        process deleted some of them meanwhile, the commit fails on the author
+        foreign key and the statuses are written again with every user.
+        """
+        try:
+            with transaction.atomic():
+                return cls.create_from_json(hashtag_name, *tweeter_json)
+        except IntegrityError:
+            _USER_PROFILE_HASHES.clear()
+            with transaction.atomic():
+                return cls.create_from_json(hashtag_name, *tweeter_json)
+
     @classmethod
     def create_from_json(cls, hashtag_name, *tweeter_json):
         def create_tweet(data, hashtag=None):
@@ -356,18 +673,23 @@ class Tweet(models.Model):
                 text = data['text']
                 mentioned_hashtags = data['entities']['hashtags']
 
+            unmonitored = []
             for h in mentioned_hashtags:
                 ht = Hashtag.objects.filter(
                     pk__iexact=f"#{h['text']}").first()
                 if ht:
                     hashtags.append(ht)
+                else:
+                    unmonitored.append(f"#{h['text'].lower()}")
 
-            created_at = twt_utls.convert_to_datetime(data['created_at'])
-            author = User.update_or_create_from_json(data['user'])
+            created_at = data['created_at']
+            day = timeseries.naive_utc(created_at).date()
+            touched.update(h.name for h in hashtags)
+            oldest.append(created_at)
             tweet, created = cls.objects.get_or_create(
                 pk=data['id'],
                 defaults={
-                    'author': author,
+                    'author_id': data['user']['id'],
                     'quoted_tweet': quoted_tweet,
                     'retweeted': retweeted,
                     'created_at': created_at,
@@ -378,13 +700,407 @@ class Tweet(models.Model):
                     'url': None,
                     'filter_level': data.get('filter_level', None)
                 })
-            for h in hashtags:
-                tweet.hashtags.add(h)
+            added = set(hashtags) if created else set(hashtags) - set(tweet.hashtags.all())
+            if added:
+                tweet.hashtags.add(*added)
+                live_rows.extend((h.name, created_at, 1, int(retweeted is not None),
+                                  data['user'].get('followers_count', 0)) for h in added)
+                co_hashtags.extend((h.name, other) for h in added for other in set(unmonitored))
+                authors.extend((h.name, day, data['user']['id']) for h in added)
+                pairs.extend((h.name, data['user']['id'], timeseries.naive_utc(created_at)) for h in added)
+            if retweeted is None:
+                retweet_count = data.get('retweet_count', 0)
+                if not created and retweet_count > tweet.retweet_count:
+                    refreshed[tweet.pk] = max(refreshed.get(tweet.pk, 0), retweet_count)
+                leaders.extend((h.name, tweet.pk, tweet.retweet_count) for h in added)
             return tweet, created
 
-        tweets = []
-        for j in tweeter_json:
-            tweet, created = create_tweet(j, hashtag_name)
-            if created:
-                tweets.append(tweet)
+        def get_users(data):
+            yield data['user']
+            for nested in ('retweeted_status', 'quoted_status'):
+                if data.get(nested):
+                    yield from get_users(data[nested])
+
+        # The timestamps of a whole page are parsed at once.
+        twt_utls.convert_statuses(tweeter_json)
+        User.upsert_many_from_json(*(u for j in tweeter_json for u in get_users(j)))
+
+        tweets, touched, oldest, live_rows, co_hashtags, authors, pairs, leaders = [], set(), [], [], [], [], [], []
+        refreshed = {}
+        with trusted_writes():
+            for j in tweeter_json:
+                tweet, created = create_tweet(j, hashtag_name)
+                if created:
+                    tweets.append(tweet)
+        if touched:
+            Hashtag.invalidate_rollup(touched, min(oldest))
+        if authors:
+            UserSketch.add_authors(authors)
+        HashtagAuthor.sync_followers({u['id'] for j in tweeter_json for u in get_users(j)})
+        if pairs:
+            HashtagAuthor.add_many(pairs)
+        if leaders:
+            TopTweet.add_many(leaders)
+        cls.update_retweet_counts(refreshed)
+        if tweeter_json:
+            # Readers must not cache the rows of this transaction under a new version before it commits.
+            def publish():
+                bump_data_version()
+                if live_rows:
+                    livestore.STORE.record(live_rows)
+                    trends.record(live_rows, co_hashtags)
+                    if events.PUBLISH:
+                        events.publish_live(live_rows, co_hashtags)
+            transaction.on_commit(publish)
         return tweets
+
+
+class TweetBucket(models.Model):
+    """Number of tweets of a hashtag created within one minute."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    start = models.DateTimeField("Minute")
+    count = models.IntegerField("Tweets", default=0)
+
+    class Meta:
+        unique_together = ('hashtag', 'start')
+
+    def __str__(self):
+        return f"{self.hashtag_id} at {self.start}: {self.count}"
+
+    @classmethod
+    def roll_up(cls, until=None):
+        """Aggregates the complete minutes since each hashtag's watermark."""
+        until = timeseries.floor_time(until or timezone.now(), '1m')
+        rolled_up = 0
+        pending = Hashtag.objects.filter(Q(rolled_up_until=None) | Q(rolled_up_until__lt=until))
+        for name, watermark in pending.values_list('name', 'rolled_up_until'):
+            with transaction.atomic():
+                buckets = cls.objects.filter(hashtag_id=name, start__lt=until)
+                tweets = Tweet.objects.filter(hashtags=name, created_at__lt=until)
+                if watermark is not None:
+                    buckets = buckets.filter(start__gte=watermark)
+                    tweets = tweets.filter(created_at__gte=watermark)
+                buckets.delete()
+                counts = tweets.annotate(minute=TruncMinute('created_at')).values_list(
+                    'minute').annotate(count=Count('pk')).order_by()
+                cls.objects.bulk_create(cls(hashtag_id=name, start=minute, count=count)
+                                        for minute, count in counts)
+                # Late tweets may have moved the watermark meanwhile, leave it to the next run.
+                if not Hashtag.objects.filter(pk=name, rolled_up_until=watermark).update(rolled_up_until=until):
+                    transaction.set_rollback(True)
+                else:
+                    rolled_up += 1
+        return rolled_up
+
+
+class UserSketch(models.Model):
+    """HyperLogLog of the authors who tweeted with a hashtag on one day."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    day = models.DateField("Day")
+    registers = models.BinaryField("HyperLogLog registers")
+
+    PRECISION = 12
+
+    class Meta:
+        unique_together = ('hashtag', 'day')
+
+    def __str__(self):
+        return f"{self.hashtag_id} on {self.day}"
+
+    @classmethod
+    def add_authors(cls, rows):
+        """Adds (hashtag name, day, author id) rows to the daily sketches."""
+        grouped = defaultdict(list)
+        for name, day, author_id in rows:
+            grouped[(name, day)].append(author_id)
+        names, days = {n for n, _ in grouped}, {d for _, d in grouped}
+        empty = HyperLogLog(cls.PRECISION).to_bytes()
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(hashtag_id=name, day=day, registers=empty) for name, day in grouped],
+                                    ignore_conflicts=True)
+            changed = []
+            sketches = cls.objects.select_for_update().filter(
+                hashtag__in=names, day__in=days).order_by('hashtag', 'day')
+            for sketch in sketches:
+                ids = grouped.get((sketch.hashtag_id, sketch.day))
+                if ids is None:
+                    continue
+                registers = HyperLogLog(registers=sketch.registers).add_many(ids).to_bytes()
+                if registers != bytes(sketch.registers):
+                    sketch.registers = registers
+                    changed.append(sketch)
+            cls.objects.bulk_update(changed, ['registers'])
+        return len(changed)
+
+    @classmethod
+    def backfill(cls):
+        """Sketches the authors already stored for hashtags not sketched yet."""
+        sketched = 0
+        for name in Hashtag.objects.filter(users_sketched=False).values_list('name', flat=True):
+            with transaction.atomic():
+                rows = Tweet.objects.filter(hashtags=name).annotate(day=TruncDate('created_at')).values_list(
+                    'day', 'author_id').distinct().order_by()
+                cls.add_authors((name, day, author_id) for day, author_id in rows.iterator())
+                sketched += Hashtag.objects.filter(pk=name).update(users_sketched=True)
+        return sketched
+
+    @classmethod
+    def count_users(cls, hashtag_names, since=None, until=None):
+        """Estimates the distinct authors of the hashtags between two days, None until they are all sketched."""
+        hashtag_names = list(hashtag_names)
+        if Hashtag.objects.filter(pk__in=hashtag_names, users_sketched=False).exists():
+            return None
+        sketches = cls.objects.filter(hashtag__in=hashtag_names)
+        if since:
+            sketches = sketches.filter(day__gte=since)
+        if until:
+            sketches = sketches.filter(day__lt=until)
+        merged = HyperLogLog(cls.PRECISION)
+        for registers in sketches.values_list('registers', flat=True).iterator():
+            merged.merge(HyperLogLog(registers=registers))
+        return merged.count()
+
+
+class HashtagAuthor(models.Model):
+    """An author who tweeted with a hashtag, with the followers counted in its reach."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    author_hash = models.BigIntegerField("Hash of the author id")
+    followers_count = models.IntegerField("Followers counted", default=0)
+    priority = models.FloatField("Sampling priority", default=0)
+    tweets_count = models.IntegerField("Tweets", default=0)
+    last_seen = models.DateTimeField("Last tweet")
+
+    class Meta:
+        unique_together = ('hashtag', 'author')
+        indexes = [models.Index(fields=['hashtag', '-priority']),
+                   models.Index(fields=['hashtag', '-tweets_count'])]
+
+    # Priority sampling: followers divided by a uniform (0, 1] draw taken from the author hash.
+    PRIORITY_SQL = "{followers} / ((({hash})::numeric + 9223372036854775809) / 18446744073709551616)::float8"
+
+    def __str__(self):
+        return f"{self.author_id} in {self.hashtag_id}"
+
+    @classmethod
+    def _tables(cls):
+        quote = connection.ops.quote_name
+        return (quote(cls._meta.db_table), quote(Hashtag._meta.db_table),
+                quote(User._meta.db_table), quote(Tweet._meta.db_table),
+                quote(Tweet.hashtags.through._meta.db_table))
+
+    @classmethod
+    def _insert_sql(cls, select):
+        table = cls._tables()[0]
+        priority = cls.PRIORITY_SQL.format(followers='u.followers_count', hash='author_hash')
+        return (f"INSERT INTO {table} (hashtag_id, author_id, author_hash, followers_count, priority, "
+                f"tweets_count, last_seen) "
+                f"SELECT hashtag_id, author_id, author_hash, u.followers_count, {priority}, tweets_count, last_seen "
+                f"FROM (SELECT hashtag_id, author_id, hashtextextended(author_id::text, 0) AS author_hash, "
+                f"COUNT(*) AS tweets_count, MAX(last_seen) AS last_seen "
+                f"FROM ({select}) s GROUP BY hashtag_id, author_id) a "
+                f"JOIN {cls._tables()[2]} u ON u.id = a.author_id ")
+
+    @classmethod
+    def add_many(cls, pairs):
+        """Records one (hashtag name, author id, tweet time) pair per new tweet, adding new authors to the hashtag reach."""
+        table, hashtag_table, _, _, _ = cls._tables()
+        params = [v for p in pairs for v in p]
+        values = ', '.join(['(%s, %s::bigint, %s::timestamp)'] * len(pairs))
+        select = f"SELECT * FROM (VALUES {values}) v (hashtag_id, author_id, last_seen)"
+        sql = (f"WITH inserted AS ({cls._insert_sql(select)}"
+               f"ON CONFLICT (hashtag_id, author_id) DO UPDATE SET "
+               f"tweets_count = {table}.tweets_count + EXCLUDED.tweets_count, "
+               f"last_seen = GREATEST({table}.last_seen, EXCLUDED.last_seen) "
+               # xmax is only 0 for rows this statement inserted.
+               f"RETURNING hashtag_id, followers_count, xmax = 0 AS created) "
+               f"UPDATE {hashtag_table} h SET reach = h.reach + d.delta "
+               f"FROM (SELECT hashtag_id, SUM(followers_count) AS delta FROM inserted "
+               f"WHERE created GROUP BY hashtag_id) d WHERE h.name = d.hashtag_id")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @classmethod
+    def sync_followers(cls, author_ids):
+        """Moves the reach of every hashtag by the follower changes of these authors."""
+        if not author_ids:
+            return
+        table, hashtag_table, user_table, _, _ = cls._tables()
+        priority = cls.PRIORITY_SQL.format(followers='c.followers', hash='ha.author_hash')
+        sql = (f"WITH changed AS ("
+               f"SELECT ha.id, ha.hashtag_id, u.followers_count AS followers, "
+               f"u.followers_count - ha.followers_count AS delta "
+               f"FROM {table} ha JOIN {user_table} u ON u.id = ha.author_id "
+               f"WHERE ha.author_id = ANY(%s) AND ha.followers_count <> u.followers_count "
+               f"FOR UPDATE OF ha), "
+               f"updated AS (UPDATE {table} ha SET followers_count = c.followers, priority = {priority} "
+               f"FROM changed c WHERE ha.id = c.id) "
+               f"UPDATE {hashtag_table} h SET reach = h.reach + d.delta "
+               f"FROM (SELECT hashtag_id, SUM(delta) AS delta FROM changed GROUP BY hashtag_id) d "
+               f"WHERE h.name = d.hashtag_id")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [list(author_ids)])
+
+    @classmethod
+    def backfill(cls):
+        """Indexes the authors already stored for hashtags whose reach is not tracked yet."""
+        table, hashtag_table, _, tweet_table, through_table = cls._tables()
+        select = (f"SELECT th.hashtag_id, t.author_id, t.created_at AS last_seen "
+                  f"FROM {through_table} th JOIN {tweet_table} t ON t.id = th.tweet_id "
+                  f"WHERE th.hashtag_id = %s")
+        tracked = 0
+        for name in Hashtag.objects.filter(reach_tracked=False).values_list('name', flat=True):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"{cls._insert_sql(select)}ON CONFLICT (hashtag_id, author_id) DO UPDATE SET "
+                               f"tweets_count = EXCLUDED.tweets_count, "
+                               f"last_seen = GREATEST({table}.last_seen, EXCLUDED.last_seen)", [name])
+                # Inserting first takes the pair locks in the same order as ingest.
+                cursor.execute(
+                    f"UPDATE {hashtag_table} SET reach_tracked = true, reach = ("
+                    f"SELECT COALESCE(SUM(followers_count), 0) FROM {table} WHERE hashtag_id = %s) "
+                    f"WHERE name = %s", [name, name])
+                tracked += cursor.rowcount
+        return tracked
+
+    @classmethod
+    def get_top_authors(cls, hashtag_names, top=None):
+        """Returns the authors with the most tweets of each hashtag, read from the tweets count index."""
+        top = top or settings.LEADERBOARD_SIZE
+        fields = ('id', 'screen_name', 'name', 'profile_image')
+        results = {}
+        tracked = list(Hashtag.objects.filter(pk__in=hashtag_names, reach_tracked=True).values_list('name', flat=True))
+        if tracked:
+            table, _, user_table, _, _ = cls._tables()
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT h.name, {', '.join(f'u.{f}' for f in fields)}, s.tweets_count "
+                               f"FROM unnest(%s::varchar[]) AS h (name) CROSS JOIN LATERAL ("
+                               f"SELECT author_id, tweets_count FROM {table} WHERE hashtag_id = h.name "
+                               f"ORDER BY tweets_count DESC, author_id LIMIT %s) s "
+                               f"JOIN {user_table} u ON u.id = s.author_id "
+                               f"ORDER BY h.name, s.tweets_count DESC, s.author_id", [tracked, top])
+                for name, *values in cursor.fetchall():
+                    results.setdefault(name, []).append(dict(zip(fields + ('tweets',), values)))
+
+        for name in set(hashtag_names) - set(tracked):
+            results[name] = list(User.objects.filter(tweet__hashtags=name).values(*fields).annotate(
+                tweets=Count('tweet')).order_by('-tweets', 'id')[:top])
+        return {name: results.get(name, []) for name in hashtag_names}
+
+    @classmethod
+    def get_reach(cls, hashtag_names, since=None, mode=None):
+        """Sums the followers of the distinct authors of the hashtags, None until they are all tracked.
+
+        Several hashtags are summed in REACH_MODE unless mode is given. In
+        'sketch' mode only the REACH_SKETCH_SIZE authors with the highest
+        priority are read from each hashtag, through the priority index.
+        """
+        hashtag_names = list(hashtag_names)
+        hashtags = Hashtag.objects.filter(pk__in=hashtag_names)
+        if hashtags.filter(reach_tracked=False).exists():
+            return None
+        if len(hashtag_names) == 1 and since is None and mode in (None, 'exact'):
+            # The exact reach of a single hashtag is kept up to date on its row.
+            return hashtags.values_list('reach', flat=True).first() or 0
+        mode = mode or settings.REACH_MODE
+
+        table = cls._tables()[0]
+        where, params = "", []
+        if since is not None:
+            where, params = " AND last_seen >= %s", [since]
+        with connection.cursor() as cursor:
+            if mode == 'exact':
+                cursor.execute(f"SELECT COALESCE(SUM(f), 0) FROM (SELECT MAX(followers_count) AS f "
+                               f"FROM {table} WHERE hashtag_id = ANY(%s){where} GROUP BY author_id) a",
+                               [hashtag_names] + params)
+                return cursor.fetchone()[0]
+            k = settings.REACH_SKETCH_SIZE
+            # The k + 1 highest priorities of a union are among those of each hashtag.
+            cursor.execute(f"SELECT s.author_id, s.followers_count, s.priority "
+                           f"FROM unnest(%s::varchar[]) AS h (name) CROSS JOIN LATERAL ("
+                           f"SELECT author_id, followers_count, priority FROM {table} "
+                           f"WHERE hashtag_id = h.name{where} ORDER BY priority DESC LIMIT %s) s",
+                           [hashtag_names] + params + [k + 1])
+            sample = {author_id: (followers, priority) for author_id, followers, priority in cursor.fetchall()}
+            return sketches.estimate_priority_sum(sample.values(), k)
+
+
+class TopTweet(models.Model):
+    """One of the LEADERBOARD_SIZE most retweeted tweets of a hashtag."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    retweet_count = models.IntegerField("Retweets", default=0)
+
+    class Meta:
+        unique_together = ('hashtag', 'tweet')
+        indexes = [models.Index(fields=['hashtag', '-retweet_count'])]
+
+    def __str__(self):
+        return f"{self.tweet_id} in {self.hashtag_id}: {self.retweet_count}"
+
+    @classmethod
+    def _trim(cls, cursor, hashtag_names):
+        # Drops every row past the leaderboard size, the table never holds more than K rows per hashtag.
+        table = connection.ops.quote_name(cls._meta.db_table)
+        cursor.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM ("
+                       f"SELECT id, ROW_NUMBER() OVER (PARTITION BY hashtag_id "
+                       f"ORDER BY retweet_count DESC, tweet_id DESC) AS rank "
+                       f"FROM {table} WHERE hashtag_id = ANY(%s)) ranked WHERE rank > %s)",
+                       [list(hashtag_names), settings.LEADERBOARD_SIZE])
+
+    @classmethod
+    def add_many(cls, rows):
+        """Offers (hashtag name, tweet id, retweet count) rows to the leaderboards."""
+        table = connection.ops.quote_name(cls._meta.db_table)
+        params = [v for r in rows for v in r]
+        values = ', '.join(['(%s, %s::bigint, %s::int)'] * len(rows))
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table} (hashtag_id, tweet_id, retweet_count) "
+                           f"SELECT hashtag_id, tweet_id, MAX(retweet_count) "
+                           f"FROM (VALUES {values}) v (hashtag_id, tweet_id, retweet_count) "
+                           f"GROUP BY hashtag_id, tweet_id "
+                           f"ON CONFLICT (hashtag_id, tweet_id) DO UPDATE SET "
+                           f"retweet_count = GREATEST({table}.retweet_count, EXCLUDED.retweet_count)", params)
+            cls._trim(cursor, {r[0] for r in rows})
+
+    @classmethod
+    def backfill(cls):
+        """Fills the leaderboards of the hashtags not tracked yet from their stored tweets."""
+        quote = connection.ops.quote_name
+        table, hashtag_table = quote(cls._meta.db_table), quote(Hashtag._meta.db_table)
+        tweet_table, through_table = quote(Tweet._meta.db_table), quote(Tweet.hashtags.through._meta.db_table)
+        tracked = 0
+        for name in Hashtag.objects.filter(leaders_tracked=False).values_list('name', flat=True):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table} (hashtag_id, tweet_id, retweet_count) "
+                               f"SELECT th.hashtag_id, t.id, t.retweet_count "
+                               f"FROM {through_table} th JOIN {tweet_table} t ON t.id = th.tweet_id "
+                               f"WHERE th.hashtag_id = %s AND t.retweeted_id IS NULL "
+                               f"ORDER BY t.retweet_count DESC, t.id DESC LIMIT %s "
+                               f"ON CONFLICT (hashtag_id, tweet_id) DO UPDATE SET "
+                               f"retweet_count = GREATEST({table}.retweet_count, EXCLUDED.retweet_count)",
+                               [name, settings.LEADERBOARD_SIZE])
+                cls._trim(cursor, [name])
+                cursor.execute(f"UPDATE {hashtag_table} SET leaders_tracked = true WHERE name = %s", [name])
+                tracked += cursor.rowcount
+        return tracked
+
+    @classmethod
+    def get_top_tweets(cls, hashtag_names, top=None):
+        """Returns the most retweeted tweets of each hashtag, O(top) per tracked hashtag."""
+        top = top or settings.LEADERBOARD_SIZE
+        results = {}
+        tracked = list(Hashtag.objects.filter(pk__in=hashtag_names, leaders_tracked=True).values_list('name', flat=True))
+        if tracked:
+            rows = cls.objects.filter(hashtag__in=tracked).select_related('tweet__author').order_by(
+                'hashtag', '-retweet_count', '-tweet_id')
+            for row in rows:
+                results.setdefault(row.hashtag_id, []).append(row.tweet)
+
+        for name in set(hashtag_names) - set(tracked):
+            results[name] = list(Tweet.objects.filter(hashtags=name, retweeted=None).select_related(
+                'author').order_by('-retweet_count', '-pk')[:top])
+        return {name: [{'id': t.id,
+                        'screen_name': t.author.screen_name,
+                        'text': t.text,
+                        'retweet_count': t.retweet_count} for t in results.get(name, [])[:top]]
+                for name in hashtag_names}
@@ -0,0 +1,75 @@
+import bisect
+import hashlib
+import math
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of hashtags onto ingest workers.
+
+    Every worker owns `replicas` points of the ring and a hashtag belongs to
+    the worker of the first point after its own hash, so a worker joining or
+    leaving, or a hashtag added or deleted, only moves a few hashtags.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.nodes = sorted(set(nodes))
+        self.replicas = replicas
+        ring = sorted((_hash(f"{node}:{i}"), node) for node in self.nodes for i in range(replicas))
+        self.points = [point for point, _ in ring]
+        self.owners = [node for _, node in ring]
+
+    def owner(self, key):
+        if not self.points:
+            return None
+        return self.owners[bisect.bisect(self.points, _hash(key)) % len(self.points)]
+
+    def assign(self, keys, load_factor=1.0):
+        """Maps every key to a node, none getting more than load_factor times the average, rounded up.
+
+        A key whose node is full goes on to the next node along the ring, so
+        with a handful of hashtags no worker is left idle while another one
+        syncs most of them. The result only depends on the set of keys.
+        """
+        keys = sorted(set(keys), key=lambda k: (_hash(k), k))
+        if not self.points:
+            return {}
+        capacity = max(math.ceil(load_factor * len(keys) / len(self.nodes)), 1)
+        loads, assignment = dict.fromkeys(self.nodes, 0), {}
+        for key in keys:
+            i = bisect.bisect(self.points, _hash(key))
+            while loads[self.owners[i % len(self.points)]] >= capacity:
+                i += 1
+            node = assignment[key] = self.owners[i % len(self.points)]
+            loads[node] += 1
+        return assignment
+
+
+# (this worker, ring of all workers), None while a single process does all the work.
+_shard = None
+
+
+def set_shard(node, nodes):
+    global _shard
+    _shard = (node, HashRing(nodes))
+
+
+def owned(hashtag_names):
+    """The hashtags this worker syncs, out of every monitored hashtag."""
+    if _shard is None:
+        return list(hashtag_names)
+    node, ring = _shard
+    assignment = ring.assign(hashtag_names)
+    return [name for name in hashtag_names if assignment.get(name) == node]
+
+
+def owns(hashtag_name, hashtag_names):
+    return hashtag_name in owned(hashtag_names)
+
+
+def is_leader():
+    """Whether this worker runs the jobs that are not tied to a hashtag."""
+    return _shard is None or _shard[0] == _shard[1].nodes[0]
@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+
+
+class SpaceSaving:
+    """Bounded heavy hitters: keeps at most `capacity` counters.
+
+    A new item evicts the smallest counter and inherits its count as error,
+    so counts are overestimated by at most the error reported with them.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def offer(self, item, count=1):
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            smallest = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(smallest)
+            del self.errors[smallest]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+
+    def top(self, n):
+        """Returns the n heaviest (item, count, error) tuples."""
+        items = sorted(self.counts.items(), key=lambda i: (-i[1], i[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in items]
+
+
+class BurstDetector:
+    """Flags minutes whose count is far above an exponentially weighted baseline.
+
+    Each key keeps the counts of its last `late_minutes` + 1 minutes open, as
+    search pages arrive newest first, and the EWMA mean and variance of the
+    minutes closed before them, so every update is O(1).
+    """
+
+    def __init__(self, alpha=0.1, threshold=4.0, min_count=10, warmup=30, max_gap=24 * 60, late_minutes=10):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        self.warmup = warmup
+        self.max_gap = max_gap
+        self.late_minutes = late_minutes
+        self.states = {}
+
+    def reset(self, key=None):
+        if key is None:
+            self.states = {}
+        else:
+            self.states.pop(key, None)
+
+    def _close(self, state, count):
+        diff = count - state['mean']
+        increment = self.alpha * diff
+        state['mean'] += increment
+        state['variance'] = (1 - self.alpha) * (state['variance'] + diff * increment)
+        state['seen'] += 1
+
+    def add(self, key, minute, count=1):
+        """Adds count to minute, returns a burst event the first time the minute stands out."""
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = {'minute': minute, 'since': minute, 'open': {}, 'mean': 0.0,
+                                        'variance': 0.0, 'seen': 0, 'alerted': set()}
+        if minute < state['minute'] - self.late_minutes:
+            # The minute is part of the baseline already.
+            return None
+        # Nothing was counted before the first minute seen, it must not lower the baseline.
+        state['since'] = min(state['since'], minute)
+        if minute > state['minute']:
+            first, last = max(state['minute'] - self.late_minutes, state['since']), minute - self.late_minutes
+            # Past the open minutes, a long silence only decays the baseline max_gap times.
+            for closed in range(first, min(last, first + self.late_minutes + 1 + self.max_gap)):
+                self._close(state, state['open'].pop(closed, 0))
+            state['open'] = {m: c for m, c in state['open'].items() if m >= last}
+            state['alerted'] = {m for m in state['alerted'] if m >= last}
+            state['minute'] = minute
+        total = state['open'][minute] = state['open'].get(minute, 0) + count
+
+        if state['seen'] < self.warmup or total < self.min_count or minute in state['alerted']:
+            return None
+        # Counts are Poisson-like, never trust a variance below the mean.
+        score = (total - state['mean']) / math.sqrt(max(state['variance'], state['mean'], 1.0))
+        if score < self.threshold:
+            return None
+        state['alerted'].add(minute)
+        return {'key': key, 'minute': minute, 'count': total,
+                'expected': round(state['mean'], 2), 'score': round(score, 2)}
+
+
+def mix64(values):
+    """Spreads integer ids over 64 bits (splitmix64 finalizer), vectorized."""
+    z = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class HyperLogLog:
+    """Distinct counter of integer ids in 2**precision one-byte registers."""
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        if registers is None:
+            self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        else:
+            self.registers = np.frombuffer(bytes(registers), dtype=np.uint8).copy()
+            self.precision = int(math.log2(len(self.registers)))
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    def add_many(self, ids):
+        hashes = mix64(ids)
+        if not len(hashes):
+            return self
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # frexp gives the bit length of the remaining bits, rank is the position of the first 1.
+        rank = (width + 1 - np.frexp(rest.astype(np.float64))[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def estimate_priority_sum(rows, k):
+    """Estimates a sum from the k + 1 (weight, priority) rows with the highest priorities.
+
+    Priority sampling (priority = weight / u with u uniform in (0, 1]): with
+    fewer rows the sample is the whole set and the sum is exact, otherwise
+    each of the k first weights counts as at least the (k + 1)-th priority.
+    """
+    rows = sorted(rows, key=lambda r: -r[1])
+    if len(rows) <= k:
+        return sum(w for w, _ in rows)
+    threshold = rows[k][1]
+    return int(round(sum(max(w, threshold) for w, _ in rows[:k])))
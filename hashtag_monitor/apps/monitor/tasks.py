@@ -1,17 +1,25 @@
+import datetime
+import functools
 import logging
-import json
+import threading
+from contextlib import contextmanager
 
-import tweepy
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
-from django.core import serializers
-from rest_framework.renderers import JSONRenderer
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from . import twitter_utils as twt_utl
+from . import breaker
+from . import events
+from . import twitter_async
+from . import ingest
+from . import jobs
+from . import metrics
 from . import models
 from . import consumers
-from . import serializers
+from . import sharding
+
+
+logger = logging.getLogger(__name__)
 
 
 def singleton(cls, *args, **kw):
@@ -30,31 +38,61 @@ class MonitorScheduler(BackgroundScheduler):
     pass
 
 
+def schedule(scheduler, key, call, priority, minutes):
+    # The scheduler only keeps time, the runs go through the job runner.
+    scheduler.add_job(jobs.RUNNER.submit,
+                      'interval',
+                      args=(key, call, priority),
+                      minutes=minutes,
+                      id=key,
+                      name=key,
+                      replace_existing=True)
+
+
+_start_lock = threading.Lock()
+
+
 def start():
+    with _start_lock:
+        scheduler = MonitorScheduler(daemon=True)
+        if not scheduler.running:
+            _schedule_all(scheduler)
+            scheduler.start()
+    return scheduler
+
+
+def _schedule_all(scheduler):
     if settings.DEBUG:
         logging.basicConfig()
         logging.getLogger('apscheduler').setLevel(logging.DEBUG)
 
-    scheduler = MonitorScheduler(daemon=True)
-    scheduler.add_job(remove_trash_and_sync,
-                      'interval',
-                      minutes=settings.CLEAN_TRASH_FROM_DB_EVERY,
-                      id='db_clean_trash',
-                      name='db_clean_trash',
-                      replace_existing=True)
+    if sharding.is_leader():
+        schedule(scheduler, 'db_clean_trash', remove_trash_and_sync, jobs.MAINTENANCE,
+                 minutes=settings.CLEAN_TRASH_FROM_DB_EVERY)
+        schedule(scheduler, 'roll_up_tweets', roll_up, jobs.MAINTENANCE,
+                 minutes=settings.ROLLUP_TWEETS_EVERY)
+        if settings.REFRESH_RETWEETS_LATEST:
+            schedule(scheduler, 'refresh_retweets', refresh_retweet_counts, jobs.MAINTENANCE,
+                     minutes=settings.REFRESH_RETWEETS_EVERY)
+    schedule(scheduler, 'tweeter_sync', sync_with_tweeter, jobs.LIVE,
+             minutes=settings.POLL_MIN_MINUTES)
 
-    scheduler.add_job(sync_with_tweeter,
-                      'interval',
-                      minutes=settings.TWEETER_SYNC_MINUTES,
-                      id='tweeter_sync',
-                      name='tweeter_sync',
-                      replace_existing=True)
-    scheduler.start()
 
-
-def run_in_background(call, id=None):
+def run_in_background(call, id, priority=jobs.MAINTENANCE):
     assert callable(call)
-    return MonitorScheduler().add_job(call, id=id, name=id, replace_existing=True)
+    return jobs.RUNNER.submit(id, call, priority)
+
+
+def run_later(key, call, priority, retry_at):
+    """Submits the job at retry_at, a time.time() value, instead of holding a worker until then."""
+    metrics.increment('jobs_rescheduled')
+    MonitorScheduler().add_job(jobs.RUNNER.submit,
+                               'date',
+                               args=(key, call, priority),
+                               run_date=datetime.datetime.fromtimestamp(retry_at),
+                               id=f"later_{key}",
+                               name=key,
+                               replace_existing=True)
 
 
 def remove_trash_and_sync():
@@ -63,71 +101,292 @@ def remove_trash_and_sync():
         consumers.sync()
 
 
+def roll_up():
+    models.TweetBucket.roll_up()
+    models.UserSketch.backfill()
+    models.HashtagAuthor.backfill()
+    models.TopTweet.backfill()
+
+
+def fetch_pages(twitter_api, hashtag_name, since_id=None, max_id=None, history_length=None):
+    """Pushes search pages, newest first, to the ingest pipeline and waits until they are written.
+
+    Fetching goes on while earlier pages are written, and stops at the first
+    written page without new tweets. When Twitter is unavailable, the
+    breaker.Unavailable raised tells the max_id and remaining history to
+    resume from.
+    """
+    tickets, remaining = ingest.Pages(), history_length
+    # Backfills and gap resumes share the search quota with the polls.
+    backfill = max_id is not None or history_length is not None
+    while remaining is None or remaining > 0:
+        count = 100 if remaining is None else min(remaining, 100)
+        try:
+            with metrics.timer('twitter_search'):
+                tweets = breaker.call('search_tweets',
+                                      twitter_api.search,
+                                      q=hashtag_name,
+                                      result_type='recent',
+                                      count=count,
+                                      since_id=since_id,
+                                      max_id=max_id)
+        except breaker.Unavailable as e:
+            for ticket in tickets:
+                ticket.wait()
+            e.max_id, e.remaining = max_id, remaining
+            raise
+        tickets.requests += 1
+        if backfill:
+            metrics.mark('backfill_searches')
+        if not tweets['statuses']:
+            break
+        tickets.append(ingest.PIPELINE.submit(hashtag_name, tweets['statuses']))
+        if any(t.done and (t.error or t.dropped or not t.new_tweets) for t in tickets):
+            break
+        if remaining is not None:
+            remaining -= 100
+        max_id = min(t['id'] for t in tweets['statuses']) - 1
+    for ticket in tickets:
+        ticket.wait()
+    return tickets
+
+
+_sync_locks = {}
+_sync_locks_lock = threading.Lock()
+
+
+def acquire_hashtag_sync(hashtag_name):
+    """Returns the sync lock of the hashtag acquired, or None while another sync of it runs."""
+    with _sync_locks_lock:
+        lock = _sync_locks.setdefault(hashtag_name, threading.Lock())
+    if lock.acquire(blocking=False):
+        return lock
+    metrics.increment('sync_skipped')
+    return None
+
+
+@contextmanager
+def hashtag_sync(hashtag_name):
+    """Yields True if the caller may sync the hashtag, False while another sync of it runs."""
+    lock = acquire_hashtag_sync(hashtag_name)
+    try:
+        yield lock is not None
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+# Newest status written per hashtag this process syncs, sparing a query per poll.
+_watermarks = {}
+
+
+def get_since_id(hashtag_name):
+    since_id = _watermarks.get(hashtag_name)
+    if since_id is None:
+        since_id = models.Tweet.get_since_id(hashtag_name=hashtag_name)
+    return since_id
+
+
+def advance_watermark(hashtag_name, since_id, tickets):
+    if any(t.error or t.dropped for t in tickets):
+        # Some page is missing, the tweets written are the only reference left.
+        _watermarks.pop(hashtag_name, None)
+    else:
+        _watermarks[hashtag_name] = max((s['id'] for t in tickets for s in t.statuses), default=since_id)
+
+
+def refetch_dropped(hashtag_name, since_id, tickets):
+    """Backfills the gap left by the pages a full ingest queue dropped, down to since_id.
+
+    The fetch stopped at the first page dropped, so the gap starts at its
+    newest status, and the watermark moving past it would lose it for good.
+    """
+    dropped = [s['id'] for t in tickets if t.dropped for s in t.statuses]
+    if not dropped:
+        return None
+    key = f"gap_{hashtag_name}_{max(dropped)}"
+    return run_in_background(functools.partial(fetch_or_resume, key, jobs.BACKFILL, hashtag_name,
+                                               since_id=since_id, max_id=max(dropped)),
+                             id=key, priority=jobs.BACKFILL)
+
+
+def forget_watermarks(keep):
+    """Drops the watermarks of the hashtags deleted or synced by another worker now."""
+    keep = set(keep)
+    for name in list(_watermarks):
+        if name not in keep:
+            del _watermarks[name]
+
+
 def get_tweets(hashtag_name):
-    twitter_api = twt_utl.get_twitter_api()
-    since_id = models.Tweet.get_since_id(hashtag_name=hashtag_name)
-    tweets = twitter_api.search(q=hashtag_name,
-                                result_type='recent',
-                                count=100,
-                                since_id=since_id)
-    while tweets['statuses']:
+    with hashtag_sync(hashtag_name) as acquired:
+        if not acquired:
+            return []
+        twitter_api = twt_utl.get_twitter_api()
+        since_id = get_since_id(hashtag_name)
+        try:
+            tickets = fetch_pages(twitter_api, hashtag_name, since_id=since_id)
+        except breaker.Unavailable as e:
+            postpone_poll(hashtag_name, since_id, e)
+            return []
+        advance_watermark(hashtag_name, since_id, tickets)
+        refetch_dropped(hashtag_name, since_id, tickets)
+        record_poll(hashtag_name, tickets)
+        return tickets
+
+
+def postpone_poll(hashtag_name, since_id, error):
+    _watermarks.pop(hashtag_name, None)
+    models.Hashtag.postpone_poll(hashtag_name, datetime.datetime.fromtimestamp(error.retry_at))
+    if getattr(error, 'max_id', None) is not None:
+        # The next poll starts after the newest page written, the older pages are left to a backfill.
+        key = f"gap_{hashtag_name}_{error.max_id}"
+        run_later(key, functools.partial(fetch_or_resume, key, jobs.BACKFILL, hashtag_name,
+                                         since_id=since_id, max_id=error.max_id),
+                  jobs.BACKFILL, error.retry_at)
+
+
+def fetch_or_resume(key, priority, hashtag_name, since_id=None, max_id=None, history_length=None, twitter_api=None):
+    """fetch_pages run again later from where it stopped while Twitter is unavailable."""
+    try:
+        tickets = fetch_pages(twitter_api or twt_utl.get_twitter_api(), hashtag_name,
+                              since_id=since_id, max_id=max_id, history_length=history_length)
+    except breaker.Unavailable as e:
+        logger.warning("Fetching %s postponed: %s", hashtag_name, e)
+        run_later(key, functools.partial(fetch_or_resume, key, priority, hashtag_name,
+                                         since_id=since_id, max_id=e.max_id, history_length=e.remaining),
+                  priority, e.retry_at)
+        return []
+    if since_id is not None:
+        # A gap dropped again is fetched again.
+        refetch_dropped(hashtag_name, since_id, tickets)
+    return tickets
+
+
+def record_poll(hashtag_name, tickets):
+    interval = models.Hashtag.record_poll(hashtag_name, sum(len(t.statuses) for t in tickets),
+                                          requests=getattr(tickets, 'requests', len(tickets)),
+                                          reserved=metrics.rate('backfill_searches'))
+    if interval is not None:
+        metrics.observe('poll_interval', interval)
+
+
+def refresh_retweet_counts(twitter_api=None, latest=None):
+    """Looks up the latest tweets of every hashtag again, 100 ids per request, to refresh their retweet counts."""
+    latest = latest or settings.REFRESH_RETWEETS_LATEST
+    ids = set()
+    for name in models.Hashtag.objects.values_list('name', flat=True):
+        ids.update(models.Tweet.get_latest_original_ids(name, latest))
+    if not ids:
+        return 0
+
+    twitter_api = twitter_api or twt_utl.get_twitter_api()
+    ids, updated = sorted(ids), 0
+    for i in range(0, len(ids), 100):
         try:
-            new_tweets = models.Tweet.create_from_json(hashtag_name,
-                                                       *tweets['statuses'])
-        except ObjectDoesNotExist:
+            statuses = breaker.call('statuses_lookup', twitter_api.statuses_lookup, ids[i:i + 100], trim_user=True)
+        except breaker.Unavailable as e:
+            # The next scheduled refresh looks the tweets up again.
+            logger.warning("Retweet counts refresh stopped: %s", e)
             break
-        else:
-            if not new_tweets:
-                break
-            consumers.sync()
-            max_id = new_tweets[-1].id - 1
-            tweets = twitter_api.search(q=hashtag_name,
-                                        result_type='recent',
-                                        count=100,
-                                        since_id=since_id,
-                                        max_id=max_id)
+        updated += models.Tweet.update_retweet_counts({s['id']: s.get('retweet_count', 0) for s in statuses})
+    if updated:
+        consumers.sync()
+    return updated
 
 
 def sync_with_tweeter():
-    for hashtag in models.Hashtag.objects.all():
-        run_in_background(lambda: get_tweets(hashtag.name),
-                          id=f"sync_{hashtag.name}")
+    # The whole set of hashtags decides the shards, so that adding or deleting one rebalances them.
+    owned = set(sharding.owned(list(models.Hashtag.objects.values_list('name', flat=True))))
+    forget_watermarks(owned)
+    names = [name for name in models.Hashtag.get_due_for_poll() if name in owned]
+    if settings.TWITTER_ASYNC:
+        for name in names:
+            lock = acquire_hashtag_sync(name)
+            if lock is None:
+                continue
+            try:
+                since_id = get_since_id(name)
+            except BaseException:
+                lock.release()
+                raise
+            run_on_loop(f"synced_{name}", twitter_async.fetch_pages(name, since_id=since_id),
+                        functools.partial(finish_poll, name, since_id, lock), jobs.LIVE)
+        return
+    for name in names:
+        # Each job carries its own hashtag, a closure over the loop variable would not.
+        run_in_background(functools.partial(get_tweets, name),
+                          id=f"sync_{name}",
+                          priority=jobs.LIVE)
+
+
+def run_on_loop(key, coroutine, callback, priority):
+    """Runs the coroutine on the Twitter event loop, then callback(result or exception) as a job.
+
+    No job thread waits on Twitter meanwhile, rate limits included.
+    """
+    def done(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = e
+        jobs.RUNNER.submit(key, functools.partial(callback, result), priority)
+    twitter_async.LOOP.run(coroutine).add_done_callback(done)
+
+
+def finish_poll(hashtag_name, since_id, lock, result):
+    try:
+        if isinstance(result, breaker.Unavailable):
+            postpone_poll(hashtag_name, since_id, result)
+        elif isinstance(result, Exception):
+            _watermarks.pop(hashtag_name, None)
+            logger.error("Syncing %s failed.", hashtag_name, exc_info=result)
+        else:
+            advance_watermark(hashtag_name, since_id, result)
+            refetch_dropped(hashtag_name, since_id, result)
+            record_poll(hashtag_name, result)
+    finally:
+        lock.release()
+
+
+def backfill_on_loop(key, hashtag_name, max_id=None, history_length=None):
+    """fetch_or_resume on the Twitter event loop."""
+    def done(result):
+        if isinstance(result, breaker.Unavailable):
+            logger.warning("Fetching %s postponed: %s", hashtag_name, result)
+            run_later(key, functools.partial(backfill_on_loop, key, hashtag_name,
+                                             max_id=result.max_id, history_length=result.remaining),
+                      jobs.BACKFILL, result.retry_at)
+        elif isinstance(result, Exception):
+            logger.error("Fetching %s failed.", hashtag_name, exc_info=result)
+    run_on_loop(f"{key}_done", twitter_async.fetch_pages(hashtag_name, max_id=max_id, history_length=history_length),
+                done, jobs.BACKFILL)
+
+
+def rebalance():
+    """Syncs right away, so a new hashtag is polled by its worker without waiting for the next tick."""
+    return run_in_background(sync_with_tweeter, 'tweeter_sync', priority=jobs.LIVE)
+
+
+def request_backfill(hashtag_name, history_length, job_name):
+    """Backfills the hashtag in this process, or in the ingest worker when there is one."""
+    if settings.INGEST_WORKER:
+        return events.publish('backfill', hashtag_name=hashtag_name, history_length=history_length, job_name=job_name)
+    return get_remaining_tweets_in_background(twt_utl.get_twitter_api(), hashtag_name, history_length, job_name)
+
+
+def request_remove_trash():
+    if settings.INGEST_WORKER:
+        return events.publish('remove_trash')
+    return run_in_background(remove_trash_and_sync, "remove_trash_from_view")
 
 
 def get_remaining_tweets_in_background(twitter_api, hashtag_name, history_length, job_name, max_id=None):
     def run_task():
-        count = 100
-        max_tweets = history_length
-        if max_tweets is not None:
-            assert max_tweets > 0
-            count = min(max_tweets, 100)
-            max_tweets -= 100
-
-        tweets = twitter_api.search(q=hashtag_name,
-                                    result_type='recent',
-                                    count=count,
-                                    max_id=max_id)
-        while tweets['statuses']:
-            try:
-                new_tweets = models.Tweet.create_from_json(hashtag_name,
-                                                           *tweets['statuses'])
-            except ObjectDoesNotExist:
-                break
-            else:
-                if not new_tweets:
-                    break
-
-                consumers.sync()
-
-                if max_tweets is not None:
-                    count = min(max_tweets, 100)
-                    max_tweets -= 100
-
-                if count <= 0:
-                    break
-
-                tweets = twitter_api.search(q=hashtag_name,
-                                            result_type='recent',
-                                            count=count,
-                                            max_id=new_tweets[-1].id - 1)
-    return run_in_background(run_task, id=job_name)
+        if history_length is not None:
+            assert history_length > 0
+        if settings.TWITTER_ASYNC:
+            return backfill_on_loop(job_name, hashtag_name, max_id=max_id, history_length=history_length)
+        return fetch_or_resume(job_name, jobs.BACKFILL, hashtag_name, max_id=max_id,
+                               history_length=history_length, twitter_api=twitter_api)
+    return run_in_background(run_task, id=job_name, priority=jobs.BACKFILL)
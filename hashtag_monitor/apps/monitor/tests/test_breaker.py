@@ -0,0 +1,79 @@
+import tweepy
+from django.test import SimpleTestCase
+from mock import Mock, patch
+
+from .. import breaker
+from .. import metrics
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        metrics.clear()
+        self.now = 1000.0
+        patcher = patch.object(breaker, 'time', Mock(time=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = breaker.CircuitBreaker('search_tweets', threshold=3, backoff=10, max_backoff=60)
+
+    def fail(self, error=None):
+        def call():
+            raise error or tweepy.TweepError("Failed to send request")
+        with self.assertRaises(breaker.Unavailable) as cm:
+            self.breaker.call(call)
+        return cm.exception.retry_at - self.now
+
+    def test_backoff_must_grow_exponentially_with_jitter_up_to_the_maximum(self):
+        self.breaker.threshold = 10
+        delays = [self.fail() for _ in range(6)]
+        for delay, base in zip(delays, [10, 20, 40, 60, 60, 60]):
+            self.assertGreaterEqual(delay, base * 0.5)
+            self.assertLessEqual(delay, base * 1.5)
+        self.assertEqual(6, metrics.snapshot()['counters']['twitter_failures_search_tweets'])
+        self.assertFalse(self.breaker.is_open)
+
+    def test_circuit_must_open_after_threshold_and_fail_fast(self):
+        func = Mock(return_value={'statuses': []})
+        self.fail()
+        self.fail()
+        self.assertEqual({'statuses': []}, self.breaker.call(func))
+        self.assertFalse(self.breaker.is_open)
+
+        for _ in range(3):
+            retry_in = self.fail()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(breaker.Unavailable):
+            self.breaker.call(func)
+        self.assertEqual(1, func.call_count)
+        self.assertEqual(1, metrics.snapshot()['counters']['twitter_rejected_search_tweets'])
+
+        # Once the backoff is over a single trial call goes through and closes the circuit.
+        self.now += retry_in
+        self.breaker.call(func)
+        self.assertFalse(self.breaker.is_open)
+        self.assertAlmostEqual(retry_in, metrics.snapshot()['timers']['twitter_circuit_open_time_search_tweets']['total'],
+                               places=3)
+
+    def test_failed_trial_must_open_the_circuit_again(self):
+        for _ in range(3):
+            retry_in = self.fail()
+        self.now += retry_in
+        self.fail()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(breaker.Unavailable):
+            self.breaker.call(Mock())
+
+    def test_rate_limit_must_open_the_circuit_until_the_reset(self):
+        error = tweepy.RateLimitError("Rate limit exceeded",
+                                      FakeResponse(429, {'x-rate-limit-reset': str(int(self.now) + 600)}))
+        retry_in = self.fail(error)
+        self.assertGreaterEqual(retry_in, 600)
+        self.assertLessEqual(retry_in, 605)
+        self.assertTrue(self.breaker.is_open)
+        self.assertNotIn('twitter_failures_search_tweets', metrics.snapshot()['counters'])
+        self.assertEqual(1, metrics.snapshot()['counters']['twitter_rate_limited_search_tweets'])
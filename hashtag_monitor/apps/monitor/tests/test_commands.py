@@ -0,0 +1,137 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+import pytz
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
+from mock import patch
+
+from ..models import Tweet, User, Hashtag, _USER_PROFILE_HASHES
+from .. import events
+
+
+def status(id, user_id=1, text="Test", hashtags=()):
+    d = pytz.utc.localize(datetime.datetime.utcnow())
+    return {
+        "id": id,
+        "text": text,
+        "created_at": d.strftime("%a %b %d %H:%M:%S %z %Y"),
+        'entities': {'hashtags': [{'text': h} for h in hashtags]},
+        "user": {
+            'id': user_id,
+            'name': "test",
+            'screen_name': "stest",
+            'created_at': d.strftime("%a %b %d %H:%M:%S %z %Y")
+        }
+    }
+
+
+class ImportTweetsTests(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".ndjson")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, *lines):
+        with open(self.path, 'w') as f:
+            for l in lines:
+                f.write(l if isinstance(l, str) else json.dumps(l))
+                f.write("\n")
+
+    def test_import_must_create_tweets(self):
+        h = Hashtag.objects.create(name="#Test")
+        self.write(status(1), status(2, user_id=2), status(3, hashtags=["test"]))
+        call_command('import_tweets', self.path, hashtag=h.name, workers=0,
+                     batch_size=2, stdout=StringIO())
+        self.assertEqual(3, Tweet.objects.count())
+        self.assertEqual(2, User.objects.count())
+        self.assertEqual(3, h.tweet_set.count())
+
+    def test_import_must_match_hashtags_without_hashtag_option(self):
+        h = Hashtag.objects.create(name="#Test")
+        self.write(status(1), status(2, hashtags=["TEST"]))
+        call_command('import_tweets', self.path, workers=0, stdout=StringIO())
+        self.assertEqual(2, Tweet.objects.count())
+        self.assertEqual([2], [t.id for t in h.tweet_set.all()])
+
+    def test_import_must_skip_invalid_lines(self):
+        self.write(status(1), "{not json", status(2))
+        out = StringIO()
+        call_command('import_tweets', self.path, workers=1, stdout=out)
+        self.assertEqual(2, Tweet.objects.count())
+        self.assertIn("1 invalid lines", out.getvalue())
+
+    def test_import_must_skip_statuses_that_cannot_be_converted(self):
+        malformed = status(2)
+        del malformed['created_at']
+        self.write(status(1), malformed, [3], status(4))
+        out = StringIO()
+        call_command('import_tweets', self.path, workers=1, stdout=out)
+        self.assertEqual([1, 4], sorted(Tweet.objects.values_list('pk', flat=True)))
+        self.assertIn("skipped 2 invalid lines and 0 failed statuses", out.getvalue())
+
+    def test_import_must_write_the_rest_of_a_batch_a_status_fails_in(self):
+        malformed = status(2)
+        del malformed['text']
+        self.write(status(1), malformed, status(3))
+        out, err = StringIO(), StringIO()
+        call_command('import_tweets', self.path, workers=0, batch_size=3, stdout=out, stderr=err)
+        self.assertEqual([1, 3], sorted(Tweet.objects.values_list('pk', flat=True)))
+        self.assertIn("skipped 0 invalid lines and 1 failed statuses", out.getvalue())
+        self.assertIn("status 2", err.getvalue())
+
+    def test_import_must_skip_statuses_that_fail_validation(self):
+        invalid = dict(status(2), lang="en-gb")
+        self.write(status(1), invalid, status(3))
+        out, err = StringIO(), StringIO()
+        call_command('import_tweets', self.path, workers=0, stdout=out, stderr=err)
+        self.assertEqual([1, 3], sorted(Tweet.objects.values_list('pk', flat=True)))
+        self.assertIn("skipped 0 invalid lines and 1 failed statuses", out.getvalue())
+        self.assertIn("status 2", err.getvalue())
+
+    def test_import_must_resume_from_offset(self):
+        first = json.dumps(status(1)) + "\n"
+        self.write(first, status(2))
+        call_command('import_tweets', self.path, workers=0,
+                     offset=len(first.encode()), stdout=StringIO())
+        self.assertEqual([2], [t.id for t in Tweet.objects.all()])
+
+    def test_import_must_report_offset_to_resume(self):
+        self.write(status(1), status(2))
+        out = StringIO()
+        call_command('import_tweets', self.path, workers=0, batch_size=1, stdout=out)
+        self.assertIn(f"--offset {os.path.getsize(self.path)}", out.getvalue())
+
+    def test_import_unknown_hashtag_must_raise_exception(self):
+        self.write(status(1))
+        with self.assertRaises(CommandError):
+            call_command('import_tweets', self.path, hashtag="#Unknown", workers=0)
+
+
+class ImportEventsTests(TransactionTestCase):
+    def test_import_must_announce_its_rows_to_the_other_processes(self):
+        _USER_PROFILE_HASHES.clear()
+        h = Hashtag.objects.create(name="#Test")
+        fd, path = tempfile.mkstemp(suffix=".ndjson")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps(status(1)) + "\n")
+        published = []
+        with patch.object(events, "publish", lambda kind, **data: published.append(kind)):
+            call_command('import_tweets', path, hashtag=h.name, workers=0, stdout=StringIO())
+        self.assertIn('live', published)
+        self.assertIn('sync', published)
+        self.assertFalse(events.PUBLISH)
+
+
+class RunIngestTests(TestCase):
+    @override_settings(INGEST_WORKER=False)
+    def test_worker_must_refuse_to_run_beside_web_schedulers(self):
+        with self.assertRaises(CommandError):
+            call_command('run_ingest', processes=1)
@@ -0,0 +1,109 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from ..models import Tweet, User, Hashtag, _USER_PROFILE_HASHES
+from .. import dashboard
+from .. import data_version
+from .. import livestore
+from ..twitter_utils import TWITTER_TIME_FORMAT
+
+
+def twitter_time(value):
+    return value.strftime(TWITTER_TIME_FORMAT.replace("%z", "+0000"))
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        livestore.STORE.clear()
+        self.h1 = Hashtag.objects.create(name="#Test")
+        self.h2 = Hashtag.objects.create(name="#Test2")
+        a1 = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        t1 = Tweet.objects.create(id=1, author=a1, created_at=datetime.datetime.now(), text="a")
+        t2 = Tweet.objects.create(id=2, author=a1, created_at=datetime.datetime.now(), text="b")
+        t1.hashtags.add(self.h1)
+        t2.hashtags.add(self.h2)
+
+    def test_payload_must_filter_by_hashtag(self):
+        payload = dashboard.get_payload(self.h1.name)
+        self.assertEqual(self.h1.name, payload['selected_hashtag'])
+        self.assertEqual([1], [t['id'] for t in payload['tweets']])
+        self.assertEqual(2, len(payload['hashtags']))
+
+    def test_payload_must_be_shared_until_data_changes(self):
+        dashboard.get_payload()
+        with self.assertNumQueries(0):
+            dashboard.get_payload()
+        Hashtag.objects.create(name="#Test3")
+        self.assertEqual(3, len(dashboard.get_payload()['hashtags']))
+
+    def test_tweets_per_lang_must_be_cached_until_next_ingest(self):
+        self.assertEqual({'others': 1}, dashboard.get_tweets_per_lang(3, self.h1.name))
+        with self.assertNumQueries(0):
+            dashboard.get_tweets_per_lang(3, self.h1.name)
+        Tweet.objects.filter(pk=1).update(lang='pt')
+        self.assertEqual({'others': 1}, dashboard.get_tweets_per_lang(3, self.h1.name))
+        data_version.bump_data_version()
+        self.assertEqual({'pt': 1, 'others': 0}, dashboard.get_tweets_per_lang(3, self.h1.name))
+
+    def test_chart_must_match_database_when_read_from_live_store(self):
+        expected = Tweet.get_hashtag_tweets_per_period(bucket='1h', periods=24)
+        dashboard.get_live_store()
+        with self.assertNumQueries(1):
+            chart = dashboard.get_tweets_per_period(bucket='1h', periods=24)
+        self.assertEqual(expected, chart)
+
+    def test_chart_must_fall_back_to_database_outside_live_store(self):
+        store = livestore.STORE
+        livestore.STORE = livestore.RingStore(60)
+        try:
+            chart = dashboard.get_tweets_per_period(bucket='1d', periods=2)
+        finally:
+            livestore.STORE = store
+        self.assertEqual([0, 1], list(chart[self.h1.name]['values'].values()))
+
+
+class LiveStoreIngestTests(TransactionTestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+        livestore.STORE.clear()
+
+    def test_committed_tweets_must_reach_live_store(self):
+        h = Hashtag.objects.create(name="#Test")
+        dashboard.get_live_store()
+        status = {
+            "id": 1,
+            "text": "Test",
+            "created_at": twitter_time(timezone.now()),
+            'entities': {'hashtags': []},
+            "user": {'id': 1, 'name': "T", 'screen_name': "T", 'followers_count': 10,
+                     'created_at': twitter_time(timezone.now())}
+        }
+        with transaction.atomic():
+            Tweet.create_from_json(h.name, status)
+            self.assertNotIn(h.name, livestore.STORE.series)
+        self.assertEqual(1, livestore.STORE.series[h.name][0].sum())
+        self.assertEqual(10, livestore.STORE.series[h.name][2].sum())
+
+    def test_payload_read_before_commit_must_not_be_cached_under_the_new_version(self):
+        h = Hashtag.objects.create(name="#Test")
+        dashboard.get_payload()
+        status = {
+            "id": 1,
+            "text": "Test",
+            "created_at": twitter_time(timezone.now()),
+            'entities': {'hashtags': []},
+            "user": {'id': 1, 'name': "T", 'screen_name': "T", 'created_at': twitter_time(timezone.now())}
+        }
+        version = data_version.get_data_version()
+        with transaction.atomic():
+            Tweet.create_from_json(h.name, status)
+            dashboard.get_payload()
+            self.assertEqual(version, data_version.get_data_version())
+        self.assertGreater(data_version.get_data_version(), version)
+        self.assertEqual([1], [t['id'] for t in dashboard.get_payload()['tweets']])
@@ -0,0 +1,87 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase
+from mock import patch
+
+from .. import dbpool
+from .. import metrics
+
+
+class ConnectionPoolTests(TestCase):
+    def setUp(self):
+        metrics.clear()
+        # Every thread's connection reads the same settings dict.
+        patcher = patch.dict(connection.settings_dict, CONN_MAX_AGE=60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_in_thread(self, call):
+        thread = threading.Thread(target=call)
+        thread.start()
+        thread.join()
+
+    def test_job_must_reuse_its_thread_connection(self):
+        pool = dbpool.ConnectionPool(2)
+        seen = []
+
+        def job():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                seen.append(cursor.fetchone()[0])
+
+        def run_twice():
+            pool.job(job)()
+            pool.job(job)()
+            connection.close()
+
+        self.run_in_thread(run_twice)
+        self.assertEqual(1, len(set(seen)))
+        self.assertEqual(0, pool.in_use)
+        self.assertEqual(2, metrics.snapshot()['timers']['job_job']['count'])
+
+    def test_pool_must_bound_concurrent_jobs(self):
+        pool = dbpool.ConnectionPool(1)
+        started, release = threading.Event(), threading.Event()
+        peak = []
+
+        def slow():
+            started.set()
+            peak.append(pool.in_use)
+            release.wait(5)
+
+        first = threading.Thread(target=pool.job(slow))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=pool.job(lambda: peak.append(pool.in_use)))
+        second.start()
+        second.join(0.2)
+        self.assertTrue(second.is_alive())
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual([1, 1], peak)
+        snapshot = metrics.snapshot()
+        self.assertEqual(0, snapshot['gauges']['db_pool_in_use'])
+        self.assertEqual(2, snapshot['timers']['db_pool_wait']['count'])
+        self.assertGreater(snapshot['timers']['db_pool_wait']['max'], 0.1)
+
+    def test_unusable_connection_must_be_replaced(self):
+        pool = dbpool.ConnectionPool(1)
+        pids = []
+
+        def job():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                pids.append(cursor.fetchone()[0])
+
+        def run():
+            pool.job(job)()
+            # The server drops the idle connection between two jobs.
+            connection.connection.close()
+            pool.job(job)()
+            connection.close()
+
+        self.run_in_thread(run)
+        self.assertEqual(2, len(set(pids)))
+        self.assertEqual(1, metrics.snapshot()['counters']['db_connections_unusable'])
@@ -0,0 +1,82 @@
+import datetime
+import json
+import queue
+
+from django.db import connection
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from mock import patch
+
+from .. import consumers
+from .. import events
+from .. import livestore
+from .. import trends
+
+
+class LiveEventsTests(SimpleTestCase):
+    def setUp(self):
+        livestore.STORE.clear()
+        trends.clear()
+
+    def publish_live(self, rows, co_hashtags):
+        published = []
+        with patch.object(events, 'publish', lambda kind, **data: published.append(json.loads(json.dumps(data)))):
+            events.publish_live(rows, co_hashtags)
+        return published
+
+    def test_live_rows_must_be_summed_per_minute_and_split_under_the_payload_limit(self):
+        created_at = datetime.datetime(2019, 12, 1, 10, 30, 15)
+        rows = [("#Test", created_at, 1, 0, 10)] * 3 + [(f"#Test{i}", created_at, 1, 1, 5) for i in range(500)]
+        published = self.publish_live(rows, [("#Test", "#Other")] * 2)
+
+        self.assertGreater(len(published), 2)
+        for data in published:
+            self.assertLess(len(json.dumps(data)), events.MAX_PAYLOAD + 100)
+        parsed = [events.parse_live(data) for data in published]
+        rows = [row for r, _ in parsed for row in r]
+        self.assertEqual(501, len(rows))
+        self.assertIn(("#Test", datetime.datetime(2019, 12, 1, 10, 30), 3, 0, 30), rows)
+        self.assertEqual([("#Test", "#Other", 2)], [pair for _, c in parsed for pair in c])
+
+    def test_applied_live_event_must_feed_the_store_and_trends(self):
+        now = datetime.datetime.utcnow()
+        livestore.STORE.seed([], now=now)
+        for data in self.publish_live([("#Test", now, 1, 0, 10)] * 2, [("#Test", "#Other")]):
+            consumers.apply_live(data)
+        self.assertEqual({"#Test": [["#Other", 1]]}, trends.get_co_hashtags())
+        self.assertEqual(2, int(livestore.STORE.series["#Test"][0].sum()))
+
+
+class ListenerTests(TransactionTestCase):
+    def test_listener_must_receive_events_from_other_connections(self):
+        received = queue.Queue()
+        listener = events.Listener({'sync': received.put}, on_connect=lambda: received.put('connected'), timeout=0.1)
+        listener.start()
+        self.addCleanup(listener.stop)
+        self.assertEqual('connected', received.get(timeout=5))
+
+        events.publish('ignored')
+        events.publish('sync', version=2)
+        self.assertEqual({'version': 2}, received.get(timeout=5))
+
+    def test_listener_must_skip_the_events_of_its_own_process(self):
+        received = queue.Queue()
+        listener = events.Listener({'sync': received.put}, on_connect=lambda: received.put('connected'),
+                                   timeout=0.1, ignore_own=True)
+        listener.start()
+        self.addCleanup(listener.stop)
+        self.assertEqual('connected', received.get(timeout=5))
+
+        events.publish('sync', version=1)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)",
+                           [events.CHANNEL, json.dumps({'kind': 'sync', 'sender': "web.2:42", 'version': 2})])
+        self.assertEqual({'version': 2}, received.get(timeout=5))
+        self.assertTrue(received.empty())
+
+    @override_settings(EVENTS_DATABASE_URL=None, DATABASE_POOL_MODE='transaction')
+    def test_listener_must_refuse_a_database_pooled_by_transaction(self):
+        listener = events.Listener({'sync': print})
+        with self.assertRaises(ImproperlyConfigured):
+            listener.start()
+        self.assertIsNone(listener.thread)
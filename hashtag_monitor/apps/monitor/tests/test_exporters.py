@@ -0,0 +1,45 @@
+import datetime
+import gzip
+import json
+
+from django.test import SimpleTestCase
+
+from .. import exporters
+
+
+class ExportersTests(SimpleTestCase):
+    def rows(self, n):
+        return ({f: i for f in exporters.EXPORT_FIELDS} for i in range(n))
+
+    def test_columns_must_split_rows_in_chunks(self):
+        chunks = list(exporters.export_tweets(self.rows(5), fmt='columns', chunk_size=2))
+        lines = [json.loads(c) for c in chunks]
+        self.assertEqual([2, 2, 1], [l['rows'] for l in lines])
+        self.assertEqual([4], lines[-1]['columns']['id'])
+
+    def test_csv_must_write_header_once(self):
+        content = b"".join(exporters.export_tweets(self.rows(3), fmt='csv'))
+        lines = content.decode().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual(",".join(exporters.EXPORT_FIELDS), lines[0])
+
+    def test_encoders_must_only_write_the_fields_asked_for(self):
+        fields = ['id', 'text']
+        lines = list(exporters.encode_ndjson(self.rows(2), fields=fields))
+        self.assertEqual([{'id': 1, 'text': 1}], [json.loads(l) for l in lines][1:])
+        content = b"".join(exporters.encode_csv(self.rows(2), fields=fields)).decode()
+        self.assertEqual(["id,text", "0,0", "1,1"], content.splitlines())
+
+    def test_gzip_must_be_equivalent_to_plain_content(self):
+        plain = b"".join(exporters.export_tweets(self.rows(100)))
+        compressed = b"".join(exporters.export_tweets(self.rows(100), compress=True))
+        self.assertEqual(plain, gzip.decompress(compressed))
+
+    def test_unknown_format_must_raise_exception(self):
+        with self.assertRaises(ValueError):
+            exporters.export_tweets(self.rows(1), fmt='xml')
+
+    def test_parse_date_range_must_include_last_day(self):
+        since, until = exporters.parse_date_range("2019-12-20", "2019-12-21")
+        self.assertEqual(datetime.datetime(2019, 12, 20), since)
+        self.assertEqual(datetime.datetime(2019, 12, 22), until)
@@ -0,0 +1,73 @@
+import datetime
+import threading
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from mock import patch
+
+from ..models import Tweet, Hashtag, _USER_PROFILE_HASHES
+from .. import ingest
+from .. import metrics
+from .test_dashboard import twitter_time
+
+
+def status(id):
+    created_at = twitter_time(datetime.datetime.utcnow())
+    return {"id": id, "text": "Test", "created_at": created_at, 'entities': {'hashtags': []},
+            "user": {'id': 1, 'name': "T", 'screen_name': "T", 'created_at': created_at}}
+
+
+@patch("hashtag_monitor.apps.monitor.consumers.sync")
+class IngestPipelineTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.clear()
+        _USER_PROFILE_HASHES.clear()
+        Hashtag.objects.create(name="#Test")
+        Hashtag.objects.create(name="#Test2")
+
+    def test_writer_must_write_pages_from_concurrent_fetchers(self, sync_mock):
+        pipeline = ingest.IngestPipeline(2, batch_statuses=50)
+        self.addCleanup(pipeline.stop)
+        tickets = []
+
+        def fetch(name, first):
+            for page in range(5):
+                tickets.append(pipeline.submit(name, [status(first + page * 10 + i) for i in range(10)]))
+
+        fetchers = [threading.Thread(target=fetch, args=(name, first))
+                    for name, first in (("#Test", 0), ("#Test2", 1000))]
+        for fetcher in fetchers:
+            fetcher.start()
+        for fetcher in fetchers:
+            fetcher.join()
+        for ticket in tickets:
+            self.assertTrue(ticket.wait(10))
+
+        self.assertEqual(100, Tweet.objects.count())
+        self.assertEqual(50, Tweet.objects.filter(hashtags="#Test2").count())
+        self.assertEqual(100, sum(len(t.new_tweets) for t in tickets))
+        snapshot = metrics.snapshot()
+        self.assertEqual(100, snapshot['counters']['ingest_statuses'])
+        self.assertEqual(10, snapshot['timers']['ingest_wait']['count'])
+        # Pages waiting in line are coalesced into fewer writes and syncs.
+        self.assertLessEqual(snapshot['timers']['ingest_write']['count'], 10)
+        self.assertEqual(snapshot['timers']['ingest_write']['count'], sync_mock.call_count)
+
+    def test_full_queue_must_drop_pages_after_timeout(self, sync_mock):
+        pipeline = ingest.IngestPipeline(1, put_timeout=0.05)
+        pipeline.start = lambda: None
+        first = pipeline.submit("#Test", [status(1)])
+        second = pipeline.submit("#Test", [status(2)])
+        self.assertFalse(first.done)
+        self.assertTrue(second.dropped)
+        self.assertEqual(1, metrics.snapshot()['counters']['ingest_dropped_pages'])
+        self.assertEqual(1, metrics.snapshot()['gauges']['ingest_queue_depth'])
+
+    def test_deleted_hashtag_must_fail_its_tickets_only(self, sync_mock):
+        pipeline = ingest.IngestPipeline(0)
+        Hashtag.objects.filter(pk="#Test").delete()
+        ticket = pipeline.submit("#Test", [status(1)])
+        self.assertIsNotNone(ticket.error)
+        self.assertEqual([], pipeline.submit("#Test2", []).new_tweets)
+        self.assertEqual(1, len(pipeline.submit("#Test2", [status(2)]).new_tweets))
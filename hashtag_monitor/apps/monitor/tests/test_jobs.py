@@ -0,0 +1,74 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from .. import jobs
+from .. import metrics
+
+
+class JobRunnerTests(SimpleTestCase):
+    def setUp(self):
+        metrics.clear()
+        self.runner = jobs.JobRunner(1)
+        self.done = []
+        # Holds the single worker until the test has queued everything.
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+
+    def record(self, name):
+        return lambda: self.done.append(name)
+
+    def block(self):
+        self.runner.submit('blocker', self.gate.wait, jobs.LIVE)
+        while 'blocker' not in self.runner.running:
+            time.sleep(0.01)
+
+    def test_jobs_must_run_most_urgent_first(self):
+        self.block()
+        self.runner.submit('trash', self.record('trash'), jobs.MAINTENANCE)
+        self.runner.submit('backfill', self.record('backfill'), jobs.BACKFILL)
+        self.runner.submit('sync', self.record('sync'), jobs.LIVE)
+        self.gate.set()
+        self.assertTrue(self.runner.wait(5))
+        self.assertEqual(['sync', 'backfill', 'trash'], self.done)
+        self.assertEqual(2, metrics.snapshot()['timers']['job_wait_live']['count'])
+
+    def test_jobs_must_be_timed_per_kind(self):
+        for key in ["sync_#Test", "synced_#Test2", "populate_#Test", "gap_#Test_42", "gap_#Test_42_done",
+                    "roll_up_tweets", "db_clean_trash"]:
+            self.runner.submit(key, self.record(key))
+        self.assertTrue(self.runner.wait(5))
+        timers = metrics.snapshot()['timers']
+        self.assertEqual({'job_sync': 2, 'job_populate': 1, 'job_gap': 2, 'job_rollup': 1, 'job_maintenance': 1},
+                         {name: t['count'] for name, t in timers.items() if name.startswith('job_') and not name.startswith('job_wait')})
+
+    def test_queued_key_must_be_merged_with_the_most_urgent_priority(self):
+        self.block()
+        self.runner.submit('backfill', self.record('backfill'), jobs.BACKFILL)
+        self.runner.submit('sync', self.record('first sync'), jobs.MAINTENANCE)
+        self.runner.submit('sync', self.record('second sync'), jobs.LIVE)
+        self.gate.set()
+        self.assertTrue(self.runner.wait(5))
+        self.assertEqual(['second sync', 'backfill'], self.done)
+        self.assertEqual(1, metrics.snapshot()['counters']['jobs_merged'])
+
+    def test_running_key_must_run_once_more_after_the_current_run(self):
+        self.block()
+        self.runner.submit('blocker', self.record('rerun'), jobs.MAINTENANCE)
+        self.runner.submit('blocker', self.record('rerun'), jobs.MAINTENANCE)
+        self.gate.set()
+        self.assertTrue(self.runner.wait(5))
+        self.assertEqual(['rerun'], self.done)
+
+    def test_failed_job_must_not_stop_the_worker(self):
+        def fail():
+            raise ValueError()
+
+        with self.assertLogs('hashtag_monitor.apps.monitor.jobs', 'ERROR'):
+            self.runner.submit('fail', fail)
+            self.runner.submit('ok', self.record('ok'))
+            self.assertTrue(self.runner.wait(5))
+        self.assertEqual(['ok'], self.done)
+        self.assertEqual(1, metrics.snapshot()['counters']['jobs_failed'])
+        self.assertEqual(2, metrics.snapshot()['timers']['job_maintenance']['count'])
@@ -0,0 +1,51 @@
+import datetime
+
+from django.test import SimpleTestCase
+
+from .. import livestore
+
+
+class RingStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2020, 1, 10, 12, 7, 30)
+        self.store = livestore.RingStore(10)
+
+    def minutes_ago(self, n):
+        return self.now - datetime.timedelta(minutes=n)
+
+    def starts(self, n):
+        return [self.now.replace(second=0) - datetime.timedelta(minutes=i) for i in range(n - 1, -1, -1)]
+
+    def test_record_must_wait_for_seed(self):
+        self.store.record([('#a', self.now, 1, 0, 10)])
+        self.assertFalse(self.store.covers(self.now, now=self.now))
+        self.store.seed([('#a', self.now, 2, 1, 10)], now=self.now)
+        self.store.record([('#a', self.now, 1, 0, 5)])
+        self.assertEqual([3], self.store.counts('tweets', self.starts(1), '1m', ['#a'])['#a'].tolist())
+        self.assertEqual([15], self.store.counts('reach', self.starts(1), '1m', ['#a'])['#a'].tolist())
+
+    def test_advance_must_recycle_old_minutes(self):
+        self.store.seed([('#a', self.minutes_ago(i), 1, 0, 0) for i in range(10)], now=self.now)
+        self.assertEqual([1] * 10, self.store.counts('tweets', self.starts(10), '1m', ['#a'])['#a'].tolist())
+
+        later = self.now + datetime.timedelta(minutes=3)
+        self.assertTrue(self.store.covers(later - datetime.timedelta(minutes=9), now=later))
+        self.assertFalse(self.store.covers(later - datetime.timedelta(minutes=10), now=later))
+        starts = [later.replace(second=0) - datetime.timedelta(minutes=i) for i in range(9, -1, -1)]
+        self.assertEqual([1] * 7 + [0] * 3, self.store.counts('tweets', starts, '1m', ['#a'])['#a'].tolist())
+
+    def test_add_must_ignore_minutes_out_of_the_buffer(self):
+        self.store.seed([('#a', self.minutes_ago(10), 1, 0, 0), ('#a', self.minutes_ago(0), 1, 0, 0)],
+                        now=self.now)
+        self.assertEqual(1, self.store.series['#a'][0].sum())
+
+    def test_counts_must_downsample_and_skip_unwritten_minutes(self):
+        store = livestore.RingStore(20)
+        start = datetime.datetime(2020, 1, 10, 12, 0)
+        # 11:48 and 11:49 share their slots with 12:08 and 12:09, which are not written yet.
+        rows = [('#a', start + datetime.timedelta(minutes=i), 1, 0, 0) for i in range(-12, -10)]
+        rows += [('#a', start + datetime.timedelta(minutes=i), 1, 0, 0) for i in range(8)]
+        store.seed(rows, now=start + datetime.timedelta(minutes=7))
+        counts = store.counts('tweets', [start, start + datetime.timedelta(minutes=5)], '5m', ['#a', '#b'])
+        self.assertEqual([5, 3], counts['#a'].tolist())
+        self.assertEqual([0, 0], counts['#b'].tolist())
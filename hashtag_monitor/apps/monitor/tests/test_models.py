@@ -2,13 +2,16 @@ import datetime
 import random
 import pytz
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.db import transaction, connection
 from django.db.utils import IntegrityError
+from django.test.utils import CaptureQueriesContext
+from mock import patch
 
 # Create your tests here.
-from ..models import Tweet, User, Hashtag, COLORS_PALETTE
+from ..models import Tweet, User, Hashtag, TweetBucket, UserSketch, HashtagAuthor, TopTweet, COLORS_PALETTE, _USER_PROFILE_HASHES, trusted_writes
 
 
 class HashtagTests(TestCase):
@@ -149,6 +152,66 @@ class HashtagTests(TestCase):
         h = Hashtag.objects.create(name="#Test")
         self.assertIn(h.color, COLORS_PALETTE)
 
+    def test_hashtag_color_must_only_be_picked_on_creation(self):
+        self.assertIsNone(Hashtag(name="#Test").color)
+        color = Hashtag.objects.create(name="#Test").color
+        with patch("random.choice") as choice_mock:
+            self.assertEqual(color, Hashtag.objects.get(pk="#Test").color)
+            self.assertEqual([color], [h.color for h in Hashtag.objects.all()])
+        self.assertFalse(choice_mock.called)
+
+    @override_settings(TWEETER_SYNC_MINUTES=30, POLL_MIN_MINUTES=1, POLL_MAX_MINUTES=240,
+                       SEARCH_REQUESTS_PER_MINUTE=100)
+    def test_poll_interval_must_follow_the_arrival_rate(self):
+        Hashtag.objects.create(name="#Busy")
+        Hashtag.objects.create(name="#Quiet")
+        now = datetime.datetime(2019, 12, 1)
+        self.assertEqual(["#Busy", "#Quiet"], sorted(Hashtag.get_due_for_poll(now)))
+
+        # Several pages per poll shorten the interval, at most 4 times per poll.
+        self.assertEqual(7.5, Hashtag.record_poll("#Busy", 1000, now=now))
+        self.assertEqual(3.75, Hashtag.record_poll("#Busy", 200, now=now))
+        # A half filled page or nothing at all lengthens it, at most twice per poll.
+        self.assertEqual(60, Hashtag.record_poll("#Quiet", 50, now=now))
+        self.assertEqual(120, Hashtag.record_poll("#Quiet", 0, now=now))
+        self.assertEqual(240, Hashtag.record_poll("#Quiet", 0, now=now))
+        self.assertEqual(240, Hashtag.record_poll("#Quiet", 0, now=now))
+
+        self.assertEqual([], Hashtag.get_due_for_poll(now))
+        self.assertEqual(["#Busy"], Hashtag.get_due_for_poll(now + datetime.timedelta(minutes=4)))
+        self.assertEqual(now + datetime.timedelta(minutes=240), Hashtag.objects.get(pk="#Quiet").next_poll)
+        self.assertIsNone(Hashtag.record_poll("#Deleted", 0, now=now))
+
+    @override_settings(TWEETER_SYNC_MINUTES=30, POLL_MIN_MINUTES=1, POLL_MAX_MINUTES=240,
+                       SEARCH_REQUESTS_PER_MINUTE=1)
+    def test_poll_intervals_must_stay_within_the_request_budget(self):
+        names = [f"#Test{i}" for i in range(4)]
+        for name in names:
+            Hashtag.objects.create(name=name)
+        for _ in range(5):
+            for name in names:
+                Hashtag.record_poll(name, 1000)
+        demand = sum(1 / h.poll_interval for h in Hashtag.objects.all())
+        self.assertLessEqual(demand, 1 + 1e-9)
+        self.assertGreaterEqual(min(h.poll_interval for h in Hashtag.objects.all()), 1)
+
+    @override_settings(TWEETER_SYNC_MINUTES=30, POLL_MIN_MINUTES=1, POLL_MAX_MINUTES=240,
+                       SEARCH_REQUESTS_PER_MINUTE=4)
+    def test_poll_intervals_must_budget_every_search_request_and_backfills(self):
+        names = [f"#Test{i}" for i in range(4)]
+        for name in names:
+            Hashtag.objects.create(name=name)
+        for _ in range(5):
+            for name in names:
+                # Five pages per poll, while backfills search once a minute.
+                Hashtag.record_poll(name, 500, requests=5, reserved=1)
+        demand = sum(h.poll_requests / h.poll_interval for h in Hashtag.objects.all())
+        self.assertLessEqual(demand, 3 + 1e-9)
+        self.assertGreater(demand, 2.5)
+        # Backfills never leave the polls less than half of the budget.
+        Hashtag.record_poll("#Test0", 500, requests=5, reserved=10)
+        self.assertLessEqual(Hashtag.objects.get(pk="#Test0").poll_interval, 5 / (2 / 4) + 1e-9)
+
 
 class UserTests(TestCase):
     def test_url_too_long_must_raise_exception(self):
@@ -1068,6 +1131,23 @@ class TweetTests(TestCase):
         self.assertEqual(2, query['en'])
         self.assertEqual(1, query['others'])
 
+    def test_get_top_tweets_per_lang_must_use_one_query(self):
+        a1 = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        for i, lang in enumerate(['en', 'en', 'en', 'und', 'und', 'pt', 'pt', 'fr', 'es'], 1):
+            Tweet.objects.create(id=i, author=a1, created_at=datetime.datetime.now(), text="a", lang=lang)
+
+        with self.assertNumQueries(1):
+            query = Tweet.get_tweets_per_lang(top=3)
+
+        self.assertEqual(['en', 'pt', 'others'], list(query))
+        self.assertEqual(3, query['en'])
+        self.assertEqual(2, query['pt'])
+        self.assertEqual(4, query['others'])
+
+    def test_get_tweets_per_lang_when_tweets_are_empty(self):
+        self.assertEqual({'others': 0}, Tweet.get_tweets_per_lang(top=3))
+
     def test_get_hashtag_tweets_per_day(self):
         h1 = Hashtag.objects.create(name="#Test")
         h2 = Hashtag.objects.create(name="#Test2")
@@ -1186,10 +1266,10 @@ class TweetTests(TestCase):
                                   created_at=datetime.datetime.now(),
                                   text="a")
         summary = Tweet.get_summary()
-        self.assertEqual(followers_count*3, summary['reach'])
+        self.assertEqual(followers_count*2, summary['reach'])
         self.assertEqual(3, summary['tweets_count'])
         self.assertEqual(1, summary['retweet_count'])
-        self.assertEqual(3, summary['users'])
+        self.assertEqual(2, summary['users'])
 
     def test_get_summary_for_hashtag(self):
         followers_count = 100
@@ -1226,10 +1306,10 @@ class TweetTests(TestCase):
                                   text="a")
         t4.hashtags.add(h2)
         summary = Tweet.get_summary(h1.name)
-        self.assertEqual(followers_count*2, summary['reach'])
+        self.assertEqual(followers_count, summary['reach'])
         self.assertEqual(2, summary['tweets_count'])
         self.assertEqual(1, summary['retweet_count'])
-        self.assertEqual(2, summary['users'])
+        self.assertEqual(1, summary['users'])
 
     def test_get_latest_tweets_must_exclude_tweets_without_hashtag(self):
         h1 = Hashtag.objects.create(name="#Test")
@@ -1309,3 +1389,476 @@ class TweetTests(TestCase):
         tweets = Tweet.get_latest_tweets(
             count=100, hashtag_name=h2.name)
         self.assertEqual(1, len(tweets))
+
+
+class ExportTests(TransactionTestCase):
+    def test_export_must_read_its_cursor_in_a_transaction(self):
+        h = Hashtag.objects.create(name="#Test")
+        author = User.objects.create(id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        for i in range(3):
+            Tweet.objects.create(id=i, author=author, created_at=datetime.datetime.now(), text="a").hashtags.add(h)
+        rows = Tweet.iter_for_export(h.name, ['id'], chunk_size=2)
+        self.assertEqual({'id': 0}, next(rows))
+        self.assertTrue(connection.in_atomic_block)
+        self.assertEqual([1, 2], [r['id'] for r in rows])
+        self.assertFalse(connection.in_atomic_block)
+
+
+class UserUpsertTests(TransactionTestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+
+    def tearDown(self):
+        _USER_PROFILE_HASHES.clear()
+
+    def user_json(self, id, name="test", followers_count=0):
+        d = pytz.utc.localize(datetime.datetime(2015, 1, 1))
+        return {
+            'id': id,
+            'name': name,
+            'screen_name': "stest",
+            'followers_count': followers_count,
+            'created_at': d.strftime("%a %b %d %H:%M:%S %z %Y")
+        }
+
+    def test_upsert_must_create_and_update_users(self):
+        User.objects.create(id=1, name="Old", screen_name="T",
+                            created_at=datetime.datetime.now())
+        User.upsert_many_from_json(self.user_json(1), self.user_json(2))
+        self.assertEqual(2, User.objects.count())
+        self.assertEqual("test", User.objects.get(pk=1).name)
+        self.assertEqual(datetime.date(2015, 1, 1), User.objects.get(pk=2).created_at)
+
+    def test_upsert_must_write_duplicated_users_once(self):
+        with self.assertNumQueries(1):
+            written = User.upsert_many_from_json(self.user_json(1, followers_count=10),
+                                                 self.user_json(1, followers_count=5))
+        self.assertEqual(1, written)
+        self.assertEqual(10, User.objects.get(pk=1).followers_count)
+
+    def test_users_deleted_by_another_process_must_be_written_again(self):
+        h = Hashtag.objects.create(name="#Test")
+        status = {"id": 1, "text": "Test", "created_at": self.user_json(1)['created_at'],
+                  'entities': {'hashtags': []}, "user": self.user_json(1)}
+        Tweet.write_from_json(h.name, status)
+        self.assertIn(1, _USER_PROFILE_HASHES)
+        # This process still remembers writing the user.
+        Tweet.objects.all().delete()
+        User.objects.all().delete()
+        self.assertEqual(1, len(Tweet.write_from_json(h.name, dict(status, id=2))))
+        self.assertTrue(User.objects.filter(pk=1).exists())
+
+    def test_upsert_must_skip_unchanged_users(self):
+        User.upsert_many_from_json(self.user_json(1), self.user_json(2))
+        with self.assertNumQueries(0):
+            written = User.upsert_many_from_json(self.user_json(1), self.user_json(2))
+        self.assertEqual(0, written)
+
+        with self.assertNumQueries(1):
+            written = User.upsert_many_from_json(self.user_json(1, followers_count=3),
+                                                 self.user_json(2))
+        self.assertEqual(1, written)
+        self.assertEqual(3, User.objects.get(pk=1).followers_count)
+
+    def test_upsert_must_rewrite_users_of_rolled_back_batches(self):
+        try:
+            with transaction.atomic():
+                User.upsert_many_from_json(self.user_json(1))
+                raise IntegrityError()
+        except IntegrityError:
+            pass
+        self.assertEqual(1, User.upsert_many_from_json(self.user_json(1)))
+        self.assertEqual(1, User.objects.count())
+
+    def test_create_from_json_must_upsert_nested_authors_once(self):
+        h = Hashtag.objects.create(name="#Test")
+        d = pytz.utc.localize(datetime.datetime.utcnow())
+        original = {
+            "id": 1,
+            "text": "Test",
+            "created_at": d.strftime("%a %b %d %H:%M:%S %z %Y"),
+            'entities': {'hashtags': []},
+            "user": self.user_json(1)
+        }
+        retweets = [{
+            "id": i,
+            "text": "RT Test",
+            "created_at": d.strftime("%a %b %d %H:%M:%S %z %Y"),
+            'entities': {'hashtags': []},
+            "retweeted_status": original,
+            "user": self.user_json(2)
+        } for i in range(2, 5)]
+        Tweet.create_from_json(h.name, *retweets)
+        self.assertEqual(4, Tweet.objects.count())
+        self.assertEqual(2, User.objects.count())
+        self.assertEqual(1, Tweet.objects.get(pk=1).author_id)
+
+
+class TrustedWritesTests(TestCase):
+    def status(self, id, user_id):
+        d = pytz.utc.localize(datetime.datetime.utcnow())
+        return {
+            "id": id,
+            "text": "Test",
+            "created_at": d.strftime("%a %b %d %H:%M:%S %z %Y"),
+            'entities': {'hashtags': []},
+            "user": {
+                'id': user_id,
+                'name': "test",
+                'screen_name': "stest",
+                'created_at': d.strftime("%a %b %d %H:%M:%S %z %Y")
+            }
+        }
+
+    def test_trusted_tweet_save_must_not_validate_relations_with_queries(self):
+        author = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        with trusted_writes(), self.assertNumQueries(1):
+            Tweet.objects.create(id=1, author_id=author.id,
+                                 created_at=datetime.datetime.now(), text="a")
+
+    def test_trusted_save_must_validate_structure(self):
+        author = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        with trusted_writes(), self.assertRaises(ValidationError) as cm:
+            Tweet.objects.create(id=1, author=author, created_at=datetime.datetime.now(),
+                                 text="", lang="1234")
+        self.assertIn('lang', cm.exception.message_dict)
+        self.assertIn('text', cm.exception.message_dict)
+
+    def test_trusted_hashtag_save_must_skip_query_validators(self):
+        with trusted_writes(), self.assertNumQueries(1):
+            Hashtag.objects.create(name="#Test")
+        with trusted_writes(), self.assertRaises(ValidationError):
+            Hashtag.objects.create(name="Test")
+
+    def test_untrusted_save_must_keep_full_validation(self):
+        with trusted_writes():
+            pass
+        Hashtag.objects.create(name="#Test")
+        with self.assertRaises(ValidationError):
+            Hashtag.objects.create(name="#TEST")
+
+    def test_create_from_json_must_save_queries_with_trusted_writes(self):
+        h = Hashtag.objects.create(name="#Test")
+        page = [self.status(i, i % 10) for i in range(100)]
+        with CaptureQueriesContext(connection) as untrusted:
+            with patch("hashtag_monitor.apps.monitor.models.clean_structure",
+                       lambda instance: instance.full_clean()):
+                Tweet.create_from_json(h.name, *page)
+        Tweet.objects.all().delete()
+        with CaptureQueriesContext(connection) as trusted:
+            Tweet.create_from_json(h.name, *page)
+        self.assertGreaterEqual(len(untrusted) - len(trusted), 200)
+
+
+class TweetBucketTests(TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2020, 1, 10, 12, 7, 30)
+        self.h1 = Hashtag.objects.create(name="#Test")
+        self.h2 = Hashtag.objects.create(name="#Test2")
+        self.author = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=self.now)
+
+    def tweet(self, id, created_at, *hashtags):
+        t = Tweet.objects.create(id=id, author=self.author, created_at=created_at, text="a")
+        t.hashtags.add(*hashtags)
+        return t
+
+    def test_get_hashtag_tweets_per_day_must_include_today(self):
+        self.tweet(1, datetime.datetime.now(), self.h1)
+        query = Tweet.get_hashtag_tweets_per_day(num_days=1)
+        date = datetime.datetime.now().strftime("%d/%m")
+        self.assertEqual({date: 1}, query[self.h1.name]["values"])
+        self.assertEqual({date: 0}, query[self.h2.name]["values"])
+
+    def test_get_hashtag_tweets_per_day_must_not_merge_years(self):
+        self.tweet(1, self.now - datetime.timedelta(days=366), self.h1)
+        query = Tweet.get_hashtag_tweets_per_period(bucket='1d', periods=400, end=self.now)
+        values = query[self.h1.name]["values"]
+        self.assertEqual(400, len(values))
+        self.assertEqual(1, values["09/01/2019"])
+        self.assertEqual(0, values["10/01/2020"])
+
+    def test_count_per_bucket_must_zero_fill_minutes(self):
+        self.tweet(1, self.now, self.h1)
+        self.tweet(2, self.now - datetime.timedelta(minutes=3), self.h1, self.h2)
+        self.tweet(3, self.now - datetime.timedelta(minutes=5), self.h1)
+        starts, counts = Tweet.count_per_bucket(bucket='5m', periods=3, end=self.now)
+        self.assertEqual([datetime.datetime(2020, 1, 10, 11, 55),
+                          datetime.datetime(2020, 1, 10, 12, 0),
+                          datetime.datetime(2020, 1, 10, 12, 5)], starts)
+        self.assertEqual([0, 2, 1], counts[self.h1.name].tolist())
+        self.assertEqual([0, 1, 0], counts[self.h2.name].tolist())
+
+    def test_count_per_bucket_must_count_tweets_of_several_hashtags_once(self):
+        self.tweet(1, self.now, self.h1, self.h2)
+        self.tweet(2, self.now, self.h1)
+        _, counts = Tweet.count_per_bucket(bucket='5m', periods=1, end=self.now,
+                                           hashtag_names=[self.h1.name, self.h2.name])
+        self.assertEqual([2], counts[self.h1.name].tolist())
+        self.assertEqual([1], counts[self.h2.name].tolist())
+
+    def test_count_per_bucket_must_skip_tweets_without_hashtags(self):
+        self.tweet(1, self.now, self.h1)
+        self.tweet(2, self.now)
+        _, counts = Tweet.count_per_bucket(bucket='5m', periods=1, end=self.now)
+        self.assertEqual({self.h1.name: [1]}, {name: c.tolist() for name, c in counts.items()})
+
+    def test_count_per_bucket_must_read_rollup_and_recent_tweets(self):
+        for i in range(10):
+            self.tweet(i, self.now - datetime.timedelta(minutes=i), self.h1)
+        expected = Tweet.count_per_bucket(bucket='1m', periods=10, end=self.now)[1]
+
+        self.assertEqual(2, TweetBucket.roll_up(until=self.now - datetime.timedelta(minutes=4)))
+        self.assertEqual(5, TweetBucket.objects.filter(hashtag=self.h1).count())
+        with self.assertNumQueries(2):
+            _, counts = Tweet.count_per_bucket(bucket='1m', periods=10, end=self.now)
+        self.assertEqual(expected[self.h1.name].tolist(), counts[self.h1.name].tolist())
+
+        # Only the rollup is read for the older minutes.
+        Tweet.objects.filter(id=9).delete()
+        _, counts = Tweet.count_per_bucket(bucket='1m', periods=10, end=self.now)
+        self.assertEqual(1, counts[self.h1.name][0])
+
+    def test_roll_up_must_only_aggregate_new_minutes(self):
+        self.tweet(1, self.now - datetime.timedelta(minutes=10), self.h1)
+        TweetBucket.roll_up(until=self.now - datetime.timedelta(minutes=5))
+        self.tweet(2, self.now - datetime.timedelta(minutes=2), self.h1)
+        TweetBucket.roll_up(until=self.now)
+        self.assertEqual([1, 1], list(TweetBucket.objects.order_by('start').values_list('count', flat=True)))
+        self.assertEqual(0, TweetBucket.roll_up(until=self.now))
+
+    def test_create_from_json_must_invalidate_rollup_for_late_tweets(self):
+        TweetBucket.roll_up(until=self.now)
+        late = self.now - datetime.timedelta(minutes=30)
+        status = {
+            "id": 1,
+            "text": "Test",
+            "created_at": pytz.utc.localize(late).strftime("%a %b %d %H:%M:%S %z %Y"),
+            'entities': {'hashtags': []},
+            "user": {'id': 1, 'name': "T", 'screen_name': "T",
+                     'created_at': "Wed Oct 10 20:19:24 +0000 2018"}
+        }
+        Tweet.create_from_json(self.h1.name, status)
+        self.h1.refresh_from_db()
+        self.h2.refresh_from_db()
+        self.assertEqual(late.replace(second=0), self.h1.rolled_up_until.replace(tzinfo=None))
+        self.assertEqual(self.now.replace(second=0), self.h2.rolled_up_until)
+
+        _, counts = Tweet.count_per_bucket(bucket='1h', periods=2, end=self.now)
+        self.assertEqual([1, 0], counts[self.h1.name].tolist())
+
+
+class UserSketchTests(TestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+        self.h1 = Hashtag.objects.create(name="#Test")
+        self.h2 = Hashtag.objects.create(name="#Test2")
+
+    def status(self, id, user_id, created_at, *hashtags):
+        return {
+            "id": id,
+            "text": "Test",
+            "created_at": pytz.utc.localize(created_at).strftime("%a %b %d %H:%M:%S %z %Y"),
+            'entities': {'hashtags': [{'text': h} for h in hashtags]},
+            "user": {'id': user_id, 'name': "T", 'screen_name': "T",
+                     'created_at': "Wed Oct 10 20:19:24 +0000 2018"}
+        }
+
+    def test_ingest_must_sketch_authors_per_day(self):
+        day = datetime.datetime(2020, 1, 10, 12)
+        Tweet.create_from_json(self.h1.name, *[self.status(i, i % 100, day, "Test2") for i in range(300)])
+        Tweet.create_from_json(self.h1.name, *[self.status(1000 + i, i, day - datetime.timedelta(days=1))
+                                               for i in range(150)])
+        self.assertEqual(3, UserSketch.objects.count())
+        self.assertEqual(2, UserSketch.backfill())
+        self.assertAlmostEqual(150, UserSketch.count_users([self.h1.name, self.h2.name]), delta=150 * 0.05)
+        self.assertAlmostEqual(100, UserSketch.count_users([self.h2.name]), delta=100 * 0.05)
+
+    def test_count_users_must_merge_days_and_hashtags(self):
+        day = datetime.datetime(2020, 1, 10, 12)
+        UserSketch.add_authors([(self.h1.name, day.date(), i) for i in range(2000)])
+        UserSketch.add_authors([(self.h1.name, day.date() - datetime.timedelta(days=1), i) for i in range(1000, 3000)])
+        UserSketch.add_authors([(self.h2.name, day.date(), i) for i in range(2500, 4000)])
+        Hashtag.objects.update(users_sketched=True)
+        self.assertAlmostEqual(3000, UserSketch.count_users([self.h1.name]), delta=3000 * 0.05)
+        self.assertAlmostEqual(4000, UserSketch.count_users([self.h1.name, self.h2.name]), delta=4000 * 0.05)
+        self.assertAlmostEqual(2000, UserSketch.count_users([self.h1.name], since=day.date()), delta=2000 * 0.05)
+
+    def test_add_authors_must_skip_unchanged_sketches(self):
+        day = datetime.date(2020, 1, 10)
+        self.assertEqual(1, UserSketch.add_authors([(self.h1.name, day, 1)]))
+        self.assertEqual(0, UserSketch.add_authors([(self.h1.name, day, 1)]))
+
+    def test_get_summary_must_count_distinct_users_from_sketches(self):
+        author = User.objects.create(id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        for i in range(3):
+            Tweet.objects.create(id=i, author=author, created_at=datetime.datetime.now(), text="a").hashtags.add(self.h1)
+        self.assertIsNone(UserSketch.count_users([self.h1.name]))
+        self.assertEqual(1, Tweet.get_summary(self.h1.name)['users'])
+
+        self.assertEqual(2, UserSketch.backfill())
+        self.assertEqual(1, UserSketch.objects.count())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(1, Tweet.get_summary(self.h1.name)['users'])
+            self.assertEqual(1, Tweet.get_summary()['users'])
+        self.assertFalse(any('DISTINCT' in q['sql'] for q in queries))
+
+
+class HashtagAuthorTests(TestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+        self.h1 = Hashtag.objects.create(name="#Test")
+        self.h2 = Hashtag.objects.create(name="#Test2")
+        Hashtag.objects.update(reach_tracked=True)
+
+    def status(self, id, user_id, followers_count, *hashtags):
+        return {
+            "id": id,
+            "text": "Test",
+            "created_at": "Fri Jan 10 12:00:00 +0000 2020",
+            'entities': {'hashtags': [{'text': h} for h in hashtags]},
+            "user": {'id': user_id, 'name': "T", 'screen_name': "T", 'followers_count': followers_count,
+                     'created_at': "Wed Oct 10 20:19:24 +0000 2018"}
+        }
+
+    def reach(self, hashtag):
+        hashtag.refresh_from_db()
+        return hashtag.reach
+
+    def test_reach_must_count_each_author_once(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, 1, 1000000) for i in range(50)])
+        Tweet.create_from_json(self.h1.name, self.status(50, 2, 10, "Test2"))
+        self.assertEqual(1000010, self.reach(self.h1))
+        self.assertEqual(10, self.reach(self.h2))
+        self.assertEqual(1000010, HashtagAuthor.get_reach([self.h1.name, self.h2.name]))
+        self.assertEqual(1000010, Tweet.get_summary()['reach'])
+
+    def test_reach_must_follow_follower_changes(self):
+        Tweet.create_from_json(self.h1.name, self.status(1, 1, 100, "Test2"), self.status(2, 2, 10))
+        Tweet.create_from_json(None, self.status(3, 1, 150))
+        self.assertEqual(160, self.reach(self.h1))
+        self.assertEqual(150, self.reach(self.h2))
+        self.assertEqual(150, HashtagAuthor.objects.get(hashtag=self.h2, author_id=1).followers_count)
+
+    def test_reach_of_every_hashtag_must_not_sum_all_their_authors(self):
+        Tweet.create_from_json(self.h1.name, self.status(1, 1, 100, "Test2"), self.status(2, 2, 10))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(110, HashtagAuthor.get_reach([self.h1.name, self.h2.name]))
+            self.assertEqual(110, HashtagAuthor.get_reach([self.h1.name]))
+        self.assertFalse([q for q in queries.captured_queries if "GROUP BY" in q['sql']])
+
+    def test_get_reach_must_filter_by_last_tweet(self):
+        Tweet.create_from_json(self.h1.name, self.status(1, 1, 100))
+        since = datetime.datetime(2020, 1, 10, 12, 1)
+        self.assertEqual(0, HashtagAuthor.get_reach([self.h1.name], since=since))
+        self.assertEqual(100, HashtagAuthor.get_reach([self.h1.name], since=since - datetime.timedelta(days=1)))
+
+    def test_sketch_mode_must_estimate_reach(self):
+        with self.settings(REACH_SKETCH_SIZE=256):
+            users = [User(id=i, name="T", screen_name="T", created_at=datetime.date(2020, 1, 1),
+                          followers_count=i % 100) for i in range(1, 5001)]
+            User.objects.bulk_create(users)
+            HashtagAuthor.add_many([(self.h1.name, u.id, datetime.datetime(2020, 1, 1)) for u in users])
+            exact = HashtagAuthor.get_reach([self.h1.name], mode='exact')
+            self.assertEqual(sum(u.followers_count for u in users), exact)
+            self.assertAlmostEqual(exact, HashtagAuthor.get_reach([self.h1.name], mode='sketch'), delta=exact * 0.15)
+            # Below the sketch size every author is read and the sum is exact.
+            HashtagAuthor.add_many([(self.h2.name, u.id, datetime.datetime(2020, 1, 1)) for u in users[:100]])
+            self.assertEqual(4950, HashtagAuthor.get_reach([self.h2.name], mode='sketch'))
+
+    def test_backfill_must_index_existing_authors(self):
+        Hashtag.objects.update(reach_tracked=False)
+        author = User.objects.create(id=1, name="T", screen_name="T", created_at=datetime.datetime.now(),
+                                     followers_count=10)
+        for i in range(3):
+            Tweet.objects.create(id=i, author=author, created_at=datetime.datetime.now(), text="a").hashtags.add(self.h1)
+        self.assertIsNone(HashtagAuthor.get_reach([self.h1.name]))
+        self.assertEqual(2, HashtagAuthor.backfill())
+        self.assertEqual(10, self.reach(self.h1))
+        self.assertEqual(0, self.reach(self.h2))
+        self.assertEqual(10, HashtagAuthor.get_reach([self.h1.name, self.h2.name]))
+        self.assertEqual(3, HashtagAuthor.objects.get(hashtag=self.h1, author=author).tweets_count)
+
+    def test_top_authors_must_count_tweets_per_hashtag(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, 1 + i % 3, 10) for i in range(10)])
+        Tweet.create_from_json(self.h1.name, self.status(10, 3, 10, "Test2"))
+        Tweet.create_from_json(self.h1.name, self.status(10, 3, 10, "Test2"))
+        with self.assertNumQueries(2):
+            top = HashtagAuthor.get_top_authors([self.h1.name, self.h2.name], top=2)
+        self.assertEqual([(1, 4), (3, 4)], [(a['id'], a['tweets']) for a in top[self.h1.name]])
+        self.assertEqual([(3, 1)], [(a['id'], a['tweets']) for a in top[self.h2.name]])
+
+    def test_top_authors_must_fall_back_to_tweets_until_tracked(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, 1 + i % 3, 10) for i in range(10)])
+        expected = HashtagAuthor.get_top_authors([self.h1.name], top=2)
+        Hashtag.objects.update(reach_tracked=False)
+        self.assertEqual(expected, HashtagAuthor.get_top_authors([self.h1.name], top=2))
+
+
+@override_settings(LEADERBOARD_SIZE=3)
+class TopTweetTests(TestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+        self.h1 = Hashtag.objects.create(name="#Test")
+        self.h2 = Hashtag.objects.create(name="#Test2")
+        Hashtag.objects.update(leaders_tracked=True)
+
+    def status(self, id, retweet_count, *hashtags, retweeted=None):
+        status = {
+            "id": id,
+            "text": "Test",
+            "created_at": "Fri Jan 10 12:00:00 +0000 2020",
+            "retweet_count": retweet_count,
+            'entities': {'hashtags': [{'text': h} for h in hashtags]},
+            "user": {'id': 1, 'name': "T", 'screen_name': "T",
+                     'created_at': "Wed Oct 10 20:19:24 +0000 2018"}
+        }
+        if retweeted:
+            status['retweeted_status'] = retweeted
+        return status
+
+    def top(self, hashtag):
+        return [(t['id'], t['retweet_count']) for t in TopTweet.get_top_tweets([hashtag.name])[hashtag.name]]
+
+    def test_leaderboard_must_keep_the_most_retweeted_tweets(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, i * 10) for i in range(1, 6)])
+        self.assertEqual([(5, 50), (4, 40), (3, 30)], self.top(self.h1))
+        self.assertEqual(3, TopTweet.objects.filter(hashtag=self.h1).count())
+
+    def test_leaderboard_must_follow_retweet_counts(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, i * 10) for i in range(1, 6)])
+        # A retweet carries the new retweet count of its original tweet.
+        Tweet.create_from_json(self.h1.name, self.status(100, 0, retweeted=self.status(1, 45)))
+        self.assertEqual(45, Tweet.objects.get(pk=1).retweet_count)
+        self.assertEqual([(5, 50), (1, 45), (4, 40)], self.top(self.h1))
+        self.assertEqual([], self.top(self.h2))
+
+    def test_read_must_not_depend_on_corpus_size(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, i) for i in range(1, 50)])
+        with self.assertNumQueries(2):
+            TopTweet.get_top_tweets([self.h1.name, self.h2.name])
+
+    def test_backfill_must_fill_untracked_leaderboards(self):
+        Hashtag.objects.update(leaders_tracked=False)
+        Tweet.create_from_json(self.h1.name, *[self.status(i, i * 10, "Test2") for i in range(1, 6)])
+        TopTweet.objects.all().delete()
+        expected = self.top(self.h1)
+        self.assertEqual(2, TopTweet.backfill())
+        self.assertEqual(expected, self.top(self.h1))
+        self.assertEqual([(5, 50), (4, 40), (3, 30)], self.top(self.h2))
+        self.assertEqual(6, TopTweet.objects.count())
+
+    def test_update_retweet_counts_must_only_raise_counts(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, 10) for i in range(1, 4)])
+        self.assertEqual(1, Tweet.update_retweet_counts({1: 5, 2: 60, 3: 10, 99: 100}))
+        self.assertEqual([10, 60, 10], list(Tweet.objects.order_by('pk').values_list('retweet_count', flat=True)))
+        self.assertEqual((2, 60), self.top(self.h1)[0])
+
+    def test_reappearing_tweets_must_refresh_counts_in_one_statement(self):
+        Tweet.create_from_json(self.h1.name, *[self.status(i, 0) for i in range(1, 4)])
+        with CaptureQueriesContext(connection) as queries:
+            Tweet.create_from_json(self.h1.name, *[self.status(i, i) for i in range(1, 4)])
+        self.assertEqual(1, sum(q['sql'].startswith('WITH updated AS (UPDATE') for q in queries.captured_queries))
+        self.assertEqual([1, 2, 3], list(Tweet.objects.order_by('pk').values_list('retweet_count', flat=True)))
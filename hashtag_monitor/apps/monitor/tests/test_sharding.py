@@ -0,0 +1,56 @@
+import math
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from .. import sharding
+
+
+class HashRingTests(SimpleTestCase):
+    def setUp(self):
+        self.names = [f"#Test{i}" for i in range(1000)]
+        self.addCleanup(setattr, sharding, '_shard', None)
+
+    def test_hashtags_must_be_spread_across_nodes(self):
+        ring = sharding.HashRing(range(4))
+        owners = [ring.owner(name) for name in self.names]
+        for node in range(4):
+            self.assertGreater(owners.count(node), 150)
+        self.assertIsNone(sharding.HashRing().owner("#Test"))
+
+    def test_new_node_must_only_take_hashtags_over(self):
+        before = sharding.HashRing(range(4))
+        after = sharding.HashRing(range(5))
+        moved = [name for name in self.names if before.owner(name) != after.owner(name)]
+        self.assertEqual({4}, {after.owner(name) for name in moved})
+        self.assertLess(len(moved), 300)
+
+    def test_each_hashtag_must_have_exactly_one_owner(self):
+        owners = []
+        for node in range(3):
+            sharding.set_shard(node, range(3))
+            owners.append(set(sharding.owned(self.names)))
+        self.assertEqual(set(self.names), set.union(*owners))
+        self.assertEqual(len(self.names), sum(len(o) for o in owners))
+        self.assertFalse(sharding.is_leader())
+        sharding.set_shard(0, range(3))
+        self.assertTrue(sharding.is_leader())
+
+    def test_single_process_must_own_everything(self):
+        self.assertTrue(sharding.owns("#Test", ["#Test"]))
+        self.assertTrue(sharding.is_leader())
+
+    def test_a_few_hashtags_must_still_keep_every_node_busy(self):
+        ring = sharding.HashRing(range(4))
+        for count in (4, 8, 10):
+            loads = Counter(ring.assign(self.names[:count]).values())
+            self.assertEqual(set(range(4)), set(loads))
+            self.assertLessEqual(max(loads.values()), math.ceil(count / 4))
+
+    def test_adding_or_deleting_a_hashtag_must_only_move_a_few(self):
+        ring = sharding.HashRing(range(4))
+        before = ring.assign(self.names[:100])
+        for names in (self.names[:101], self.names[1:100]):
+            after = ring.assign(names)
+            moved = [name for name in names if name in before and before[name] != after[name]]
+            self.assertLess(len(moved), 10)
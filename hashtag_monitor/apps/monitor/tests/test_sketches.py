@@ -0,0 +1,78 @@
+import random
+
+from django.test import SimpleTestCase
+
+from ..sketches import SpaceSaving, BurstDetector
+
+
+class SpaceSavingTests(SimpleTestCase):
+    def test_top_must_find_heavy_hitters_within_capacity(self):
+        rnd = random.Random(42)
+        stream = ['#a'] * 500 + ['#b'] * 300 + [f"#noise{i}" for i in range(1000)]
+        rnd.shuffle(stream)
+        sketch = SpaceSaving(20)
+        for item in stream:
+            sketch.offer(item)
+        self.assertEqual(20, len(sketch))
+        top = sketch.top(2)
+        self.assertEqual(['#a', '#b'], [t[0] for t in top])
+        for item, count, error in top:
+            self.assertLessEqual(count - error, stream.count(item))
+            self.assertGreaterEqual(count, stream.count(item))
+
+    def test_offer_must_count_exactly_below_capacity(self):
+        sketch = SpaceSaving(5)
+        sketch.offer('#a', 3)
+        sketch.offer('#b')
+        sketch.offer('#a')
+        self.assertEqual([('#a', 4, 0), ('#b', 1, 0)], sketch.top(5))
+
+
+class BurstDetectorTests(SimpleTestCase):
+    def feed(self, detector, counts, first_minute=0):
+        events = []
+        for minute, count in enumerate(counts, first_minute):
+            for _ in range(count):
+                event = detector.add('#a', minute)
+                if event:
+                    events.append(event)
+        return events
+
+    def test_steady_rate_must_not_burst(self):
+        rnd = random.Random(1)
+        detector = BurstDetector(warmup=10, min_count=5)
+        self.assertEqual([], self.feed(detector, [rnd.randint(15, 25) for _ in range(200)]))
+
+    def test_spike_must_burst_once(self):
+        detector = BurstDetector(warmup=10, min_count=5)
+        events = self.feed(detector, [5] * 30 + [60, 5])
+        self.assertEqual(1, len(events))
+        self.assertEqual(30, events[0]['minute'])
+        self.assertGreater(events[0]['score'], detector.threshold)
+
+    def test_warmup_must_hide_first_minutes(self):
+        detector = BurstDetector(warmup=10, min_count=5)
+        self.assertEqual([], self.feed(detector, [0] * 5 + [100]))
+
+    def test_late_minutes_must_be_ignored(self):
+        detector = BurstDetector(warmup=0, min_count=1, late_minutes=5)
+        detector.add('#a', 10)
+        self.assertIsNone(detector.add('#a', 3))
+        self.assertEqual({10: 1}, detector.states['#a']['open'])
+        self.assertEqual(10, detector.states['#a']['minute'])
+
+    def test_older_pages_must_count_toward_open_minutes(self):
+        detector = BurstDetector(warmup=10, min_count=5, late_minutes=5)
+        self.feed(detector, [5] * 30)
+        # The newest page lands first, the older one still completes the burst of minute 28.
+        self.assertEqual([], self.feed(detector, [0, 3], first_minute=30))
+        events = self.feed(detector, [55], first_minute=28)
+        self.assertEqual([28], [e['minute'] for e in events])
+        self.assertEqual({26: 5, 27: 5, 28: 60, 29: 5, 31: 3}, detector.states['#a']['open'])
+
+    def test_gaps_must_decay_the_baseline(self):
+        detector = BurstDetector(warmup=0, min_count=1, max_gap=100)
+        self.feed(detector, [10] * 50)
+        before = detector.states['#a']['mean']
+        detector.add('#a', 120)
+        self.assertLess(detector.states['#a']['mean'], before / 100)
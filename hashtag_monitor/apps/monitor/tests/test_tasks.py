@@ -1,17 +1,28 @@
+import asyncio
 import datetime
 import random
+import threading
+import time
 import pytz
 from asyncio import Future
 
 import tweepy
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from mock import Mock, patch, MagicMock
 
 # Create your tests here.
 from ..models import Tweet, User, Hashtag, COLORS_PALETTE
+from .. import breaker
+from .. import events
+from .. import ingest
+from .. import sharding
+from .. import jobs
+from .. import metrics
 from .. import tasks
+from .. import twitter_async
 from .. import twitter_utils as twt_utl
 
 
@@ -21,19 +32,131 @@ async def async_magic():
 MagicMock.__await__ = lambda x: async_magic().__await__()
 
 
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FakeTwitterAPI:
+    def __init__(self):
+        self.searches = []
+
+    def search(self, q, **kwargs):
+        self.searches.append(q)
+        return {'statuses': []}
+
+
 @patch("asgiref.sync.async_to_sync")
 @patch("channels.layers")
-@patch("apscheduler.schedulers.background.BackgroundScheduler.add_job")
+@patch.object(jobs.RUNNER, "submit")
 class TasksTests(TestCase):
+    def setUp(self):
+        # Write pages inline, the writer thread would not see the test transaction.
+        patcher = patch.object(ingest, 'PIPELINE', ingest.IngestPipeline(0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        breaker.clear()
+        self.addCleanup(tasks._watermarks.clear)
+
     @patch("tweepy.API")
-    def test_sync_with_tweeter_must_parallelize(self, tweepy_mock, add_job_mock, *args):
+    def test_sync_with_tweeter_must_parallelize(self, tweepy_mock, submit_mock, *args):
         Hashtag.objects.create(name="#Test")
         Hashtag.objects.create(name="#Test2")
         Hashtag.objects.create(name="#Test3")
         tasks.sync_with_tweeter()
-        self.assertEqual(3, add_job_mock.call_count)
+        self.assertEqual(3, submit_mock.call_count)
+        self.assertEqual({jobs.LIVE}, {c[0][2] for c in submit_mock.call_args_list})
+
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_sync_with_tweeter_must_fetch_each_hashtag_once(self, api_mock, submit_mock, *args):
+        names = [f"#Test{i}" for i in range(10)]
+        for name in names:
+            Hashtag.objects.create(name=name)
+        api_mock.return_value = api = FakeTwitterAPI()
+        tasks.sync_with_tweeter()
+        # The jobs only start once every hashtag was dispatched.
+        for call in submit_mock.call_args_list:
+            call[0][1]()
+        self.assertEqual(sorted(names), sorted(api.searches))
+
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_sync_with_tweeter_must_only_poll_due_hashtags(self, api_mock, submit_mock, *args):
+        metrics.clear()
+        Hashtag.objects.create(name="#Test")
+        Hashtag.objects.create(name="#Test2", next_poll=datetime.datetime.now() + datetime.timedelta(hours=1))
+        api_mock.return_value = api = FakeTwitterAPI()
+        tasks.sync_with_tweeter()
+        for call in submit_mock.call_args_list:
+            call[0][1]()
+        self.assertEqual(["#Test"], api.searches)
+        # Nothing came back, the next poll waits twice as long.
+        hashtag = Hashtag.objects.get(pk="#Test")
+        self.assertIsNotNone(hashtag.next_poll)
+        self.assertGreater(hashtag.poll_interval, settings.TWEETER_SYNC_MINUTES)
+        # The metric names must not grow with the hashtags.
+        self.assertFalse([name for kind in metrics.snapshot().values() for name in kind if "#" in name])
+        self.assertEqual(hashtag.poll_interval, metrics.snapshot()['timers']['poll_interval']['max'])
+
+    def test_sharded_worker_must_only_sync_its_hashtags(self, submit_mock, *args):
+        names = [f"#Test{i}" for i in range(10)]
+        for name in names:
+            Hashtag.objects.create(name=name)
+        self.addCleanup(setattr, sharding, '_shard', None)
+        synced = []
+        for node in range(3):
+            sharding.set_shard(node, range(3))
+            submit_mock.reset_mock()
+            tasks.sync_with_tweeter()
+            synced.extend(c[0][1].args[0] for c in submit_mock.call_args_list)
+        self.assertEqual(sorted(names), sorted(synced))
+
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_polls_must_start_from_the_watermark_of_the_worker(self, api_mock, *args):
+        Hashtag.objects.create(name="#Test")
+        Hashtag.objects.create(name="#Test2")
+        d = pytz.utc.localize(datetime.datetime.utcnow()).strftime("%a %b %d %H:%M:%S %z %Y")
+        user = {'id': 1, 'name': "test", 'screen_name': "stest", 'created_at': d}
+        api_mock.return_value.search.side_effect = lambda since_id=None, max_id=None, **kwargs: {'statuses': [
+            {"id": i, "text": "Test", "created_at": d, 'entities': {'hashtags': []}, "user": user}
+            for i in ([5, 4] if since_id is max_id is None else [])]}
+
+        tasks.get_tweets("#Test")
+        self.assertEqual({"#Test": 5}, tasks._watermarks)
+        with patch.object(Tweet, "get_since_id") as get_since_id_mock:
+            tasks.get_tweets("#Test")
+        self.assertFalse(get_since_id_mock.called)
+        self.assertEqual(5, api_mock.return_value.search.call_args[1]['since_id'])
+
+        # A hashtag handed over to another worker leaves its watermark behind.
+        self.addCleanup(setattr, sharding, '_shard', None)
+        for node in range(2):
+            sharding.set_shard(node, range(2))
+            if not sharding.owns("#Test", ["#Test", "#Test2"]):
+                tasks.sync_with_tweeter()
+        self.assertEqual({}, tasks._watermarks)
+
+    @override_settings(INGEST_WORKER=True)
+    @patch.object(events, "publish")
+    def test_web_process_must_leave_backfills_to_the_ingest_worker(self, publish_mock, submit_mock, *args):
+        tasks.request_backfill("#Test", 500, "populate_#Test")
+        publish_mock.assert_called_once_with('backfill', hashtag_name="#Test", history_length=500,
+                                             job_name="populate_#Test")
+        self.assertFalse(submit_mock.called)
+
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_get_tweets_must_skip_a_hashtag_already_syncing(self, api_mock, *args):
+        Hashtag.objects.create(name="#Test")
+        api_mock.return_value = api = FakeTwitterAPI()
+        with tasks.hashtag_sync("#Test") as acquired:
+            self.assertTrue(acquired)
+            self.assertEqual([], tasks.get_tweets("#Test"))
+        self.assertEqual([], api.searches)
+        tasks.get_tweets("#Test")
+        self.assertEqual(["#Test"], api.searches)
 
-    def test_get_tweets_should_add_new_tweets(self, add_job_mock, channels_mock, aps_send_mock):
+    def test_get_tweets_should_add_new_tweets(self, submit_mock, channels_mock, aps_send_mock):
         d = pytz.utc.localize(datetime.datetime.utcnow())
         new_tweets = {"statuses": [
             {
@@ -57,6 +180,149 @@ class TasksTests(TestCase):
         self.assertEqual(1, User.objects.count())
 
     @patch("tweepy.API")
-    def test_get_remaining_tweets_in_background_should_start_task_in_background(self, tweepy_mock, add_job_mock, *args):
+    def test_get_remaining_tweets_in_background_should_start_task_in_background(self, tweepy_mock, submit_mock, *args):
         tasks.get_remaining_tweets_in_background(None, None, None, None, None)
-        self.assertEqual(1, add_job_mock.call_count)
+        self.assertEqual(1, submit_mock.call_count)
+        self.assertEqual(jobs.BACKFILL, submit_mock.call_args[0][2])
+
+    def test_refresh_retweet_counts_must_look_up_100_ids_per_request(self, *args):
+        h1 = Hashtag.objects.create(name="#Test")
+        author = User.objects.create(id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        for i in range(1, 251):
+            Tweet.objects.create(id=i, author=author, created_at=datetime.datetime.now(), text="a").hashtags.add(h1)
+        api = Mock()
+        api.statuses_lookup.side_effect = lambda ids, **kwargs: [{'id': i, 'retweet_count': 7} for i in ids]
+
+        self.assertEqual(200, tasks.refresh_retweet_counts(twitter_api=api, latest=200))
+        self.assertEqual([100, 100], [len(c[0][0]) for c in api.statuses_lookup.call_args_list])
+        self.assertEqual(200, Tweet.objects.filter(retweet_count=7).count())
+
+    def test_fetch_pages_must_follow_max_id_and_stop_on_known_tweets(self, *args):
+        Hashtag.objects.create(name="#Test")
+        d = pytz.utc.localize(datetime.datetime.utcnow()).strftime("%a %b %d %H:%M:%S %z %Y")
+        user = {'id': 1, 'name': "test", 'screen_name': "stest", 'created_at': d}
+        pages = {None: [5, 4], 3: [3, 2], 1: [2]}
+        api = Mock()
+        api.search.side_effect = lambda max_id=None, **kwargs: {'statuses': [
+            {"id": i, "text": "Test", "created_at": d, 'entities': {'hashtags': []}, "user": user}
+            for i in pages[max_id]]}
+
+        tickets = tasks.fetch_pages(api, "#Test", history_length=500)
+        self.assertEqual([None, 3, 1], [c[1]['max_id'] for c in api.search.call_args_list])
+        self.assertEqual([2, 2, 0], [len(t.new_tweets) for t in tickets])
+        self.assertEqual(3, tickets.requests)
+        self.assertEqual(4, Tweet.objects.count())
+
+    @patch.object(tasks, "run_later")
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_rate_limited_poll_must_be_postponed_and_its_gap_backfilled(self, api_mock, run_later_mock, *args):
+        Hashtag.objects.create(name="#Test")
+        d = pytz.utc.localize(datetime.datetime.utcnow()).strftime("%a %b %d %H:%M:%S %z %Y")
+        user = {'id': 1, 'name': "test", 'screen_name': "stest", 'created_at': d}
+        reset = int(time.time()) + 600
+        response = Mock(status_code=429, headers={'x-rate-limit-reset': str(reset)})
+
+        def search(max_id=None, **kwargs):
+            if max_id is not None:
+                raise tweepy.RateLimitError("Rate limit exceeded", response)
+            return {'statuses': [{"id": i, "text": "Test", "created_at": d, 'entities': {'hashtags': []}, "user": user}
+                                 for i in (5, 4)]}
+        api_mock.return_value.search.side_effect = search
+
+        self.assertEqual([], tasks.get_tweets("#Test"))
+        self.assertEqual(2, Tweet.objects.count())
+        next_poll = Hashtag.objects.get(pk="#Test").next_poll
+        self.assertGreaterEqual(next_poll, datetime.datetime.fromtimestamp(reset))
+        # The pages older than the one written are fetched once the rate limit is over.
+        key, call, priority, retry_at = run_later_mock.call_args[0]
+        self.assertEqual(("gap_#Test_3", jobs.BACKFILL), (key, priority))
+        self.assertEqual(3, call.keywords['max_id'])
+        self.assertGreaterEqual(retry_at, reset)
+
+        # Meanwhile the open circuit fails fast, without calling Twitter.
+        api_mock.return_value.search.reset_mock()
+        call()
+        self.assertEqual(0, api_mock.return_value.search.call_count)
+        self.assertEqual(2, run_later_mock.call_count)
+
+    @patch.object(twt_utl, "get_twitter_api")
+    def test_pages_dropped_by_a_full_queue_must_be_fetched_again(self, api_mock, submit_mock, *args):
+        Hashtag.objects.create(name="#Test")
+        d = pytz.utc.localize(datetime.datetime.utcnow()).strftime("%a %b %d %H:%M:%S %z %Y")
+        user = {'id': 1, 'name': "test", 'screen_name': "stest", 'created_at': d}
+
+        def search(newest):
+            # Pages of 5 statuses from newest down, as Twitter serves them.
+            def page(since_id=None, max_id=None, **kwargs):
+                top = newest if max_id is None else max_id
+                return {'statuses': [{"id": i, "text": "Test", "created_at": d, 'entities': {'hashtags': []},
+                                      "user": user} for i in range(top, max(since_id or 0, top - 5), -1)]}
+            return page
+
+        api_mock.return_value.search.side_effect = search(5)
+        tasks.get_tweets("#Test")
+        self.assertEqual({"#Test": 5}, tasks._watermarks)
+
+        # Nothing drains the queue, the page after the first one written is dropped.
+        full = ingest.IngestPipeline(1, put_timeout=0.01)
+        full.queue.put(None)
+        api_mock.return_value.search.side_effect = search(20)
+        pages = [ingest.PIPELINE.submit, full.submit]
+        with patch.object(full, "start"), \
+                patch.object(ingest.PIPELINE, "submit", side_effect=lambda *a: pages.pop(0)(*a)):
+            tasks.get_tweets("#Test")
+        self.assertEqual(5 + 5, Tweet.objects.count())
+        key, call, priority = submit_mock.call_args[0]
+        self.assertEqual(("gap_#Test_15", jobs.BACKFILL), (key, priority))
+
+        call()
+        self.assertEqual(list(range(1, 21)), sorted(Tweet.objects.values_list('pk', flat=True)))
+
+    @patch.object(tasks, "run_later")
+    def test_failed_backfill_must_be_resumed_later_instead_of_failing(self, run_later_mock, submit_mock, *args):
+        api = Mock()
+        api.search.side_effect = tweepy.TweepError("Failed to send request")
+        tasks.get_remaining_tweets_in_background(api, "#Test", 500, "populate_#Test", max_id=42)
+        submit_mock.call_args[0][1]()
+        key, call, priority, retry_at = run_later_mock.call_args[0]
+        self.assertEqual(("populate_#Test", jobs.BACKFILL), (key, priority))
+        self.assertEqual((42, 500), (call.keywords['max_id'], call.keywords['history_length']))
+        self.assertGreater(retry_at, time.time())
+
+    @override_settings(TWITTER_ASYNC=True)
+    def test_async_poll_must_not_hold_a_job_thread_while_fetching(self, submit_mock, *args):
+        Hashtag.objects.create(name="#Test")
+        release = threading.Event()
+
+        async def fetch_pages(hashtag_name, **kwargs):
+            while not release.is_set():
+                await asyncio.sleep(0.01)
+            return []
+        with patch.object(twitter_async, "fetch_pages", fetch_pages):
+            tasks.sync_with_tweeter()
+            with tasks.hashtag_sync("#Test") as acquired:
+                self.assertFalse(acquired)
+            release.set()
+            self.assertTrue(wait_for(lambda: submit_mock.called))
+        key, call, priority = submit_mock.call_args[0]
+        self.assertEqual(("synced_#Test", jobs.LIVE), (key, priority))
+        call()
+        self.assertIsNotNone(Hashtag.objects.get(pk="#Test").next_poll)
+        with tasks.hashtag_sync("#Test") as acquired:
+            self.assertTrue(acquired)
+
+    @override_settings(TWITTER_ASYNC=True)
+    @patch.object(tasks, "run_later")
+    def test_failed_async_backfill_must_be_resumed_later(self, run_later_mock, submit_mock, *args):
+        async def fetch_pages(hashtag_name, max_id=None, history_length=None, **kwargs):
+            error = breaker.Unavailable('search_tweets', time.time() + 60)
+            error.max_id, error.remaining = 42, 300
+            raise error
+        with patch.object(twitter_async, "fetch_pages", fetch_pages):
+            tasks.get_remaining_tweets_in_background(None, "#Test", 500, "populate_#Test")
+            submit_mock.call_args[0][1]()
+            self.assertTrue(wait_for(lambda: submit_mock.call_count == 2))
+        submit_mock.call_args[0][1]()
+        key, call, priority, retry_at = run_later_mock.call_args[0]
+        self.assertEqual(("populate_#Test", jobs.BACKFILL), (key, priority))
+        self.assertEqual((42, 300), (call.keywords['max_id'], call.keywords['history_length']))
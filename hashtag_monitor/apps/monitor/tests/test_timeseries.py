@@ -0,0 +1,37 @@
+import datetime
+
+from django.test import SimpleTestCase
+
+from .. import timeseries
+
+
+class TimeseriesTests(SimpleTestCase):
+    def test_get_bucket_starts_must_end_with_current_bucket(self):
+        end = datetime.datetime(2020, 1, 10, 12, 7, 30)
+        starts = timeseries.get_bucket_starts('1h', 2, end)
+        self.assertEqual([datetime.datetime(2020, 1, 10, 11), datetime.datetime(2020, 1, 10, 12)], starts)
+
+    def test_get_bucket_starts_must_reject_unknown_buckets(self):
+        with self.assertRaises(ValueError):
+            timeseries.get_bucket_starts('2d', 2)
+        with self.assertRaises(ValueError):
+            timeseries.get_bucket_starts('1d', 0)
+
+    def test_get_labels_must_stay_unique(self):
+        start = datetime.datetime(2020, 1, 1)
+        starts = [start + datetime.timedelta(days=i) for i in range(3)]
+        self.assertEqual(["01/01", "02/01", "03/01"], timeseries.get_labels(starts, '1d'))
+        starts = [start, start.replace(year=2021)]
+        self.assertEqual(["01/01/2020", "01/01/2021"], timeseries.get_labels(starts, '1d'))
+
+    def test_densify_must_sum_rows_into_buckets(self):
+        start = datetime.datetime(2020, 1, 1)
+        starts = [start, start + datetime.timedelta(minutes=5)]
+        rows = [('#a', start + datetime.timedelta(minutes=1), 2),
+                ('#a', start + datetime.timedelta(minutes=4), 3),
+                ('#a', start + datetime.timedelta(minutes=6), 1),
+                ('#b', start + datetime.timedelta(minutes=10), 7),
+                ('#b', start - datetime.timedelta(minutes=1), 7)]
+        dense = timeseries.densify(starts, '5m', rows)
+        self.assertEqual([5, 1], dense['#a'].tolist())
+        self.assertEqual([0, 0], dense['#b'].tolist())
@@ -0,0 +1,72 @@
+import datetime
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ..models import Tweet, Hashtag, _USER_PROFILE_HASHES
+from .. import trends
+from ..twitter_utils import TWITTER_TIME_FORMAT
+
+
+def status(id, *hashtags, minutes_ago=0):
+    created_at = (timezone.now() - datetime.timedelta(minutes=minutes_ago)).strftime(
+        TWITTER_TIME_FORMAT.replace("%z", "+0000"))
+    return {
+        "id": id,
+        "text": "Test",
+        "created_at": created_at,
+        'entities': {'hashtags': [{'text': h} for h in hashtags]},
+        "user": {'id': 1, 'name': "T", 'screen_name': "T", 'created_at': created_at}
+    }
+
+
+class TrendsTests(TransactionTestCase):
+    def setUp(self):
+        _USER_PROFILE_HASHES.clear()
+        trends.clear()
+        self.events = []
+        trends.burst_detected.connect(self.on_burst)
+
+    def tearDown(self):
+        trends.burst_detected.disconnect(self.on_burst)
+        trends.clear()
+
+    def on_burst(self, sender, event, **kwargs):
+        self.events.append(event)
+
+    def test_create_from_json_must_count_unmonitored_co_hashtags(self):
+        h = Hashtag.objects.create(name="#Test")
+        Tweet.create_from_json(h.name, status(1, "Test", "Other", "Python"), status(2, "other"))
+        Tweet.create_from_json(h.name, status(2, "other"))
+        self.assertEqual({h.name: [["#other", 2], ["#python", 1]]}, trends.get_co_hashtags())
+
+    def test_burst_must_be_sent_for_committed_tweets(self):
+        h = Hashtag.objects.create(name="#Test")
+        detector = trends.DETECTOR
+        trends.DETECTOR = trends.BurstDetector(warmup=0, min_count=3)
+        try:
+            Tweet.create_from_json(h.name, *[status(i) for i in range(5)])
+        finally:
+            trends.DETECTOR = detector
+        self.assertEqual(1, len(self.events))
+        self.assertEqual(h.name, self.events[0]['hashtag'])
+        self.assertEqual(4, self.events[0]['count'])
+
+    def test_older_page_of_a_poll_must_still_count(self):
+        h = Hashtag.objects.create(name="#Test")
+        detector = trends.DETECTOR
+        trends.DETECTOR = trends.BurstDetector(warmup=0, min_count=3)
+        try:
+            # Pages are written newest first, each in its own transaction.
+            Tweet.create_from_json(h.name, *[status(i) for i in range(10, 12)])
+            Tweet.create_from_json(h.name, *[status(i, minutes_ago=2) for i in range(5)])
+        finally:
+            trends.DETECTOR = detector
+        self.assertEqual(1, len(self.events))
+        self.assertEqual(4, self.events[0]['count'])
+
+    def test_deleted_hashtag_must_be_forgotten(self):
+        h = Hashtag.objects.create(name="#Test")
+        Tweet.create_from_json(h.name, status(1, "Other"))
+        h.delete()
+        self.assertEqual({}, trends.get_co_hashtags())
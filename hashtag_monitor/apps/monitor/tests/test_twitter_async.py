@@ -0,0 +1,202 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import breaker
+from .. import ingest
+from .. import twitter_async
+
+
+class FakeTwitterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, content, headers=None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(('POST', self.path, self.headers['Authorization']))
+        self.send_json(200, {'token_type': 'bearer', 'access_token': 'app-token'})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.requests.append(('GET', url.path, self.headers['Authorization'], params))
+        if self.server.failing:
+            self.server.failing -= 1
+            self.send_json(503, {'errors': [{'code': 130, 'message': "Over capacity"}]})
+            return
+        if self.server.limited:
+            self.server.limited -= 1
+            self.send_json(429, {'errors': []}, {'x-rate-limit-remaining': '0',
+                                                 'x-rate-limit-reset': str(int(time.time()) + 1)})
+            return
+        time.sleep(self.server.latency)
+        # Pages of 2 statuses from id 10 down, following max_id.
+        top = int(params.get('max_id', 10))
+        ids = [i for i in (top, top - 1) if i > int(params.get('since_id', 0))]
+        self.send_json(200, {'statuses': [{'id': i} for i in ids]},
+                       {'x-rate-limit-remaining': '100', 'x-rate-limit-reset': str(int(time.time()) + 900)})
+
+
+class FakeTwitter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeTwitterHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.limited = 0
+        self.failing = 0
+        self.latency = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handle_error(self, request, client_address):
+        # Cancelled requests close their connection before the answer is written.
+        pass
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakePipeline:
+    def __init__(self, new_tweets=True):
+        self.pages = []
+        self.new_tweets = new_tweets
+
+    def submit(self, hashtag_name, statuses):
+        self.pages.append([s['id'] for s in statuses])
+        ticket = ingest.Ticket(hashtag_name, statuses)
+        ticket.finish(statuses if self.new_tweets else [])
+        return ticket
+
+
+class AsyncTwitterClientTests(SimpleTestCase):
+    def setUp(self):
+        breaker.clear()
+        self.server = FakeTwitter()
+        self.addCleanup(self.server.stop)
+
+    def run_async(self, coroutine_function):
+        async def run():
+            client = twitter_async.AsyncTwitterClient(self.server.url, consumer_key="key",
+                                                      consumer_secret="secret", limit=2)
+            try:
+                return await coroutine_function(client)
+            finally:
+                client.close()
+        return asyncio.run(run())
+
+    def test_search_must_reuse_connections_and_token(self):
+        async def search_five_times(client):
+            return [await client.search("#Test", max_id=10 - i) for i in range(5)]
+
+        pages = self.run_async(search_five_times)
+        self.assertEqual([[10, 9], [9, 8], [8, 7], [7, 6], [6, 5]], [[s['id'] for s in p['statuses']] for p in pages])
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(('POST', '/oauth2/token', 'Basic a2V5OnNlY3JldA=='), self.server.requests[0])
+        self.assertEqual({'Bearer app-token'}, {r[2] for r in self.server.requests[1:]})
+        self.assertEqual('#Test', self.server.requests[1][3]['q'])
+
+    def test_fetch_pages_must_paginate_with_max_id(self):
+        pipeline = FakePipeline()
+        tickets = self.run_async(lambda client: twitter_async.fetch_pages(
+            "#Test", since_id=4, client=client, pipeline=pipeline))
+        self.assertEqual([[10, 9], [8, 7], [6, 5]], pipeline.pages)
+        self.assertEqual(3, len(tickets))
+
+    def test_fetch_pages_must_stop_on_known_tweets_and_history_length(self):
+        pipeline = FakePipeline(new_tweets=False)
+        self.run_async(lambda client: twitter_async.fetch_pages("#Test", client=client, pipeline=pipeline))
+        self.assertEqual([[10, 9]], pipeline.pages)
+
+        pipeline = FakePipeline()
+        self.run_async(lambda client: twitter_async.fetch_pages(
+            "#Test", history_length=150, client=client, pipeline=pipeline))
+        self.assertEqual([[10, 9], [8, 7]], pipeline.pages)
+
+    def test_rate_limited_request_must_wait_for_reset(self):
+        self.server.limited = 1
+        page = self.run_async(lambda client: client.search("#Test"))
+        self.assertEqual([10, 9], [s['id'] for s in page['statuses']])
+        # The token, the rate limited search and the search after the reset.
+        self.assertEqual(3, len(self.server.requests))
+
+    @override_settings(TWITTER_BREAKER_THRESHOLD=2)
+    def test_failures_must_open_the_circuit(self):
+        self.server.failing = 2
+
+        async def search_three_times(client):
+            errors = []
+            for _ in range(3):
+                try:
+                    await client.search("#Test")
+                except breaker.Unavailable as e:
+                    errors.append(e)
+            return errors
+
+        self.assertEqual(3, len(self.run_async(search_three_times)))
+        # The token and the two failed searches, the third one failed fast.
+        self.assertEqual(3, len(self.server.requests))
+        self.assertTrue(breaker.get_breaker('search_tweets').is_open)
+
+    def test_unavailable_fetch_must_tell_where_to_resume(self):
+        self.server.failing = 1
+        pipeline = FakePipeline()
+        with self.assertRaises(breaker.Unavailable) as cm:
+            self.run_async(lambda client: twitter_async.fetch_pages(
+                "#Test", max_id=7, history_length=150, client=client, pipeline=pipeline))
+        self.assertEqual((7, 150), (cm.exception.max_id, cm.exception.remaining))
+
+    def test_concurrent_syncs_must_share_bounded_connections(self):
+        self.server.latency = 0.05
+        pipeline = FakePipeline()
+
+        async def sync_many(client):
+            await asyncio.gather(*(twitter_async.fetch_pages(f"#Test{i}", since_id=8, client=client,
+                                                             pipeline=pipeline) for i in range(20)))
+
+        start = time.time()
+        self.run_async(sync_many)
+        self.assertEqual(20, len(pipeline.pages))
+        self.assertLessEqual(self.server.connections, 2)
+        # 40 searches on 2 connections, well below one after the other.
+        self.assertLess(time.time() - start, 40 * 0.05)
+
+
+class EventLoopThreadTests(SimpleTestCase):
+    def test_run_must_execute_on_the_loop_thread(self):
+        loop_thread = twitter_async.EventLoopThread()
+        self.addCleanup(loop_thread.stop)
+
+        async def name():
+            return threading.current_thread().name
+
+        self.assertEqual('twitter-async', loop_thread.run(name()).result(5))
@@ -0,0 +1,83 @@
+import datetime
+import random
+
+from django.test import SimpleTestCase
+
+from .. import twitter_utils as twt_utl
+
+
+def reference(twitter_time):
+    return datetime.datetime.strptime(twitter_time, twt_utl.TWITTER_TIME_FORMAT)
+
+
+def random_twitter_time(rnd):
+    d = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=rnd.randrange(0, 2 ** 32))
+    offset = rnd.choice([0, 0, 0, rnd.randrange(-23 * 60, 23 * 60)])
+    tz = datetime.timezone(datetime.timedelta(minutes=offset))
+    return d.replace(tzinfo=tz).strftime(twt_utl.TWITTER_TIME_FORMAT)
+
+
+def mutate(rnd, twitter_time):
+    i = rnd.randrange(len(twitter_time))
+    c = rnd.choice("0123456789 :+-aZx9١")
+    return twitter_time[:i] + c + twitter_time[i + 1:]
+
+
+class ConvertToDatetimeTests(SimpleTestCase):
+    def assertEquivalent(self, twitter_time):
+        try:
+            expected = reference(twitter_time)
+        except ValueError:
+            with self.assertRaises(ValueError):
+                twt_utl.convert_to_datetime(twitter_time)
+        else:
+            converted = twt_utl.convert_to_datetime(twitter_time)
+            self.assertEqual(expected, converted)
+            self.assertEqual(expected.utcoffset(), converted.utcoffset())
+
+    def test_convert_to_datetime(self):
+        d = twt_utl.convert_to_datetime("Wed Oct 10 20:19:24 +0000 2018")
+        self.assertEqual(datetime.datetime(2018, 10, 10, 20, 19, 24,
+                                           tzinfo=datetime.timezone.utc), d)
+
+    def test_must_be_equivalent_to_strptime(self):
+        rnd = random.Random(42)
+        for _ in range(5000):
+            self.assertEquivalent(random_twitter_time(rnd))
+
+    def test_must_be_equivalent_to_strptime_on_malformed_input(self):
+        rnd = random.Random(7)
+        for _ in range(5000):
+            self.assertEquivalent(mutate(rnd, random_twitter_time(rnd)))
+        for t in ["", "Wed Oct 10 20:19:24 +0000", "wed oct 10 20:19:24 +0000 2018",
+                  "Wed Oct 10 24:19:24 +0000 2018", "Wed Feb 30 20:19:24 +0000 2018",
+                  "Wed Oct 10 20:19:24 +0099 2018", "Wed Oct 10 20:19:24 Z 2018"]:
+            self.assertEquivalent(t)
+
+    def test_many_must_be_equivalent_to_strptime_on_malformed_input(self):
+        rnd = random.Random(3)
+        for _ in range(2000):
+            times = [random_twitter_time(rnd) for _ in range(3)]
+            times[1] = mutate(rnd, times[1])
+            try:
+                expected = [reference(t) for t in times]
+            except ValueError:
+                with self.assertRaises(ValueError):
+                    twt_utl.convert_many_to_datetime(times)
+            else:
+                self.assertEqual(expected, twt_utl.convert_many_to_datetime(times))
+
+    def test_cached_and_many_must_match_single(self):
+        rnd = random.Random(1)
+        times = [random_twitter_time(rnd) for _ in range(50)] * 2
+        expected = [twt_utl.convert_to_datetime(t) for t in times]
+        self.assertEqual(expected, twt_utl.convert_many_to_datetime(times))
+        self.assertEqual(expected, [twt_utl.convert_to_datetime_cached(t) for t in times])
+
+    def test_statuses_must_be_converted_with_the_ones_they_embed(self):
+        quoted = {'created_at': "Wed Oct 10 20:19:24 +0000 2018"}
+        retweeted = {'created_at': "Thu Oct 11 20:19:24 +0000 2018", 'quoted_status': quoted}
+        statuses = [{'created_at': "Fri Oct 12 20:19:24 +0000 2018", 'retweeted_status': retweeted},
+                    {'created_at': twt_utl.convert_to_datetime("Sat Oct 13 20:19:24 +0000 2018")}]
+        twt_utl.convert_statuses(statuses)
+        self.assertEqual([12, 11, 10, 13], [s['created_at'].day for s in twt_utl.iter_statuses(statuses)])
@@ -1,12 +1,146 @@
 import datetime
+import gzip
+import json
 import random
+import threading
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
 # Create your tests here.
 from ..models import Tweet, User, Hashtag, COLORS_PALETTE
+from .. import livestore
+from .. import metrics
+
 
 class ViewsTests(TestCase):
-    pass
\ No newline at end of file
+    def setUp(self):
+        cache.clear()
+        livestore.STORE.clear()
+
+    def create_tweets(self):
+        h1 = Hashtag.objects.create(name="#Test")
+        h2 = Hashtag.objects.create(name="#Test2")
+        a1 = User.objects.create(
+            id=1, name="T", screen_name="T", created_at=datetime.datetime.now())
+        t1 = Tweet.objects.create(id=1,
+                                  author=a1,
+                                  created_at=datetime.datetime(2019, 12, 20, 10),
+                                  text="a")
+        t2 = Tweet.objects.create(id=2,
+                                  author=a1,
+                                  created_at=datetime.datetime(2019, 12, 22, 10),
+                                  text="b")
+        t3 = Tweet.objects.create(id=3,
+                                  author=a1,
+                                  created_at=datetime.datetime(2019, 12, 22, 11),
+                                  text="c")
+        t1.hashtags.add(h1)
+        t2.hashtags.add(h1)
+        t3.hashtags.add(h2)
+        return h1, h2
+
+    def export(self, name, **params):
+        url = reverse('monitor:hashtag_export', args=[name])
+        return self.client.get(url, params)
+
+    def test_export_must_stream_ndjson(self):
+        h1, _ = self.create_tweets()
+        response = self.export(h1.name)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([1, 2], [json.loads(l)['id'] for l in lines])
+
+    def test_export_must_filter_by_date_range(self):
+        h1, _ = self.create_tweets()
+        response = self.export(h1.name, since="2019-12-21", until="2019-12-22")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([2], [json.loads(l)['id'] for l in lines])
+
+    def test_export_csv_with_gzip(self):
+        h1, _ = self.create_tweets()
+        response = self.export(h1.name, format="csv", gzip="1")
+        self.assertEqual('application/gzip', response['Content-Type'])
+        lines = gzip.decompress(
+            b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].startswith("id,created_at"))
+
+    def test_export_invalid_format_must_return_bad_request(self):
+        h1, _ = self.create_tweets()
+        self.assertEqual(400, self.export(h1.name, format="xml").status_code)
+        self.assertEqual(400, self.export(h1.name, since="yesterday").status_code)
+
+    def test_export_unknown_hashtag_must_return_not_found(self):
+        self.assertEqual(404, self.export("#Unknown").status_code)
+
+    def test_leaderboards_must_return_top_authors_and_tweets(self):
+        h1, _ = self.create_tweets()
+        Tweet.objects.filter(pk=2).update(retweet_count=5)
+        response = self.client.get(reverse('monitor:hashtag_leaderboards', args=[h1.name]))
+        self.assertEqual(200, response.status_code)
+        content = response.json()
+        self.assertEqual([[1, 2]], [[a['id'], a['tweets']] for a in content['authors']])
+        self.assertEqual([2, 1], [t['id'] for t in content['tweets']])
+        self.assertEqual(404, self.client.get(reverse('monitor:hashtag_leaderboards', args=["#Unknown"])).status_code)
+
+    def test_metrics_must_return_snapshot(self):
+        metrics.clear()
+        metrics.increment('db_connections_opened')
+        staff = get_user_model().objects.create_user("staff", password="secret", is_staff=True)
+        self.client.force_login(staff)
+        content = self.client.get(reverse('monitor:metrics')).json()
+        self.assertEqual(1, content['counters']['db_connections_opened'])
+        self.assertIn('timers', content)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_must_be_restricted_to_staff_and_token(self):
+        self.assertEqual(403, self.client.get(reverse('monitor:metrics')).status_code)
+        self.assertEqual(403, self.client.get(reverse('monitor:metrics'), HTTP_AUTHORIZATION="Bearer wrong").status_code)
+        self.assertEqual(200, self.client.get(reverse('monitor:metrics'), HTTP_AUTHORIZATION="Bearer secret").status_code)
+        self.client.force_login(get_user_model().objects.create_user("user", password="secret"))
+        self.assertEqual(403, self.client.get(reverse('monitor:metrics')).status_code)
+
+    def test_index_must_return_etag(self):
+        response = self.client.get(reverse('monitor:index'))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_requests_must_not_start_the_scheduler(self):
+        self.client.get(reverse('monitor:index'))
+        self.assertNotIn('APScheduler', [t.name for t in threading.enumerate()])
+
+    def test_index_must_return_not_modified_for_same_version(self):
+        etag = self.client.get(reverse('monitor:index'))['ETag']
+        response = self.client.get(reverse('monitor:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+    @override_settings(INDEX_SHELL_FIRST=False)
+    def test_index_must_not_query_between_syncs(self):
+        self.create_tweets()
+        self.client.get(reverse('monitor:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('monitor:index'))
+        self.assertContains(response, "#Test2")
+
+    @override_settings(INDEX_SHELL_FIRST=False)
+    def test_index_must_change_etag_when_data_changes(self):
+        etag = self.client.get(reverse('monitor:index'))['ETag']
+        self.create_tweets()
+        response = self.client.get(reverse('monitor:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertContains(response, "#Test2")
+
+    @override_settings(INDEX_SHELL_FIRST=True)
+    def test_shell_index_must_not_query_data(self):
+        self.create_tweets()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('monitor:index'))
+        self.assertNotContains(response, "#Test2")
+        self.assertContains(response, 'id="tweets_per_day_chart"')
@@ -0,0 +1,83 @@
+import datetime
+
+import numpy as np
+from django.db.models.functions import TruncMinute, TruncHour, TruncDay
+from django.utils import timezone
+
+
+# Bucket size -> (step, SQL truncation). 5m buckets are grouped per minute in
+# SQL and folded into their bucket when densifying.
+BUCKETS = {
+    '1m': (datetime.timedelta(minutes=1), TruncMinute),
+    '5m': (datetime.timedelta(minutes=5), TruncMinute),
+    '1h': (datetime.timedelta(hours=1), TruncHour),
+    '1d': (datetime.timedelta(days=1), TruncDay),
+}
+
+LABEL_FORMATS = {
+    '1m': ("%H:%M", "%d/%m %H:%M"),
+    '5m': ("%H:%M", "%d/%m %H:%M"),
+    '1h': ("%d/%m %Hh", "%d/%m/%Y %Hh"),
+    '1d': ("%d/%m", "%d/%m/%Y"),
+}
+
+
+def naive_utc(value):
+    # Timestamps are stored without time zone (USE_TZ = False) and in UTC.
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def floor_time(value, bucket):
+    step = BUCKETS[bucket][0]
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=value.tzinfo)
+    return value - (value - epoch) % step
+
+
+def get_bucket_starts(bucket, periods, end=None):
+    """Returns the starts of the `periods` buckets up to the one holding `end` (now by default)."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket size '{bucket}', expected one of {', '.join(BUCKETS)}.")
+    if periods < 1:
+        raise ValueError("At least one period is required.")
+    step = BUCKETS[bucket][0]
+    last = floor_time(end or timezone.now(), bucket)
+    return [last - step * i for i in range(periods - 1, -1, -1)]
+
+
+def get_labels(starts, bucket):
+    short, long = LABEL_FORMATS[bucket]
+    labels = [s.strftime(short) for s in starts]
+    if len(set(labels)) < len(labels):
+        labels = [s.strftime(long) for s in starts]
+    return labels
+
+
+def densify(starts, bucket, rows):
+    """Sums (key, time, count) rows into one zero-filled array per key, aligned on starts."""
+    step = BUCKETS[bucket][0]
+    rows = list(rows)
+    if not rows:
+        return {}
+    keys, times, counts = zip(*rows)
+    edges = np.array(starts + [starts[-1] + step], dtype='datetime64[us]')
+    positions = np.searchsorted(edges, np.array(times, dtype='datetime64[us]'), side='right') - 1
+    in_range = (positions >= 0) & (positions < len(starts))
+
+    names, key_idx = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    dense = np.zeros((len(names), len(starts)), dtype=np.int64)
+    np.add.at(dense, (key_idx[in_range], positions[in_range]),
+              np.array(counts, dtype=np.int64)[in_range])
+    return dict(zip(names.tolist(), dense))
+
+
+def to_chart(hashtags, starts, bucket, counts):
+    labels = get_labels(starts, bucket)
+    empty = np.zeros(len(starts), dtype=np.int64)
+    return {
+        h.name: {
+            "color": h.color,
+            "values": dict(zip(labels, counts.get(h.name, empty).tolist())),
+        } for h in hashtags
+    }
@@ -0,0 +1,55 @@
+import datetime
+import threading
+
+from django.conf import settings
+from django.dispatch import Signal
+
+from . import livestore
+from .sketches import BurstDetector, SpaceSaving
+
+
+burst_detected = Signal(providing_args=['event'])
+
+_lock = threading.Lock()
+DETECTOR = BurstDetector(threshold=settings.BURST_THRESHOLD, min_count=settings.BURST_MIN_TWEETS,
+                         late_minutes=settings.BURST_LATE_MINUTES)
+CO_HASHTAGS = {}
+
+
+def record(rows, co_hashtags=()):
+    """Feeds committed (hashtag, created_at, tweets, ...) rows and (hashtag, other hashtag[, count]) pairs."""
+    events = []
+    with _lock:
+        for name, created_at, tweets, *_ in sorted(rows, key=lambda r: livestore.to_minute(r[1])):
+            event = DETECTOR.add(name, livestore.to_minute(created_at), tweets)
+            if event:
+                events.append(event)
+        for name, other, *count in co_hashtags:
+            sketch = CO_HASHTAGS.get(name)
+            if sketch is None:
+                sketch = CO_HASHTAGS[name] = SpaceSaving(settings.CO_HASHTAGS_CAPACITY)
+            sketch.offer(other, *count)
+
+    for event in events:
+        event['hashtag'] = event.pop('key')
+        event['minute'] = (livestore.EPOCH + datetime.timedelta(minutes=event['minute'])).isoformat()
+        burst_detected.send(sender=None, event=event)
+    return events
+
+
+def get_co_hashtags(top=5):
+    with _lock:
+        return {name: [[other, count] for other, count, _ in sketch.top(top)]
+                for name, sketch in CO_HASHTAGS.items()}
+
+
+def forget(hashtag_name):
+    with _lock:
+        DETECTOR.reset(hashtag_name)
+        CO_HASHTAGS.pop(hashtag_name, None)
+
+
+def clear():
+    with _lock:
+        DETECTOR.reset()
+        CO_HASHTAGS.clear()
@@ -0,0 +1,296 @@
+import asyncio
+import base64
+import json
+import ssl
+import threading
+import time
+from urllib.parse import quote, urlencode, urlsplit
+
+import tweepy
+from django.conf import settings
+
+from . import breaker
+from . import ingest
+from . import metrics
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response, returns (status, headers, body, keep alive)."""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("Connection closed by the server.")
+    version, status = line.decode('latin-1').split(' ', 2)[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    delimited = True
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append((await reader.readexactly(size + 2))[:-2])
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body, delimited = await reader.read(), False
+    keep_alive = delimited and version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    return int(status), headers, body, keep_alive
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections, at most `limit` open per host."""
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.idle = {}
+        self.slots = {}
+        self.opened = 0
+
+    async def _open(self, scheme, host, port):
+        context = ssl.create_default_context() if scheme == 'https' else None
+        self.opened += 1
+        metrics.increment('twitter_connections_opened')
+        return await asyncio.open_connection(host, port, ssl=context)
+
+    async def request(self, method, url, headers=None, body=b''):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        head = {'Host': parts.netloc, 'Connection': 'keep-alive', 'Content-Length': str(len(body))}
+        head.update(headers or {})
+        request = (f"{method} {path} HTTP/1.1\r\n"
+                   + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode('latin-1') + body
+
+        if key not in self.slots:
+            self.slots[key] = asyncio.Semaphore(self.limit)
+        async with self.slots[key]:
+            idle = self.idle.setdefault(key, [])
+            while True:
+                reused = bool(idle)
+                reader, writer = idle.pop() if reused else await self._open(*key)
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    status, response_headers, response, keep_alive = await read_response(reader)
+                except asyncio.CancelledError:
+                    writer.close()
+                    raise
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    # The server may close an idle connection at any time, try again on a new one.
+                    if reused:
+                        continue
+                    raise
+                if keep_alive:
+                    idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, response_headers, response
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle = {}
+
+
+class RateLimits:
+    """Requests left per endpoint, from the x-rate-limit headers and the requests in flight."""
+
+    def __init__(self, default_wait=60):
+        self.default_wait = default_wait
+        self.limits = {}
+
+    async def acquire(self, endpoint):
+        while True:
+            remaining, reset = self.limits.get(endpoint, (None, 0))
+            if remaining is None or remaining > 0:
+                if remaining is not None:
+                    self.limits[endpoint] = (remaining - 1, reset)
+                return
+            delay = reset - time.time()
+            if delay <= 0:
+                self.limits.pop(endpoint, None)
+                return
+            metrics.increment('twitter_rate_limited')
+            await asyncio.sleep(delay)
+
+    def update(self, endpoint, status, headers):
+        if 'x-rate-limit-remaining' in headers:
+            self.limits[endpoint] = (int(headers['x-rate-limit-remaining']),
+                                     int(headers.get('x-rate-limit-reset', 0)))
+        if status == 429 and self.limits.get(endpoint, (0, 0))[1] <= time.time():
+            self.limits[endpoint] = (0, time.time() + self.default_wait)
+
+
+class AsyncTwitterClient:
+    """Application-only client of the search endpoint sharing one connection pool."""
+
+    def __init__(self, base_url, bearer_token=None, consumer_key=None, consumer_secret=None, limit=10):
+        self.base_url = base_url.rstrip('/')
+        self.bearer_token = bearer_token
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.pool = ConnectionPool(limit)
+        self.rate_limits = RateLimits()
+        self.token_lock = asyncio.Lock()
+
+    async def get_bearer_token(self):
+        async with self.token_lock:
+            if self.bearer_token is None:
+                credentials = f"{quote(self.consumer_key or '')}:{quote(self.consumer_secret or '')}"
+                status, _, body = await self.pool.request(
+                    'POST', f"{self.base_url}/oauth2/token",
+                    headers={'Authorization': f"Basic {base64.b64encode(credentials.encode()).decode()}",
+                             'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8'},
+                    body=b'grant_type=client_credentials')
+                if status != 200:
+                    raise tweepy.TweepError(f"Twitter refused the application credentials ({status}).")
+                self.bearer_token = json.loads(body)['access_token']
+            return self.bearer_token
+
+    async def get(self, endpoint, **params):
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        url = f"{self.base_url}/1.1/{endpoint}.json?{query}"
+        # Rate limits are waited for on the loop, the breaker only sees failures.
+        circuit = breaker.get_breaker(endpoint.replace('/', '_'))
+        circuit.before_call()
+        try:
+            while True:
+                await self.rate_limits.acquire(endpoint)
+                token = await self.get_bearer_token()
+                with metrics.timer('twitter_request'):
+                    status, headers, body = await self.pool.request('GET', url, {'Authorization': f"Bearer {token}"})
+                self.rate_limits.update(endpoint, status, headers)
+                if status != 429:
+                    break
+        except tweepy.TweepError as e:
+            raise circuit.failure(e) from e
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise circuit.failure(tweepy.TweepError(f"Failed to send request: {e}")) from e
+        except BaseException:
+            circuit.cancel()
+            raise
+        if status >= 400:
+            raise circuit.failure(tweepy.TweepError(f"Twitter answered {status} on {endpoint}: {body[:200]!r}",
+                                                    api_code=status))
+        circuit.success()
+        return json.loads(body)
+
+    async def search(self, q, count=100, since_id=None, max_id=None, result_type='recent'):
+        return await self.get('search/tweets', q=q, count=count, since_id=since_id,
+                              max_id=max_id, result_type=result_type)
+
+    def close(self):
+        self.pool.close()
+
+
+def wait_ticket(ticket):
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+    ticket.add_done_callback(lambda t: loop.call_soon_threadsafe(
+        lambda: future.done() or future.set_result(t)))
+    return future
+
+
+async def fetch_pages(hashtag_name, since_id=None, max_id=None, history_length=None, client=None, pipeline=None):
+    """Same as tasks.fetch_pages, but the next page is requested while the current one is handed over."""
+    client = client or get_client()
+    pipeline = pipeline or ingest.PIPELINE
+    loop = asyncio.get_event_loop()
+
+    def request_page(max_id, remaining):
+        count = 100 if remaining is None else min(remaining, 100)
+        return asyncio.ensure_future(client.search(hashtag_name, count=count, since_id=since_id, max_id=max_id))
+
+    tickets, remaining = ingest.Pages(), history_length
+    backfill = max_id is not None or history_length is not None
+    request = request_page(max_id, remaining) if remaining is None or remaining > 0 else None
+    while request is not None:
+        try:
+            statuses = (await request)['statuses']
+        except breaker.Unavailable as e:
+            for ticket in tickets:
+                await wait_ticket(ticket)
+            e.max_id, e.remaining = max_id, remaining
+            raise
+        tickets.requests += 1
+        if backfill:
+            metrics.mark('backfill_searches')
+        if not statuses:
+            break
+        if remaining is not None:
+            remaining -= 100
+        request = None
+        if remaining is None or remaining > 0:
+            max_id = min(s['id'] for s in statuses) - 1
+            request = request_page(max_id, remaining)
+        # Submitting blocks while the ingest queue is full, keep the loop free meanwhile.
+        tickets.append(await loop.run_in_executor(None, pipeline.submit, hashtag_name, statuses))
+        if any(t.done and (t.error or t.dropped or not t.new_tweets) for t in tickets):
+            if request is not None:
+                request.cancel()
+            break
+    for ticket in tickets:
+        await wait_ticket(ticket)
+    return tickets
+
+
+class EventLoopThread:
+    """A private event loop running in a daemon thread, started on first use."""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='twitter-async', daemon=True)
+                self.thread.start()
+        return self.loop
+
+    def run(self, coroutine):
+        """Schedules the coroutine on the loop, returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def stop(self):
+        with self.lock:
+            loop, thread, self.loop, self.thread = self.loop, self.thread, None, None
+        if thread is not None:
+            client = _clients.pop(loop, None)
+            if client is not None:
+                loop.call_soon_threadsafe(client.close)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+LOOP = EventLoopThread()
+_clients = {}
+
+
+def get_client():
+    # Connections and locks belong to the loop they were created in.
+    loop = asyncio.get_event_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncTwitterClient(settings.TWITTER_API_URL,
+                                                     bearer_token=settings.TWITTER_BEARER_TOKEN,
+                                                     consumer_key=settings.TWITTER_CONSUMER_KEY,
+                                                     consumer_secret=settings.TWITTER_CONSUMER_SECRET,
+                                                     limit=settings.TWITTER_CONNECTIONS)
+    return client
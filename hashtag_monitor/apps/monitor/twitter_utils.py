@@ -1,16 +1,151 @@
 import datetime
+import functools
 
-import tweepy
+import numpy as np
 from django.conf import settings
 
 
+TWITTER_TIME_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+_WEEKDAYS = frozenset(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+_MONTHS = {m: i for i, m in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                       'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+_TIMEZONES = {}
+
+# Column layout of "Wed Oct 10 20:19:24 +0000 2018" for the vectorized parser.
+_SPACE_COLUMNS = [3, 7, 10, 19, 25]
+_COLON_COLUMNS = [13, 16]
+_DIGIT_COLUMNS = [8, 9, 11, 12, 14, 15, 17, 18, 21, 22, 23, 24, 26, 27, 28, 29]
+
+
+def _code(name):
+    b = name.encode()
+    return b[0] << 16 | b[1] << 8 | b[2]
+
+
+_WEEKDAY_CODES = np.array([_code(d) for d in _WEEKDAYS], dtype=np.int64)
+_MONTH_CODES = np.array(sorted(_code(m) for m in _MONTHS), dtype=np.int64)
+_MONTH_NUMBERS = np.array([_MONTHS[m] for m in sorted(_MONTHS, key=_code)], dtype=np.int64)
+
 
 def get_twitter_api():
+    # tweepy and its HTTP stack are only loaded by the processes talking to Twitter.
+    import tweepy
     auth = tweepy.OAuthHandler(
         settings.TWITTER_CONSUMER_KEY, settings.TWITTER_CONSUMER_SECRET)
     auth.set_access_token(settings.TWITTER_ACCESS_TOKEN,
                           settings.TWITTER_ACCESS_TOKEN_SECRET)
-    return tweepy.API(auth, wait_on_rate_limit=True, parser=tweepy.parsers.JSONParser())
+    # Rate limits are left to the breaker, which reschedules instead of sleeping in a worker.
+    return tweepy.API(auth, parser=tweepy.parsers.JSONParser())
+
+
+def _get_timezone(minutes):
+    tz = _TIMEZONES.get(minutes)
+    if tz is None:
+        tz = datetime.timezone(datetime.timedelta(minutes=minutes))
+        _TIMEZONES[minutes] = tz
+    return tz
+
+
+def _parse_twitter_time(twitter_time):
+    # Twitter always sends "Wed Oct 10 20:19:24 +0000 2018", so slice the fields
+    # directly and leave anything unusual to strptime.
+    if (len(twitter_time) != 30
+            or twitter_time[3] != ' ' or twitter_time[7] != ' ' or twitter_time[10] != ' '
+            or twitter_time[13] != ':' or twitter_time[16] != ':'
+            or twitter_time[19] != ' ' or twitter_time[25] != ' '
+            or twitter_time[:3] not in _WEEKDAYS
+            or twitter_time[20] not in '+-' or twitter_time[23] not in '012345'):
+        return None
+    digits = (twitter_time[8:10] + twitter_time[11:13] + twitter_time[14:16]
+              + twitter_time[17:19] + twitter_time[21:25] + twitter_time[26:30])
+    month = _MONTHS.get(twitter_time[4:7])
+    if month is None or not digits.isdecimal() or not digits.isascii():
+        return None
+    offset = int(twitter_time[21:23]) * 60 + int(twitter_time[23:25])
+    if twitter_time[20] == '-':
+        offset = -offset
+    try:
+        return datetime.datetime(int(twitter_time[26:30]),
+                                 month,
+                                 int(twitter_time[8:10]),
+                                 int(twitter_time[11:13]),
+                                 int(twitter_time[14:16]),
+                                 int(twitter_time[17:19]),
+                                 tzinfo=_get_timezone(offset))
+    except ValueError:
+        return None
+
 
 def convert_to_datetime(twitter_time):
-    return datetime.datetime.strptime(twitter_time, "%a %b %d %H:%M:%S %z %Y")
\ No newline at end of file
+    parsed = _parse_twitter_time(twitter_time)
+    if parsed is None:
+        parsed = datetime.datetime.strptime(twitter_time, TWITTER_TIME_FORMAT)
+    return parsed
+
+
+@functools.lru_cache(maxsize=4096)
+def convert_to_datetime_cached(twitter_time):
+    # Users show up on every status they publish, so their created_at repeats a lot.
+    return convert_to_datetime(twitter_time)
+
+
+def convert_many_to_datetime(twitter_times):
+    """Parses a whole page of timestamps at once, column by column."""
+    twitter_times = list(twitter_times)
+    joined = "".join(twitter_times)
+    if not twitter_times or not joined.isascii() or any(len(t) != 30 for t in twitter_times):
+        return [convert_to_datetime(t) for t in twitter_times]
+
+    chars = np.frombuffer(joined.encode('ascii'), dtype=np.uint8).reshape(-1, 30).astype(np.int64)
+    digits = chars[:, _DIGIT_COLUMNS] - ord('0')
+    weekdays = chars[:, 0] << 16 | chars[:, 1] << 8 | chars[:, 2]
+    months = chars[:, 4] << 16 | chars[:, 5] << 8 | chars[:, 6]
+    month_idx = np.searchsorted(_MONTH_CODES, months).clip(max=len(_MONTH_CODES) - 1)
+    valid = ((chars[:, _SPACE_COLUMNS] == ord(' ')).all(axis=1)
+             & (chars[:, _COLON_COLUMNS] == ord(':')).all(axis=1)
+             & ((digits >= 0) & (digits <= 9)).all(axis=1)
+             & ((chars[:, 20] == ord('+')) | (chars[:, 20] == ord('-')))
+             & (digits[:, 10] <= 5)
+             & np.isin(weekdays, _WEEKDAY_CODES)
+             & (_MONTH_CODES[month_idx] == months))
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    hour = digits[:, 2] * 10 + digits[:, 3]
+    minute = digits[:, 4] * 10 + digits[:, 5]
+    second = digits[:, 6] * 10 + digits[:, 7]
+    offset = (digits[:, 8] * 10 + digits[:, 9]) * 60 + digits[:, 10] * 10 + digits[:, 11]
+    offset = np.where(chars[:, 20] == ord('-'), -offset, offset)
+    year = digits[:, 12] * 1000 + digits[:, 13] * 100 + digits[:, 14] * 10 + digits[:, 15]
+
+    parsed = []
+    for row in zip(twitter_times, valid.tolist(), year.tolist(), _MONTH_NUMBERS[month_idx].tolist(),
+                   day.tolist(), hour.tolist(), minute.tolist(), second.tolist(), offset.tolist()):
+        if row[1]:
+            try:
+                parsed.append(datetime.datetime(*row[2:8], tzinfo=_get_timezone(row[8])))
+                continue
+            except ValueError:
+                pass
+        parsed.append(convert_to_datetime(row[0]))
+    return parsed
+
+
+def iter_statuses(statuses):
+    """Yields statuses followed by the retweeted and quoted statuses they embed."""
+    for status in statuses:
+        yield status
+        nested = [status[key] for key in ('retweeted_status', 'quoted_status') if status.get(key)]
+        yield from iter_statuses(nested)
+
+
+def convert_statuses(statuses):
+    """Replaces the created_at strings of statuses, embedded ones included, by datetimes.
+
+    The statuses are updated in place, their timestamps parsed at once with
+    convert_many_to_datetime. Those already converted are left as they are.
+    """
+    pending = [s for s in iter_statuses(statuses) if isinstance(s['created_at'], str)]
+    for status, created_at in zip(pending, convert_many_to_datetime(s['created_at'] for s in pending)):
+        status['created_at'] = created_at
+    return statuses
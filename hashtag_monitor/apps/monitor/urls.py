@@ -6,5 +6,8 @@ app_name = 'monitor'
 urlpatterns = [
     path("", views.index, name='index'),
     path("hashtag/delete/<str:name>", views.hashtag_delete, name='hashtag_delete'),
-    path("hashtag/create", views.hashtag_create, name='hashtag_create')
+    path("hashtag/create", views.hashtag_create, name='hashtag_create'),
+    path("hashtag/export/<str:name>", views.hashtag_export, name='hashtag_export'),
+    path("hashtag/leaderboards/<str:name>", views.hashtag_leaderboards, name='hashtag_leaderboards'),
+    path("metrics", views.metrics_view, name='metrics')
 ]
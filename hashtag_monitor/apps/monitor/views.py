@@ -1,52 +1,38 @@
-from datetime import datetime, timedelta, date
-import re
-import json
+import hmac
 
-import tweepy
-from django.db.models import Sum, Count
 from django.shortcuts import render
-from django.template import loader
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import redirect, get_object_or_404
+from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.db import transaction
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models.functions import TruncDay
+from django.views.decorators.http import condition
 
 from . import forms
-from . import twitter_utils as twt_utl
-from . import tasks
+from . import dashboard
+from . import data_version
+from . import exporters
+from . import metrics
 from . import models
-from . import serializers
 
 
-def get_default_context(request, **extra_context):
-    summary = models.Tweet.get_summary()
-
-    tweets = models.Tweet.get_latest_tweets(
-        count=settings.LATEST_TWEETS_NB)
-    tweet_serializer = serializers.TweetSerializer(tweets, many=True)
+def get_dashboard_context():
+    if settings.INDEX_SHELL_FIRST:
+        # The page only ships the layout, the socket delivers the data on connect.
+        return {'shell': True}
 
-    hashtags = models.Hashtag.get_hashtags_sorted()
-    hashtag_serializer = serializers.HashtagSerializer(hashtags, many=True)
-
-    hashtag_form = forms.HashtagForm()
+    payload = dashboard.get_payload()
+    return {
+        'hashtag_list': payload['hashtags'],
+        'tweet_list': payload['tweets'],
+        'summary': payload['summary'],
+        'tweets_per_hashtag': payload['tweets_per_hashtag'],
+        'tweets_per_lang': payload['tweets_per_lang']
+    }
 
-    tweets_per_hashtag = models.Hashtag.get_tweets_count_per_hashtag()
-    tweets_per_day = models.Tweet.get_hashtag_tweets_per_day(num_days=7)
-    tweets_per_lang = models.Tweet.get_tweets_per_lang()
 
-    context = {
-        'hashtag_list': hashtag_serializer.data,
-        'tweet_list': tweet_serializer.data,
-        'summary': summary,
-        'hashtag_form': hashtag_form,
-        'tweets_per_hashtag': tweets_per_hashtag,
-        'tweets_per_day': tweets_per_hashtag,
-        'tweets_per_lang': tweets_per_lang
-    }
+def get_default_context(request, **extra_context):
+    context = dict(get_dashboard_context())
+    context['hashtag_form'] = forms.HashtagForm()
 
     for k, v in extra_context.items():
         context[k] = v
@@ -54,26 +40,31 @@ def get_default_context(request, **extra_context):
     return context
 
 
+def get_index_etag(request):
+    return str(data_version.get_data_version())
+
+
 def hashtag_delete(request, name):
     deleted = models.Hashtag.delete_if_exists(name)
     if deleted:
-        tasks.run_in_background(
-            tasks.remove_trash_and_sync, "remove_trash_from_view")
+        from . import tasks
+        tasks.request_remove_trash()
     return HttpResponseRedirect(reverse('monitor:index'))
 
 
 def hashtag_create(request):
+    # The jobs and the Twitter client are loaded on the first hashtag created, not on startup.
+    import tweepy
+    from . import tasks
     context, err = {}, None
     if request.method == 'POST':
         form = forms.HashtagForm(request.POST or None)
         if form.is_valid():
             hashtag = form.save()
-            twitter_api = twt_utl.get_twitter_api()
             try:
-                tasks.get_remaining_tweets_in_background(twitter_api=twitter_api,
-                                                         hashtag_name=hashtag.name,
-                                                         history_length=500,
-                                                         job_name=f"populate_{hashtag.name}")
+                tasks.request_backfill(hashtag_name=hashtag.name,
+                                       history_length=500,
+                                       job_name=f"populate_{hashtag.name}")
             except tweepy.RateLimitError:
                 err = "We reached the Twitter's rate limit. Wait a few minutes and retry..."
             except tweepy.TweepError:
@@ -88,6 +79,51 @@ def hashtag_create(request):
     return render(request, "monitor/index.html", context)
 
 
+def hashtag_export(request, name):
+    hashtag = get_object_or_404(models.Hashtag, pk=name)
+    fmt = request.GET.get('format', 'ndjson')
+    compress = request.GET.get('gzip', '') in ('1', 'true')
+    if fmt not in exporters.ENCODERS:
+        return HttpResponseBadRequest(f"Unknown export format '{fmt}'.")
+    try:
+        since, until = exporters.parse_date_range(request.GET.get('since'),
+                                                  request.GET.get('until'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    rows = models.Tweet.iter_for_export(hashtag.name,
+                                        fields=exporters.EXPORT_FIELDS,
+                                        since=since,
+                                        until=until,
+                                        chunk_size=settings.EXPORT_CHUNK_SIZE)
+    content = exporters.export_tweets(rows,
+                                      fmt=fmt,
+                                      compress=compress,
+                                      chunk_size=settings.EXPORT_CHUNK_SIZE)
+    filename = f"{hashtag.name.lstrip('#')}.{exporters.FILE_EXTENSIONS[fmt]}"
+    if compress:
+        response = StreamingHttpResponse(content, content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(content, content_type=exporters.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def hashtag_leaderboards(request, name):
+    hashtag = get_object_or_404(models.Hashtag, pk=name)
+    return JsonResponse(dashboard.get_leaderboards(hashtag.name)[hashtag.name])
+
+
+def metrics_view(request):
+    token = request.META.get('HTTP_AUTHORIZATION', "")
+    allowed = bool(settings.METRICS_TOKEN) and hmac.compare_digest(token, f"Bearer {settings.METRICS_TOKEN}")
+    if not (allowed or request.user.is_staff):
+        return HttpResponseForbidden()
+    return JsonResponse(metrics.snapshot())
+
+
+@condition(etag_func=get_index_etag)
 def index(request, hashtag_form=None):
    # old_selected_hashtag = request.session.get('selected_hashtag', None)
     context = get_default_context(request)
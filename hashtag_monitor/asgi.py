@@ -8,6 +8,7 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
 import os
+import threading
 
 import django
 from channels.routing import get_default_application
@@ -15,3 +16,7 @@ from channels.routing import get_default_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hashtag_monitor.settings')
 django.setup()
 application = get_default_application()
+
+# Start polling Twitter without delaying daphne's boot.
+from hashtag_monitor.apps.monitor.apps import start_scheduler  # noqa: E402
+threading.Thread(target=start_scheduler, name='scheduler-start', daemon=True).start()
@@ -27,13 +27,52 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 LATEST_TWEETS_NB = 100
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE") or 2000)
+PAGE_CACHE_TIMEOUT = int(os.environ.get("PAGE_CACHE_TIMEOUT") or 60 * 60)
+INDEX_SHELL_FIRST = (os.environ.get("INDEX_SHELL_FIRST") or "true").lower() == "true"
 CLEAN_TRASH_FROM_DB_EVERY = int(os.environ.get("CLEAN_TRASH_FROM_DB_EVERY") or 30)
+ROLLUP_TWEETS_EVERY = int(os.environ.get("ROLLUP_TWEETS_EVERY") or 1)
+TWEETS_CHART_BUCKET = os.environ.get("TWEETS_CHART_BUCKET") or '1d'
+TWEETS_CHART_PERIODS = int(os.environ.get("TWEETS_CHART_PERIODS") or 7)
+LIVE_STORE_MINUTES = int(os.environ.get("LIVE_STORE_MINUTES") or 7 * 24 * 60)
+BURST_THRESHOLD = float(os.environ.get("BURST_THRESHOLD") or 4)
+BURST_MIN_TWEETS = int(os.environ.get("BURST_MIN_TWEETS") or 10)
+BURST_LATE_MINUTES = int(os.environ.get("BURST_LATE_MINUTES") or 10)
+CO_HASHTAGS_CAPACITY = int(os.environ.get("CO_HASHTAGS_CAPACITY") or 100)
+REACH_MODE = os.environ.get("REACH_MODE") or 'sketch'
+REACH_SKETCH_SIZE = int(os.environ.get("REACH_SKETCH_SIZE") or 1024)
+LEADERBOARD_SIZE = int(os.environ.get("LEADERBOARD_SIZE") or 10)
+REFRESH_RETWEETS_LATEST = int(os.environ.get("REFRESH_RETWEETS_LATEST") or 0)
+REFRESH_RETWEETS_EVERY = int(os.environ.get("REFRESH_RETWEETS_EVERY") or 30)
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE") or 60)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE") or 5)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS") or 4)
+INGEST_QUEUE_PAGES = int(os.environ.get("INGEST_QUEUE_PAGES") or 16)
+INGEST_BATCH_STATUSES = int(os.environ.get("INGEST_BATCH_STATUSES") or 500)
+INGEST_PUT_TIMEOUT = int(os.environ.get("INGEST_PUT_TIMEOUT") or 60)
+START_SCHEDULER = (os.environ.get("START_SCHEDULER") or "false").lower() == "true"
+INGEST_WORKER = (os.environ.get("INGEST_WORKER") or "false").lower() == "true"
+INGEST_PROCESSES = int(os.environ.get("INGEST_PROCESSES") or 1)
+EVENTS_DATABASE_URL = os.environ.get("EVENTS_DATABASE_URL")
+# Pool mode of the pgbouncer the database is reached through, "session" when connecting directly.
+DATABASE_POOL_MODE = os.environ.get("PGBOUNCER_POOL_MODE") or "session"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 TWEETER_SYNC_GROUP_NAME = 'tweeter_sync'
 TWEETER_SYNC_MINUTES = int(os.environ.get("TWEETER_SYNC_MINUTES") or 30)
+POLL_MIN_MINUTES = int(os.environ.get("POLL_MIN_MINUTES") or 1)
+POLL_MAX_MINUTES = int(os.environ.get("POLL_MAX_MINUTES") or 240)
+SEARCH_REQUESTS_PER_MINUTE = float(os.environ.get("SEARCH_REQUESTS_PER_MINUTE") or 12)
 TWITTER_CONSUMER_KEY = os.environ.get("TWITTER_CONSUMER_KEY")
 TWITTER_CONSUMER_SECRET = os.environ.get("TWITTER_CONSUMER_SECRET")
 TWITTER_ACCESS_TOKEN = os.environ.get("TWITTER_ACCESS_TOKEN")
 TWITTER_ACCESS_TOKEN_SECRET = os.environ.get("TWITTER_ACCESS_TOKEN_SECRET")
+TWITTER_ASYNC = (os.environ.get("TWITTER_ASYNC") or "false").lower() == "true"
+TWITTER_API_URL = os.environ.get("TWITTER_API_URL") or "https://api.twitter.com"
+TWITTER_BEARER_TOKEN = os.environ.get("TWITTER_BEARER_TOKEN")
+TWITTER_CONNECTIONS = int(os.environ.get("TWITTER_CONNECTIONS") or 10)
+TWITTER_BREAKER_THRESHOLD = int(os.environ.get("TWITTER_BREAKER_THRESHOLD") or 5)
+TWITTER_BACKOFF_SECONDS = float(os.environ.get("TWITTER_BACKOFF_SECONDS") or 5)
+TWITTER_BACKOFF_MAX_SECONDS = float(os.environ.get("TWITTER_BACKOFF_MAX_SECONDS") or 900)
 
 CHANNEL_LAYERS = {
     'default': {
@@ -98,6 +137,7 @@ DATABASES = {
         'PASSWORD': os.environ.get("DB_PASSWORD"),
         'HOST': os.environ.get("DB_HOST"),
         'PORT': os.environ.get("DB_PORT"),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
     }
 }
 